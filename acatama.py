@@ -26,6 +26,7 @@ from qgis.PyQt.QtWidgets import QAction, QMessageBox
 from qgis.PyQt.QtGui import QIcon
 
 from AcATaMa.core.accuracy_assessment import AccuracyAssessmentDialog
+from AcATaMa.core.classification import Classification
 from AcATaMa.gui.acatama_dockwidget import AcATaMaDockWidget
 from AcATaMa.gui.about_dialog import AboutDialog
 from AcATaMa.gui.classification_dialog import ClassificationDialog
@@ -149,6 +150,7 @@ class AcATaMa(object):
             self.dockwidget.accuracy_assessment_dialog.closing()
             self.dockwidget.accuracy_assessment_dialog.reject(is_ok_to_close=True)
 
+        self.detach_stores(release_claims=False)
         self.removes_temporary_files()
 
         # disconnects
@@ -170,6 +172,7 @@ class AcATaMa(object):
     def unload(self):
         """Removes the plugin menu item and icon from QGIS GUI."""
         print("** UNLOAD AcATaMa")
+        self.detach_stores()
         self.removes_temporary_files()
         # Remove the plugin menu item and icon
         self.iface.removePluginMenu(self.menu_name_plugin, self.dockable_action)
@@ -192,6 +195,13 @@ class AcATaMa(object):
         from qgis.utils import plugins
         plugins["AcATaMa"].run()
 
+    def detach_stores(self, release_claims=True):
+        """Close the shared stores of all classifications, the samples claimed are released
+        only if release_claims, else they keep claimed until their lease expires
+        """
+        for classification in Classification.instances.values():
+            classification.detach_store(release_claims=release_claims)
+
     def removes_temporary_files(self):
         if not self.dockwidget:
             return
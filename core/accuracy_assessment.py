@@ -19,70 +19,184 @@
  ***************************************************************************/
 """
 import os
+import math
+import configparser
+import multiprocessing
+import threading
+import warnings
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from qgis.PyQt import uic
 from qgis.PyQt.QtWidgets import QApplication, QDialogButtonBox, QDialog, QFileDialog
-from qgis.core import Qgis, QgsUnitTypes
+from qgis.core import Qgis, QgsUnitTypes, QgsRasterLayer, QgsTask, QgsApplication, QgsPointXY
 from qgis.utils import iface
 
 from AcATaMa.core.raster import Raster
 from AcATaMa.core.classification import Classification
 from AcATaMa.gui import accuracy_assessment_results
-from AcATaMa.utils.qgis_utils import get_file_path_of_layer
+from AcATaMa.utils.others_utils import get_pixel_count_crosstab_parallel, get_pixel_count_in_file, \
+    get_pixel_values
+from AcATaMa.utils.qgis_utils import get_file_path_of_layer, transform_coordinates
 from AcATaMa.utils.system_utils import wait_process
 
 
 class AccuracyAssessment(object):
 
-    def __init__(self, classification):
-        from AcATaMa.gui.acatama_dockwidget import AcATaMaDockWidget as AcATaMa
+    def __init__(self, classification, ThematicR=None):
+        """
+        Args:
+            classification (Classification): the classification with the samples
+            ThematicR (Raster): the thematic raster, default the thematic raster selected in the plugin
+        """
+        if ThematicR is None:
+            from AcATaMa.gui.acatama_dockwidget import AcATaMaDockWidget as AcATaMa
+            ThematicR = Raster(file_selected_combo_box=AcATaMa.dockwidget.QCBox_ThematicRaster,
+                               band=int(AcATaMa.dockwidget.QCBox_band_ThematicRaster.currentText())
+                                   if AcATaMa.dockwidget.QCBox_band_ThematicRaster.currentText() else None,
+                               nodata=int(AcATaMa.dockwidget.nodata_ThematicRaster.value()))
 
         self.classification = classification
-        self.ThematicR = Raster(file_selected_combo_box=AcATaMa.dockwidget.QCBox_ThematicRaster,
-                                band=int(AcATaMa.dockwidget.QCBox_band_ThematicRaster.currentText())
-                                    if AcATaMa.dockwidget.QCBox_band_ThematicRaster.currentText() else None,
-                                nodata=int(AcATaMa.dockwidget.nodata_ThematicRaster.value()))
+        self.ThematicR = ThematicR
+        # the pixels count of each thematic class, saved in the yaml config with the identity
+        # of the thematic raster for don't re-read the raster while it doesn't change
         self.thematic_pixels_count = {}
+        self.thematic_raster_id = None
         # dialog settings
         self.area_unit = None
         self.z_score = 1.96
         self.csv_separator = ";"
         self.csv_decimal = "."
+        # number of resamples for the bootstrap confidence intervals, 0 for disable it (default),
+        # bootstrap_params are the arguments of the bootstrap for the last results computed
+        self.bootstrap_resamples = 0
+        self.bootstrap = None
+        self.bootstrap_params = None
+        # the strata of the sampling when they are not the thematic classes, set from the
+        # categorical raster of a stratified random sampling config file (ini)
+        self.sampling_config = None
+        self.StrataR = None
+        self.strata_values = None
+        self._strata_key = None
         # define the base area unit based on the thematic raster distance unit
-        thematic_layer = AcATaMa.dockwidget.QCBox_ThematicRaster.currentLayer()
-        layer_dist_unit = thematic_layer.crs().mapUnits()
+        layer_dist_unit = self.ThematicR.qgs_layer.crs().mapUnits()
         self.base_area_unit = QgsUnitTypes.distanceToAreaUnit(layer_dist_unit)
 
-    @wait_process
-    def compute(self):
-        from AcATaMa.gui.acatama_dockwidget import AcATaMaDockWidget as AcATaMa
-        AcATaMa.dockwidget.QPBtn_ComputeViewAccurasyAssessment.setText("Processing, please wait ...")
-        QApplication.processEvents()
+    def restore_config(self, config):
+        """Restore the settings of the accuracy assessment saved in the yaml config"""
+        area_unit, success = QgsUnitTypes.stringToAreaUnit(config["area_unit"])
+        if success:
+            self.area_unit = area_unit
+        self.z_score = config["z_score"]
+        self.csv_separator = config["csv_separator"]
+        self.csv_decimal = config["csv_decimal"]
+        self.bootstrap_resamples = config.get("bootstrap_resamples", self.bootstrap_resamples)
+        sampling_config = config.get("sampling_config")
+        if sampling_config and os.path.isfile(sampling_config):
+            self.set_strata_from_sampling_config(sampling_config)
+        # the pixels count saved is valid only for the same thematic raster, unchanged
+        thematic_pixels_count = config.get("thematic_pixels_count")
+        if thematic_pixels_count and thematic_pixels_count["thematic_raster"] is not None and \
+                thematic_pixels_count["thematic_raster"] == self.get_thematic_raster_id():
+            self.thematic_raster_id = thematic_pixels_count["thematic_raster"]
+            self.thematic_pixels_count = {int(value): int(count)
+                                          for value, count in thematic_pixels_count["counts"].items()}
+
+    def get_thematic_raster_id(self):
+        """Identity of the thematic raster file for the pixels count, if the file changes
+        (or other band is used) the pixels count must be computed again
+
+        Returns:
+            dict: {"path", "size", "mtime", "band"}, None if the layer is not a file
+        """
+        file_path = self.ThematicR.file_path
+        if file_path is None or not os.path.isfile(file_path):
+            return None
+        return {"path": file_path, "size": os.path.getsize(file_path), "mtime": os.path.getmtime(file_path),
+                "band": self.ThematicR.band}
+
+    def get_thematic_pixels_count_config(self):
+        """The pixels count of the thematic classes with the thematic raster identity,
+        for save it in the yaml config"""
+        if self.thematic_raster_id is None:
+            return None
+        return {"thematic_raster": self.thematic_raster_id,
+                "counts": {int(value): int(count) for value, count in self.thematic_pixels_count.items()
+                           if count is not None}}
+
+    def set_strata_from_sampling_config(self, file_path):
+        """Use the categorical raster of a stratified random sampling config file (ini) as the
+        strata for the estimators, None for use the thematic classes as strata (default)
+        """
+        self.sampling_config = None
+        self.StrataR = None
+        self.strata_values = None
+        if file_path is None:
+            return
 
+        config = configparser.RawConfigParser()
+        config.read(file_path)
+        if not config.has_section('categorical raster') or \
+                config.get('categorical raster', 'categorical_raster') == 'None':
+            raise Exception("The sampling config file is not of a stratified random sampling")
+        strata_file = config.get('categorical raster', 'categorical_raster')
+        if not os.path.isfile(strata_file):
+            raise Exception("The categorical raster of the sampling config doesn't exist: {}".format(strata_file))
+        strata_nodata = config.get('categorical raster', 'categorical_raster_nodata')
+
+        self.StrataR = Raster(layer=QgsRasterLayer(strata_file, os.path.basename(strata_file), "gdal"),
+                              band=int(config.get('categorical raster', 'categorical_raster_band')),
+                              nodata=int(float(strata_nodata)) if strata_nodata != 'None' else None)
+        self.sampling_config = file_path
+
+    def get_strata_values(self):
+        """Get the stratum of all samples in one batch, cached by the strata raster
+
+        Returns:
+            dict: {shape_id: stratum}, None for the samples outside the strata raster or in nodata
+        """
+        key = (self.StrataR.file_path, os.path.getmtime(self.StrataR.file_path), self.StrataR.band, self.StrataR.nodata)
+        if self.strata_values is None or self._strata_key != key:
+            points = self.classification.points
+            strata_values = self.StrataR.get_pixel_values_from_pnts(
+                [point.QgsPnt for point in points], crs=self.classification.sampling_layer.crs())
+            self.strata_values = {point.shape_id: int(value) if value is not None and value != self.StrataR.nodata
+                                  else None for point, value in zip(points, strata_values)}
+            self._strata_key = key
+        return self.strata_values
+
+    def compute(self, bootstrap=True):
+        """Compute the accuracy assessment results
+
+        Args:
+            bootstrap (bool): compute the bootstrap confidence intervals (if they are enabled)
+                here, else only take them if they are cached, for compute them in background
+                with BootstrapTask
+        """
         # get labels from classification buttons
         labels = {}
         for button_config in self.classification.buttons_config.values():
             labels[button_config["thematic_class"]] = button_config["name"]
 
-        # get the classified and thematic map values
-        thematic_map_values = []
-        classified_values = []
+        # get the error matrix counts of the classified samples against the thematic map values,
+        # updated incrementally in the classification on each change
+        confusion_counts = self.classification.get_confusion_counts(self.ThematicR)
+        thematic_values = self.classification.get_thematic_values(self.ThematicR)
+        # classified value made/checked by user with classification buttons
+        classified_values = {classif_id: int(button_config["thematic_class"])
+                             for classif_id, button_config in self.classification.buttons_config.items()}
         samples_outside_the_thematic = []
-        classification_points = [point for point in self.classification.points if point.is_classified]
-        points_ordered = sorted(classification_points, key=lambda p: p.shape_id)
-        for point in points_ordered:
-            # classification from the pixel values in the thematic map
-            thematic_map_value = self.ThematicR.get_pixel_value_from_pnt(point.QgsPnt)
-            if not thematic_map_value:
-                samples_outside_the_thematic.append(point)
-                continue
-            thematic_map_values.append(int(thematic_map_value))
-            # classified value made/checked by user with classification buttons
-            classified_value = self.classification.buttons_config[point.classif_id]["thematic_class"]
-            classified_values.append(int(classified_value))
+        if any(thematic_value is None for thematic_value, _ in confusion_counts):
+            samples_outside_the_thematic = sorted(
+                [point for point in self.classification.points if point.is_classified and
+                 thematic_values[point.shape_id] is None], key=lambda p: p.shape_id)
+        confusion_counts = [(thematic_value, classified_values[classif_id], count)
+                            for (thematic_value, classif_id), count in confusion_counts.items()
+                            if thematic_value is not None]
 
         # all unique and sorted values
-        values = sorted(set(thematic_map_values + classified_values))
+        values = sorted(set([t for t, _, _ in confusion_counts] + [c for _, c, _ in confusion_counts]))
         # Construct a value->index dictionary
         indices = dict((val, i) for (i, val) in enumerate(values))
 
@@ -96,15 +210,52 @@ class AccuracyAssessment(object):
         #   m | L3 |    |    |    |    |
         #   a | L4 |    |    |    |    |
         #
-        error_matrix = [[0 for column in values] for row in values]
-        for thematic, classified in zip(thematic_map_values, classified_values):
-            error_matrix[indices[thematic]][indices[classified]] += 1
+        error_matrix = np.zeros((len(values), len(values)), dtype=np.int64)
+        for thematic, classified, count in confusion_counts:
+            error_matrix[indices[thematic], indices[classified]] += count
 
         # calculate the total number of pixel in the thematic raster
         # by each thematic raster class used in the classification buttons
-        for thematic_map_value in values:
-            if thematic_map_value not in self.thematic_pixels_count:
-                self.thematic_pixels_count[thematic_map_value] = self.ThematicR.get_total_pixels_by_value(thematic_map_value)
+        if self.StrataR is None:
+            thematic_raster_id = self.get_thematic_raster_id()
+            if thematic_raster_id != self.thematic_raster_id:
+                self.thematic_pixels_count = {}
+                self.thematic_raster_id = thematic_raster_id
+            for thematic_map_value in values:
+                if thematic_map_value not in self.thematic_pixels_count:
+                    self.thematic_pixels_count[thematic_map_value] = self.ThematicR.get_total_pixels_by_value(thematic_map_value)
+            thematic_pixels_count = [self.thematic_pixels_count[v] for v in values]
+            self.strata = self.samples_outside_the_strata = self.strata_without_samples = None
+        else:
+            # the pixels of each stratum and of each thematic class inside the strata, in one pass
+            crosstab = get_pixel_count_crosstab_parallel(
+                self.ThematicR.file_path, self.ThematicR.band, self.ThematicR.nodata,
+                self.StrataR.file_path, self.StrataR.band, self.StrataR.nodata)
+            strata_values = self.get_strata_values()
+            samples = [point for point in self.classification.points if point.is_classified and
+                       thematic_values[point.shape_id] is not None]
+            self.samples_outside_the_strata = sorted(
+                [point for point in samples if strata_values[point.shape_id] is None], key=lambda p: p.shape_id)
+            samples = [point for point in samples if strata_values[point.shape_id] is not None]
+            self.strata = sorted(set([stratum for _, stratum in crosstab] +
+                                     [strata_values[point.shape_id] for point in samples]))
+            strata_indices = dict((stratum, i) for (i, stratum) in enumerate(self.strata))
+
+            strata_pixels_count = np.zeros(len(self.strata), dtype=np.int64)
+            thematic_pixels_count = np.zeros(len(values), dtype=np.int64)
+            for (thematic_value, stratum), count in crosstab.items():
+                strata_pixels_count[strata_indices[stratum]] += count
+                if thematic_value in indices:
+                    thematic_pixels_count[indices[thematic_value]] += count
+            samples_in_strata = np.zeros((len(self.strata), len(values), len(values)), dtype=np.int64)
+            for point in samples:
+                samples_in_strata[strata_indices[strata_values[point.shape_id]],
+                                  indices[thematic_values[point.shape_id]],
+                                  indices[classified_values[point.classif_id]]] += 1
+            # the strata with pixels but without samples classified, it can't be estimated
+            self.strata_without_samples = [stratum for idx, stratum in enumerate(self.strata)
+                                           if strata_pixels_count[idx] > 0 and samples_in_strata[idx].sum() == 0]
+            error_matrix = samples_in_strata.sum(axis=0)
 
         # values necessary for results
         self.values = values
@@ -115,6 +266,416 @@ class AccuracyAssessment(object):
         self.pixel_area_base = self.ThematicR.qgs_layer.rasterUnitsPerPixelX() * self.ThematicR.qgs_layer.rasterUnitsPerPixelY()
         self.pixel_area_value = self.pixel_area_base * QgsUnitTypes.fromUnitToUnitFactor(self.base_area_unit, self.area_unit)
         self.pixel_area_unit = QgsUnitTypes.toAbbreviatedString(self.area_unit)
+        # compute all estimators once for the results
+        if self.StrataR is None:
+            self.results = AccuracyAssessmentResults(error_matrix, thematic_pixels_count,
+                                                     self.pixel_area_value, self.z_score)
+        else:
+            self.results = StratifiedAccuracyAssessmentResults(error_matrix, samples_in_strata, strata_pixels_count,
+                                                               thematic_pixels_count, self.pixel_area_value, self.z_score)
+        # bootstrap confidence intervals with the same confidence level of the z score
+        self.bootstrap = None
+        self.bootstrap_params = None
+        if self.bootstrap_resamples and error_matrix.sum() > 0:
+            self.bootstrap_params = dict(
+                error_matrix=error_matrix, thematic_pixels_count=list(thematic_pixels_count),
+                pixel_area_value=self.pixel_area_value, resamples=self.bootstrap_resamples,
+                confidence=math.erf(self.z_score / math.sqrt(2)))
+            if self.StrataR is not None:
+                self.bootstrap_params.update(samples_in_strata=samples_in_strata,
+                                             strata_pixels_count=list(strata_pixels_count))
+            if bootstrap:
+                self.bootstrap = BootstrapConfidenceIntervals(**self.bootstrap_params)
+            else:
+                self.bootstrap = BootstrapConfidenceIntervals.from_cache(**self.bootstrap_params)
+
+
+def compute_batch(classification, thematic_rasters, settings=None, max_workers=None):
+    """Accuracy assessment of several thematic rasters (e.g. a time series of maps) against
+    the same samples classified. The layers, their styles and crs are used only in the
+    calling thread, the workers only read the raster files by path (the samples lookup
+    with batched reads and the pixels count by chunks of rows), in parallel threads, then
+    the estimators are computed with the values read
+
+    Args:
+        classification (Classification): the classification with the samples classified
+        thematic_rasters (list): the thematic rasters as Raster
+        settings (AccuracyAssessment): copy the settings (area unit, z score, bootstrap,
+            strata) of this accuracy assessment, default the settings by default
+        max_workers (int): number of threads, default the cpu count
+
+    Returns:
+        list: the AccuracyAssessment computed for each thematic raster
+    """
+    accuracy_assessments = []
+    read_args = []
+    points = [point.QgsPnt for point in classification.points]
+    xs = np.fromiter((point.x() for point in points), dtype=np.float64, count=len(points))
+    ys = np.fromiter((point.y() for point in points), dtype=np.float64, count=len(points))
+    sampling_crs = classification.sampling_layer.crs()
+    for ThematicR in thematic_rasters:
+        accuracy_assessment = AccuracyAssessment(classification, ThematicR=ThematicR)
+        if settings is not None:
+            for attr in ("area_unit", "z_score", "csv_separator", "csv_decimal", "bootstrap_resamples"):
+                setattr(accuracy_assessment, attr, getattr(settings, attr))
+            if settings.sampling_config:
+                accuracy_assessment.set_strata_from_sampling_config(settings.sampling_config)
+        if accuracy_assessment.area_unit is None:
+            accuracy_assessment.area_unit = accuracy_assessment.base_area_unit
+        accuracy_assessments.append(accuracy_assessment)
+        # the samples in the crs of the raster and the classes of its style
+        if sampling_crs != ThematicR.qgs_layer.crs():
+            raster_xs, raster_ys = transform_coordinates(xs, ys, sampling_crs, ThematicR.qgs_layer.crs())
+            raster_points = [QgsPointXY(x, y) for x, y in zip(raster_xs.tolist(), raster_ys.tolist())]
+        else:
+            raster_points = points
+        read_args.append((ThematicR, raster_points, get_pixel_values(ThematicR.qgs_layer, ThematicR.band) or None,
+                          accuracy_assessment.StrataR))
+
+    def read_raster(args):
+        ThematicR, raster_points, pixel_values, StrataR = args
+        thematic_values = ThematicR.get_pixel_values_from_pnts(raster_points)
+        if StrataR is None:
+            pixel_counts = get_pixel_count_in_file(ThematicR.file_path, ThematicR.band, pixel_values,
+                                                   ThematicR.nodata)
+        else:
+            # cached for the accuracy assessment
+            get_pixel_count_crosstab_parallel(ThematicR.file_path, ThematicR.band, ThematicR.nodata,
+                                              StrataR.file_path, StrataR.band, StrataR.nodata)
+            pixel_counts = None
+        return thematic_values, pixel_counts
+
+    with ThreadPoolExecutor(max_workers=max_workers or multiprocessing.cpu_count()) as executor:
+        results = list(executor.map(read_raster, read_args))
+
+    for accuracy_assessment, (thematic_values, pixel_counts) in zip(accuracy_assessments, results):
+        classification.set_thematic_values(accuracy_assessment.ThematicR, thematic_values)
+        if pixel_counts is not None:
+            accuracy_assessment.ThematicR.pixel_counts_by_value = pixel_counts
+        accuracy_assessment.compute()
+    return accuracy_assessments
+
+
+class AccuracyAssessmentResults(object):
+    """Estimators of the accuracy assessment (area proportions, quadratic errors, accuracies
+    and adjusted areas) computed with numpy from the error matrix. The rows of the matrices
+    are the thematic raster classes and the columns the classified values. The results are
+    rendered as HTML or CSV in gui/accuracy_assessment_results.py
+
+    For the accuracies based on sample counts, the classes without samples are NaN
+    """
+
+    def __init__(self, error_matrix, thematic_pixels_count, pixel_area_value, z_score):
+        """
+        Args:
+            error_matrix (array): the confusion matrix with the sample counts
+            thematic_pixels_count (list): the total pixels in the thematic raster for each class
+            pixel_area_value (float): the area of the pixel in the area unit
+            z_score (float): z score for the confidence interval of the adjusted areas
+        """
+        self.error_matrix = np.asarray(error_matrix, dtype=np.int64)
+        counts = self.error_matrix.astype(np.float64)
+        self.row_total = counts.sum(axis=1)
+        self.col_total = counts.sum(axis=0)
+        self.total = counts.sum()
+        self.thematic_pixels_count = np.asarray(thematic_pixels_count, dtype=np.float64)
+        self.total_pixels = self.thematic_pixels_count.sum()
+        self.pixel_area_value = pixel_area_value
+
+        # class area and proportion (Wi) of each thematic class
+        self.class_area = self.thematic_pixels_count * pixel_area_value
+        self.total_class_area = self.total_pixels * pixel_area_value
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.wi = self.thematic_pixels_count / self.total_pixels
+            diagonal = np.diag(counts)
+            # accuracies based on the sample counts
+            self.user_accuracy = np.where(self.row_total > 0, diagonal / self.row_total, np.nan)
+            self.producer_accuracy = np.where(self.col_total > 0, diagonal / self.col_total, np.nan)
+            self.overall_accuracy_samples = diagonal.sum() / self.total if self.total != 0 else np.nan
+
+            # error matrix of estimated area proportion, its quadratic error matrix and
+            # the standard error of the area proportion of each classified value
+            self.area_proportion, self.quadratic_error, self.area_proportion_error = \
+                self.estimate_area_proportion(counts)
+
+            # accuracy matrices of estimated area proportion
+            area_proportion_row = self.area_proportion.sum(axis=1)[:, np.newaxis]
+            self.user_accuracy_matrix = np.where(area_proportion_row > 0,
+                                                 self.area_proportion / area_proportion_row, 0)
+            area_proportion_col = self.area_proportion.sum(axis=0)
+            self.producer_accuracy_matrix = np.where(area_proportion_col > 0,
+                                                     self.area_proportion / area_proportion_col, 0)
+        self.overall_accuracy = np.trace(self.area_proportion)
+
+        # class area adjusted, the area proportions are relative to the total area of the estimation
+        self.area = self.area_proportion.sum(axis=0) * self.get_estimation_pixels() * pixel_area_value
+        self.error = self.area_proportion_error * self.get_estimation_pixels() * pixel_area_value
+        self.lower_limit = self.area - z_score * self.error
+        self.upper_limit = self.area + z_score * self.error
+        self.total_area = self.area.sum()
+
+    def get_estimation_pixels(self):
+        """Total pixels of the area of the estimation, the thematic classes as strata"""
+        return self.total_pixels
+
+    def estimate_area_proportion(self, counts):
+        """Stratified estimation with the thematic classes as strata"""
+        row_total = self.row_total[:, np.newaxis]
+        row_proportion = np.where(row_total > 0, counts / row_total, 0)
+        area_proportion = row_proportion * self.wi[:, np.newaxis]
+        quadratic_error = np.where(
+            row_total > 1, self.wi[:, np.newaxis] ** 2 * row_proportion * (1 - row_proportion) / (row_total - 1), 0)
+        return area_proportion, quadratic_error, np.sqrt(quadratic_error.sum(axis=0))
+
+
+class StratifiedAccuracyAssessmentResults(AccuracyAssessmentResults):
+    """Estimators of the accuracy assessment when the strata of the sampling are different
+    from the thematic classes, e.g. a stratified random sampling over other categorical
+    raster. Each sample is weighted by the pixels of its stratum (Stehman, 2014, Estimating
+    area and map accuracy for stratified random sampling when the strata are different
+    from the map classes). With the thematic classes as strata it is the same estimator
+    of AccuracyAssessmentResults
+    """
+
+    def __init__(self, error_matrix, samples_in_strata, strata_pixels_count, thematic_pixels_count,
+                 pixel_area_value, z_score):
+        """
+        Args:
+            error_matrix (array): the confusion matrix with the sample counts
+            samples_in_strata (array): the sample counts by stratum, thematic class and classified
+                value, with shape (strata, classes, classes)
+            strata_pixels_count (list): the total pixels of each stratum
+            thematic_pixels_count (list): the total pixels in the thematic raster for each class
+            pixel_area_value (float): the area of the pixel in the area unit
+            z_score (float): z score for the confidence interval of the adjusted areas
+        """
+        self.samples_in_strata = np.asarray(samples_in_strata, dtype=np.float64)
+        self.strata_pixels_count = np.asarray(strata_pixels_count, dtype=np.float64)
+        AccuracyAssessmentResults.__init__(self, error_matrix, thematic_pixels_count, pixel_area_value, z_score)
+
+    def get_estimation_pixels(self):
+        """Total pixels of the strata, the area proportions are relative to it"""
+        return self.strata_pixels_count.sum()
+
+    def estimate_area_proportion(self, counts):
+        strata_total = self.samples_in_strata.sum(axis=(1, 2))
+        strata_weight = self.strata_pixels_count / self.strata_pixels_count.sum()
+        # proportion of samples of each cell of the error matrix by stratum
+        proportion = np.where(strata_total[:, np.newaxis, np.newaxis] > 0,
+                              self.samples_in_strata / strata_total[:, np.newaxis, np.newaxis], 0)
+        area_proportion = np.einsum("h,hij->ij", strata_weight, proportion)
+
+        # variance of the indicator of each sample by stratum: Wh^2 * p(1-p) / (nh-1)
+        variance_factor = np.where(strata_total > 1, strata_weight ** 2 / (strata_total - 1), 0)
+        quadratic_error = np.einsum("h,hij->ij", variance_factor, proportion * (1 - proportion))
+        # the cells of a column are not independent when the strata are not the rows
+        proportion_col = proportion.sum(axis=1)
+        area_proportion_error = np.sqrt(np.einsum("h,hj->j", variance_factor, proportion_col * (1 - proportion_col)))
+        return area_proportion, quadratic_error, area_proportion_error
+
+
+class BootstrapConfidenceIntervals(object):
+    """Bootstrap confidence intervals (percentile method) of the overall, user's and
+    producer's accuracy and of the adjusted areas. Each resample draws again the samples
+    of each stratum (the thematic classes, rows of the error matrix, or the strata of the
+    sampling when they are different from the thematic classes) with a multinomial of
+    its observed proportions, all resamples are computed vectorized in numpy, in
+    parallel chunks with independent seeded generators (reproducible for the same seed).
+
+    The results are cached (the last ones) by the state of the error matrix and the parameters.
+    """
+    cache = OrderedDict()
+    cache_size = 16
+    cache_lock = threading.Lock()
+    # max size (items) of the resampled matrices by chunk
+    max_chunk_items = 5e6
+
+    def __init__(self, error_matrix, thematic_pixels_count, pixel_area_value, resamples=10000,
+                 confidence=0.95, seed=0, max_workers=None, samples_in_strata=None, strata_pixels_count=None,
+                 is_canceled=None):
+        """
+        Args:
+            error_matrix (array): the confusion matrix with the sample counts
+            thematic_pixels_count (list): the total pixels in the thematic raster for each class
+            pixel_area_value (float): the area of the pixel in the area unit
+            resamples (int): number of bootstrap resamples
+            confidence (float): the confidence level of the intervals
+            seed (int): seed of the random generators
+            max_workers (int): number of threads, default the cpu count
+            samples_in_strata (array): the sample counts by stratum, thematic class and classified
+                value, with shape (strata, classes, classes), only when the strata are different
+                from the thematic classes
+            strata_pixels_count (list): the total pixels of each stratum, with samples_in_strata
+            is_canceled (function): checked between the chunks of resamples, if it returns True
+                the computation stops and the intervals are None (not cached)
+        """
+        self.resamples = resamples
+        self.confidence = confidence
+        self.seed = seed
+        key = self.get_key(error_matrix, thematic_pixels_count, pixel_area_value, resamples, confidence, seed,
+                           samples_in_strata, strata_pixels_count)
+        with BootstrapConfidenceIntervals.cache_lock:
+            results = BootstrapConfidenceIntervals.cache.get(key)
+            if results is not None:
+                BootstrapConfidenceIntervals.cache.move_to_end(key)
+        if results is None:
+            if samples_in_strata is None:
+                resample_chunk, chunk_items = self.thematic_strata_resampler(
+                    np.asarray(error_matrix, dtype=np.int64), np.asarray(thematic_pixels_count, dtype=np.float64),
+                    pixel_area_value)
+            else:
+                resample_chunk, chunk_items = self.strata_resampler(
+                    np.asarray(samples_in_strata, dtype=np.int64), np.asarray(strata_pixels_count, dtype=np.float64),
+                    pixel_area_value)
+            results = self.compute(resample_chunk, chunk_items, max_workers, seed, is_canceled)
+            if results is None:
+                self.overall_accuracy = self.user_accuracy = self.producer_accuracy = self.area = None
+                return
+            with BootstrapConfidenceIntervals.cache_lock:
+                BootstrapConfidenceIntervals.cache[key] = results
+                while len(BootstrapConfidenceIntervals.cache) > BootstrapConfidenceIntervals.cache_size:
+                    BootstrapConfidenceIntervals.cache.popitem(last=False)
+        self.overall_accuracy, self.user_accuracy, self.producer_accuracy, self.area = results
+
+    @staticmethod
+    def get_key(error_matrix, thematic_pixels_count, pixel_area_value, resamples=10000, confidence=0.95, seed=0,
+                samples_in_strata=None, strata_pixels_count=None):
+        counts = np.asarray(error_matrix, dtype=np.int64)
+        key = (counts.tobytes(), counts.shape, tuple(thematic_pixels_count), pixel_area_value, resamples,
+               confidence, seed)
+        if samples_in_strata is not None:
+            samples_in_strata = np.asarray(samples_in_strata, dtype=np.int64)
+            key += (samples_in_strata.tobytes(), samples_in_strata.shape, tuple(strata_pixels_count))
+        return key
+
+    @classmethod
+    def from_cache(cls, error_matrix, thematic_pixels_count, pixel_area_value, resamples=10000,
+                   confidence=0.95, seed=0, samples_in_strata=None, strata_pixels_count=None):
+        """The bootstrap confidence intervals if they are cached for these parameters, else
+        None, without compute them"""
+        key = cls.get_key(error_matrix, thematic_pixels_count, pixel_area_value, resamples, confidence, seed,
+                          samples_in_strata, strata_pixels_count)
+        with cls.cache_lock:
+            if key not in cls.cache:
+                return None
+        return cls(error_matrix, thematic_pixels_count, pixel_area_value, resamples, confidence, seed,
+                   samples_in_strata=samples_in_strata, strata_pixels_count=strata_pixels_count)
+
+    @staticmethod
+    def thematic_strata_resampler(counts, thematic_pixels_count, pixel_area_value):
+        """Resampler of the error matrices with the thematic classes as strata
+
+        Returns:
+            tuple: (resample_chunk function, items of the error matrices by resample)
+        """
+        total_pixels = thematic_pixels_count.sum()
+        wi = thematic_pixels_count / total_pixels
+        row_total = counts.sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            row_proportion = np.where(row_total[:, np.newaxis] > 0, counts / row_total[:, np.newaxis], 0)
+            # weight of each sample of a stratum in the area proportion (Wi / ni)
+            sample_weight = np.where(row_total > 0, wi / row_total, 0)
+
+        def resample_chunk(args):
+            size, seed_seq = args
+            rng = np.random.default_rng(seed_seq)
+            # (size, classes, classes) resampled error matrices, stratum by stratum
+            resampled = np.stack([rng.multinomial(n, p, size=size) if n > 0 else
+                                  np.zeros((size, len(row_total)), dtype=np.int64)
+                                  for n, p in zip(row_total, row_proportion)], axis=1)
+            diagonal = np.diagonal(resampled, axis1=1, axis2=2)
+            # column totals and diagonal of the error matrix of estimated area proportion
+            area_proportion_col = np.einsum("bij,i->bj", resampled, sample_weight)
+            area_proportion_diag = diagonal * sample_weight
+            with np.errstate(divide="ignore", invalid="ignore"):
+                user_accuracy = np.where(row_total > 0, diagonal / row_total, np.nan)
+                producer_accuracy = np.where(area_proportion_col > 0, area_proportion_diag / area_proportion_col, np.nan)
+            overall_accuracy = area_proportion_diag.sum(axis=1)
+            area = area_proportion_col * total_pixels * pixel_area_value
+            return overall_accuracy, user_accuracy, producer_accuracy, area
+
+        return resample_chunk, counts.size
+
+    @staticmethod
+    def strata_resampler(samples_in_strata, strata_pixels_count, pixel_area_value):
+        """Resampler of the samples by stratum when the strata are different from the thematic
+        classes, each resample is the error matrix of estimated area proportion (Stehman, 2014)
+
+        Returns:
+            tuple: (resample_chunk function, items of the samples by strata by resample)
+        """
+        num_strata, num_classes, _ = samples_in_strata.shape
+        total_pixels = strata_pixels_count.sum()
+        strata_total = samples_in_strata.sum(axis=(1, 2))
+        cells = samples_in_strata.reshape(num_strata, -1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cells_proportion = np.where(strata_total[:, np.newaxis] > 0, cells / strata_total[:, np.newaxis], 0)
+            # weight of each sample of a stratum in the area proportion (Wh / nh)
+            sample_weight = np.where(strata_total > 0, strata_pixels_count / total_pixels / strata_total, 0)
+
+        def resample_chunk(args):
+            size, seed_seq = args
+            rng = np.random.default_rng(seed_seq)
+            # (size, strata, classes * classes) resampled samples, stratum by stratum
+            resampled = np.stack([rng.multinomial(n, p, size=size) if n > 0 else
+                                  np.zeros((size, cells.shape[1]), dtype=np.int64)
+                                  for n, p in zip(strata_total, cells_proportion)], axis=1)
+            # (size, classes, classes) error matrices of estimated area proportion
+            area_proportion = np.einsum("bhk,h->bk", resampled, sample_weight).reshape(size, num_classes, num_classes)
+            diagonal = np.diagonal(area_proportion, axis1=1, axis2=2)
+            area_proportion_row = area_proportion.sum(axis=2)
+            area_proportion_col = area_proportion.sum(axis=1)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                user_accuracy = np.where(area_proportion_row > 0, diagonal / area_proportion_row, np.nan)
+                producer_accuracy = np.where(area_proportion_col > 0, diagonal / area_proportion_col, np.nan)
+            overall_accuracy = diagonal.sum(axis=1)
+            area = area_proportion_col * total_pixels * pixel_area_value
+            return overall_accuracy, user_accuracy, producer_accuracy, area
+
+        return resample_chunk, samples_in_strata.size
+
+    def compute(self, resample_chunk, chunk_items, max_workers, seed, is_canceled=None):
+        chunk_size = int(max(1, min(1000, self.max_chunk_items // max(chunk_items, 1))))
+        sizes = [min(chunk_size, self.resamples - start) for start in range(0, self.resamples, chunk_size)]
+        seed_seqs = np.random.SeedSequence(seed).spawn(len(sizes))
+
+        def resample_chunk_if_not_canceled(args):
+            if is_canceled is not None and is_canceled():
+                return None
+            return resample_chunk(args)
+
+        with ThreadPoolExecutor(max_workers=max_workers or multiprocessing.cpu_count()) as executor:
+            chunks = list(executor.map(resample_chunk_if_not_canceled, zip(sizes, seed_seqs)))
+        if any(chunk is None for chunk in chunks):
+            return None
+
+        alpha = (1 - self.confidence) / 2 * 100
+        results = []
+        for idx in range(4):
+            values = np.concatenate([chunk[idx] for chunk in chunks], axis=0)
+            with warnings.catch_warnings():
+                # classes without samples are NaN in all resamples
+                warnings.simplefilter("ignore", category=RuntimeWarning)
+                results.append(np.nanpercentile(values, [alpha, 100 - alpha], axis=0))
+        return tuple(results)
+
+
+class BootstrapTask(QgsTask):
+    """Compute the bootstrap confidence intervals in background, the results are cached
+    and the accuracy assessment dialog takes them when the task finishes (if the
+    results didn't change in the meantime)
+    """
+
+    def __init__(self, bootstrap_params):
+        QgsTask.__init__(self, "AcATaMa - Bootstrap confidence intervals", QgsTask.CanCancel)
+        self.bootstrap_params = bootstrap_params
+        self.key = BootstrapConfidenceIntervals.get_key(**bootstrap_params)
+        self.bootstrap = None
+
+    def run(self):
+        self.bootstrap = BootstrapConfidenceIntervals(**self.bootstrap_params, is_canceled=self.isCanceled)
+        return not self.isCanceled()
 
 
 # Qgis 3 ares units, int values: [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
@@ -137,7 +698,7 @@ class AccuracyAssessmentDialog(QDialog, FORM_CLASS):
         self.setupUi(self)
         # dialog buttons box
         self.DialogButtons.rejected.connect(self.closing)
-        self.DialogButtons.button(QDialogButtonBox.Save).setText("Export to CSV")
+        self.DialogButtons.button(QDialogButtonBox.Save).setText("Export results")
         self.DialogButtons.button(QDialogButtonBox.Save).clicked.connect(self.export_to_csv)
 
         from AcATaMa.gui.acatama_dockwidget import AcATaMaDockWidget as AcATaMa
@@ -156,6 +717,8 @@ class AccuracyAssessmentDialog(QDialog, FORM_CLASS):
                     self.z_score.setValue(self.accuracy_assessment.z_score)
                     self.CSV_separator.setText(self.accuracy_assessment.csv_separator)
                     self.CSV_decimal_sep.setText(self.accuracy_assessment.csv_decimal)
+                    self.bootstrap_resamples.setValue(self.accuracy_assessment.bootstrap_resamples)
+                    self.strata_config.setText(self.accuracy_assessment.sampling_config or "")
                 else:
                     self.accuracy_assessment = AccuracyAssessment(classification)
                     classification.accuracy_assessment = self.accuracy_assessment
@@ -175,9 +738,20 @@ class AccuracyAssessmentDialog(QDialog, FORM_CLASS):
 
         self.area_unit.currentIndexChanged.connect(lambda: self.reload(msg_bar=False))
         self.z_score.valueChanged.connect(lambda: self.reload(msg_bar=False))
+        self.bootstrap_resamples.valueChanged.connect(lambda: self.reload(msg_bar=False))
         self.CSV_separator.textChanged.connect(lambda value: setattr(self.accuracy_assessment, "csv_separator", value))
         self.CSV_decimal_sep.textChanged.connect(lambda value: setattr(self.accuracy_assessment, "csv_decimal", value))
         self.reloadButton.clicked.connect(lambda: self.reload(msg_bar=True))
+        self.browse_strata_config.clicked.connect(self.fileDialog_strataConfig)
+        self.batchButton.clicked.connect(self.batch_thematic_rasters)
+        self.clear_strata_config.clicked.connect(lambda: self.set_strata_config(None))
+        # the titles of the sections in the results are links (#section) to show/hide it
+        self.ResultsHTML.setOpenLinks(False)
+        self.ResultsHTML.anchorClicked.connect(self.toggle_results_section)
+        self.collapsed_sections = None
+        self.results_html_key = None
+        # the bootstrap confidence intervals are computed in background
+        self.bootstrap_task = None
 
     def show(self):
         from AcATaMa.gui.acatama_dockwidget import AcATaMaDockWidget as AcATaMa
@@ -190,9 +764,12 @@ class AccuracyAssessmentDialog(QDialog, FORM_CLASS):
 
         AccuracyAssessmentDialog.is_opened = True
         # first compute the accuracy assessment
-        self.accuracy_assessment.compute()
+        self.compute()
+        if self.collapsed_sections is None:
+            self.collapsed_sections = accuracy_assessment_results.get_html_collapsed_by_default(
+                self.accuracy_assessment)
         # set content results in HTML
-        self.ResultsHTML.setHtml(accuracy_assessment_results.get_html(self.accuracy_assessment))
+        self.render_results()
         self.ResultsHTML.zoomOut()
 
         AcATaMa.dockwidget.QPBtn_ComputeViewAccurasyAssessment.setText("Accuracy assessment is opened, click to show")
@@ -203,17 +780,157 @@ class AccuracyAssessmentDialog(QDialog, FORM_CLASS):
         from AcATaMa.gui.acatama_dockwidget import AcATaMaDockWidget as AcATaMa
         # set adjust variables from dialog
         self.accuracy_assessment.z_score = self.z_score.value()
+        self.accuracy_assessment.bootstrap_resamples = self.bootstrap_resamples.value()
         self.accuracy_assessment.area_unit = AREA_UNITS[self.area_unit.currentIndex()]
         # first compute the accuracy assessment
-        self.accuracy_assessment.compute()
+        self.compute()
         # set content results in HTML
-        self.ResultsHTML.setHtml(accuracy_assessment_results.get_html(self.accuracy_assessment))
+        self.render_results()
         AcATaMa.dockwidget.QPBtn_ComputeViewAccurasyAssessment.setText("Accuracy assessment is opened, click to show")
         if msg_bar:
             self.MsgBar.pushMessage(
                 "Reload successfully from classification status of \"{}\"".format(
                     AcATaMa.dockwidget.QCBox_SamplingFile_AA.currentText()), level=Qgis.Success)
 
+    def render_results(self):
+        """Set the html of the results, only if its content changed since the last
+        time, keeping the scroll position
+        """
+        html_key = accuracy_assessment_results.get_html_key(self.accuracy_assessment, self.collapsed_sections)
+        if html_key == self.results_html_key:
+            return
+        scroll_position = self.ResultsHTML.verticalScrollBar().value()
+        self.ResultsHTML.setHtml(accuracy_assessment_results.get_html(self.accuracy_assessment,
+                                                                      self.collapsed_sections))
+        self.ResultsHTML.verticalScrollBar().setValue(scroll_position)
+        self.results_html_key = html_key
+
+    def toggle_results_section(self, url):
+        section = url.fragment()
+        if section not in accuracy_assessment_results.HTML_SECTIONS:
+            return
+        self.collapsed_sections ^= {section}
+        self.render_results()
+
+    def fileDialog_strataConfig(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, self.tr("Select the sampling config file of a stratified "
+                                                                 "random sampling"), "",
+                                                   self.tr("Ini files (*.ini);;All files (*.*)"))
+        if file_path != '':
+            self.set_strata_config(file_path)
+
+    def set_strata_config(self, file_path):
+        try:
+            self.accuracy_assessment.set_strata_from_sampling_config(file_path)
+        except Exception as err:
+            self.MsgBar.pushMessage("Failed loading the strata: {}".format(err), level=Qgis.Warning, duration=10)
+            return
+        self.strata_config.setText(self.accuracy_assessment.sampling_config or "")
+        self.reload(msg_bar=False)
+
+    @wait_process
+    def compute(self):
+        from AcATaMa.gui.acatama_dockwidget import AcATaMaDockWidget as AcATaMa
+        AcATaMa.dockwidget.QPBtn_ComputeViewAccurasyAssessment.setText("Processing, please wait ...")
+        QApplication.processEvents()
+        self.accuracy_assessment.compute(bootstrap=False)
+        self.start_bootstrap_task()
+
+    def start_bootstrap_task(self):
+        """Compute the bootstrap confidence intervals in background if they are enabled and
+        not cached, meanwhile the results show the analytic intervals
+        """
+        bootstrap_params = self.accuracy_assessment.bootstrap_params
+        if bootstrap_params is None or self.accuracy_assessment.bootstrap is not None:
+            self.cancel_bootstrap_task()
+            return
+        key = BootstrapConfidenceIntervals.get_key(**bootstrap_params)
+        if self.bootstrap_task is not None and self.bootstrap_task.key == key:
+            return
+        self.cancel_bootstrap_task()
+        self.bootstrap_task = BootstrapTask(bootstrap_params)
+        self.bootstrap_task.taskCompleted.connect(lambda task=self.bootstrap_task: self.bootstrap_finished(task))
+        self.bootstrap_task.taskTerminated.connect(lambda task=self.bootstrap_task: self.bootstrap_terminated(task))
+        QgsApplication.taskManager().addTask(self.bootstrap_task)
+
+    def cancel_bootstrap_task(self):
+        if self.bootstrap_task is not None:
+            self.bootstrap_task.cancel()
+            self.bootstrap_task = None
+
+    def bootstrap_finished(self, task):
+        # discard the bootstrap of old results
+        if task is not self.bootstrap_task:
+            return
+        self.bootstrap_task = None
+        bootstrap_params = self.accuracy_assessment.bootstrap_params
+        if bootstrap_params is not None and BootstrapConfidenceIntervals.get_key(**bootstrap_params) == task.key:
+            self.accuracy_assessment.bootstrap = task.bootstrap
+            self.render_results()
+
+    def bootstrap_terminated(self, task):
+        """The bootstrap task failed or it was canceled (not by a new computation), the
+        results show the analytic intervals without wait the bootstrap
+        """
+        if task is not self.bootstrap_task:
+            return
+        self.bootstrap_task = None
+        self.accuracy_assessment.bootstrap_params = None
+        self.render_results()
+        self.MsgBar.pushMessage("The bootstrap confidence intervals were not computed (failed or canceled), "
+                                "reload the results for compute them again", level=Qgis.Warning)
+
+    def batch_thematic_rasters(self):
+        """Assess other thematic rasters against the same samples classified, with the
+        band, nodata and settings of the current thematic raster
+        """
+        from AcATaMa.gui.acatama_dockwidget import AcATaMaDockWidget as AcATaMa
+        thematic_files, _ = QFileDialog.getOpenFileNames(
+            self, self.tr("Select the thematic rasters to assess with the same samples"),
+            os.path.dirname(self.accuracy_assessment.ThematicR.file_path),
+            self.tr("Raster files (*.tif *.tiff *.img *.vrt);;All files (*.*)"))
+        if not thematic_files:
+            return
+        suggested_filename = os.path.splitext(self.accuracy_assessment.ThematicR.file_path)[0] + "_batch_results.csv"
+        file_out, _ = QFileDialog.getSaveFileName(self, self.tr("Export the combined table of results"),
+                                                  suggested_filename,
+                                                  self.tr("CSV files (*.csv);;JSON files (*.json);;"
+                                                          "Parquet files (*.parquet);;Excel files (*.xlsx)"))
+        if file_out == '':
+            return
+
+        thematic_rasters = [
+            Raster(layer=QgsRasterLayer(thematic_file, os.path.basename(thematic_file), "gdal"),
+                   band=self.accuracy_assessment.ThematicR.band, nodata=self.accuracy_assessment.ThematicR.nodata)
+            for thematic_file in thematic_files]
+        self.compute_batch_and_export(thematic_rasters, file_out)
+        AcATaMa.dockwidget.QPBtn_ComputeViewAccurasyAssessment.setText("Accuracy assessment is opened, click to show")
+
+    @wait_process
+    def compute_batch_and_export(self, thematic_rasters, file_out):
+        from AcATaMa.gui.acatama_dockwidget import AcATaMaDockWidget as AcATaMa
+        AcATaMa.dockwidget.QPBtn_ComputeViewAccurasyAssessment.setText("Processing, please wait ...")
+        QApplication.processEvents()
+        try:
+            accuracy_assessments = compute_batch(self.accuracy_assessment.classification, thematic_rasters,
+                                                 settings=self.accuracy_assessment)
+            if file_out.endswith(".json"):
+                accuracy_assessment_results.export_batch_to_json(accuracy_assessments, file_out)
+            elif file_out.endswith(".parquet"):
+                accuracy_assessment_results.export_to_parquet(accuracy_assessments, file_out)
+            elif file_out.endswith(".xlsx"):
+                accuracy_assessment_results.export_to_xlsx(accuracy_assessments, file_out)
+            else:
+                accuracy_assessment_results.export_batch_to_csv(accuracy_assessments, file_out,
+                                                                self.accuracy_assessment.csv_separator,
+                                                                self.accuracy_assessment.csv_decimal)
+        except Exception as err:
+            self.MsgBar.pushMessage("Failed computing or saving the batch of results: {}".format(err),
+                                    level=Qgis.Critical, duration=-1)
+            return
+        self.MsgBar.pushMessage("File saved successfully \"{}\"".format(os.path.basename(file_out)),
+                                level=Qgis.Success)
+
     def export_to_csv(self):
         # get file path to suggest to save but not in tmp directory
         from AcATaMa.gui.acatama_dockwidget import AcATaMaDockWidget as AcATaMa
@@ -223,19 +940,27 @@ class AccuracyAssessmentDialog(QDialog, FORM_CLASS):
             path = os.path.split(get_file_path_of_layer(AcATaMa.dockwidget.QCBox_ThematicRaster.currentLayer()))[0]
         suggested_filename = os.path.splitext(os.path.join(path, filename))[0] + "_results.csv" if filename else ""
 
-        file_out, _ = QFileDialog.getSaveFileName(self, self.tr("Export accuracy assessment results to csv"),
+        file_out, _ = QFileDialog.getSaveFileName(self, self.tr("Export accuracy assessment results"),
                                                   suggested_filename,
-                                                  self.tr("CSV files (*.csv);;All files (*.*)"))
+                                                  self.tr("CSV files (*.csv);;JSON files (*.json);;"
+                                                          "Parquet files (*.parquet);;Excel files (*.xlsx)"))
         if file_out != '':
             try:
-                accuracy_assessment_results.export_to_csv(self.accuracy_assessment, file_out,
-                                                          self.accuracy_assessment.csv_separator,
-                                                          self.accuracy_assessment.csv_decimal)
+                if file_out.endswith(".json"):
+                    accuracy_assessment_results.export_to_json(self.accuracy_assessment, file_out)
+                elif file_out.endswith(".parquet"):
+                    accuracy_assessment_results.export_to_parquet([self.accuracy_assessment], file_out)
+                elif file_out.endswith(".xlsx"):
+                    accuracy_assessment_results.export_to_xlsx([self.accuracy_assessment], file_out)
+                else:
+                    accuracy_assessment_results.export_to_csv(self.accuracy_assessment, file_out,
+                                                              self.accuracy_assessment.csv_separator,
+                                                              self.accuracy_assessment.csv_decimal)
                 self.MsgBar.pushMessage(
                     "File saved successfully \"{}\"".format(os.path.basename(file_out)), level=Qgis.Success)
             except Exception as err:
                 self.MsgBar.pushMessage(
-                    "Failed saving the csv file: {}".format(err), level=Qgis.Critical, duration=-1)
+                    "Failed saving the results file: {}".format(err), level=Qgis.Critical, duration=-1)
 
     def closeEvent(self, event):
         self.closing()
@@ -247,6 +972,7 @@ class AccuracyAssessmentDialog(QDialog, FORM_CLASS):
         """
         from AcATaMa.gui.acatama_dockwidget import AcATaMaDockWidget as AcATaMa
         AccuracyAssessmentDialog.is_opened = False
+        self.cancel_bootstrap_task()
         AcATaMa.dockwidget.QPBtn_ComputeViewAccurasyAssessment.setText("Open the accuracy assessment results")
         AcATaMa.dockwidget.QGBox_SamplingSelection_AA.setEnabled(True)
         self.reject(is_ok_to_close=True)
@@ -18,17 +18,25 @@
  *                                                                         *
  ***************************************************************************/
 """
-from collections import OrderedDict
+import os
+import hashlib
+import zipfile
+from collections import OrderedDict, Counter
 from random import shuffle
+from xml.sax.saxutils import escape
+import numpy as np
+from osgeo import gdal, ogr, osr
 
-from qgis.PyQt.QtCore import QVariant
-from qgis.PyQt.QtCore import NULL
-from qgis.core import QgsVectorLayer, QgsField, QgsFeature, QgsVectorFileWriter, Qgis, QgsUnitTypes
+from qgis.core import Qgis, QgsUnitTypes, QgsFeatureRequest, QgsMapLayer, QgsProject, QgsRectangle, \
+    QgsSpatialIndex, QgsWkbTypes, QgsCoordinateReferenceSystem
+from qgis.PyQt.QtGui import QColor
 from qgis.utils import iface
 
 from AcATaMa.core.point import ClassificationPoint
 from AcATaMa.core.raster import Raster
-from AcATaMa.utils.qgis_utils import get_current_file_path_in, get_file_path_of_layer, load_and_select_filepath_in
+from AcATaMa.utils.others_utils import get_points_from_ogr
+from AcATaMa.utils.qgis_utils import get_current_file_path_in, get_file_path_of_layer, load_and_select_filepath_in, \
+    transform_coordinates
 from AcATaMa.utils.system_utils import wait_process
 
 
@@ -72,6 +80,16 @@ class Classification(object):
         self.is_completed = False
         # for store the instance of the accuracy assessment results
         self.accuracy_assessment = None
+        # shared store of the samples labels for several interpreters (ClassificationStore)
+        self.store = None
+        # samples claimed by other interpreters in the store
+        self.claimed_by_others = set()
+        # (state, kml_body, lon_lat) of the samples for Google Earth
+        self._kml_cache = None
+        # by thematic raster: the value of each sample {shape_id: value} and the incremental error
+        # matrix counts {(thematic_value, classif_id): count} of the samples classified
+        # {raster key: {"values": {...}, "counts": Counter}}
+        self.thematic_cache = {}
 
         # shuffle the list items
         shuffle(self.points)
@@ -80,6 +98,8 @@ class Classification(object):
 
     def classify_the_current_sample(self, classif_id):
         current_sample = self.points[self.current_sample_idx]
+        self.update_confusion_counts(current_sample, current_sample.classif_id if current_sample.is_classified else None,
+                                     classif_id or None)
         if classif_id:  # classify with valid integer class
             if current_sample.is_classified is False:  # only when the classification is changed
                 self.total_classified += 1
@@ -93,27 +113,351 @@ class Classification(object):
             current_sample.classif_id = None
             current_sample.is_classified = False
         self.is_completed = True if self.total_unclassified == 0 else False
+        # write the change of this sample in the shared store
+        if self.store:
+            self.store.write_samples([current_sample])
+
+    def attach_store(self, db_path, interpreter=None, wal=False):
+        """Share the labels of this classification with other interpreters through
+        a SQLite store, then restore the labels saved in it by the others
+        """
+        from AcATaMa.core.classification_store import ClassificationStore
+        if self.store:
+            self.store.close()
+        self.store = ClassificationStore(db_path, interpreter=interpreter, wal=wal)
+        self.store.init_samples(self.points)
+        self.sync_with_store()
+
+    def detach_store(self, release_claims=True):
+        """Close the shared store, the samples claimed by this interpreter return to the
+        pool if release_claims, else they keep claimed until their lease expires
+        """
+        if self.store:
+            if release_claims:
+                self.store.release_claims()
+            self.store.close()
+        self.store = None
+        self.claimed_by_others = set()
+
+    def merge_store(self, other_db_path):
+        """Merge in the shared store the labels of other store file, then restore them
+
+        Returns:
+            int: the number of samples changed
+        """
+        if not self.store:
+            return 0
+        self.store.merge_from(other_db_path)
+        return self.sync_with_store()
+
+    def sync_with_store(self):
+        """Pull the labels changed in the store by the other interpreters
+
+        Returns:
+            int: the number of samples changed
+        """
+        if not self.store:
+            return 0
+        changes = self.store.pull_changes()
+        self.claimed_by_others = self.store.get_claimed_by_others()
+        if not changes:
+            return 0
+        points_by_id = {point.shape_id: point for point in self.points}
+        changed = 0
+        for shape_id, classif_id, _, _ in changes:
+            point = points_by_id.get(shape_id)
+            if point is None or point.classif_id == classif_id:
+                continue
+            point.classif_id = classif_id
+            point.is_classified = classif_id is not None
+            changed += 1
+        if changed:
+            self.reload_classification_status()
+        return changed
+
+    def claim_samples(self, size, lease=3600):
+        """Claim in the store a batch of unclassified samples for this interpreter
+
+        Returns:
+            list: the shape ids claimed
+        """
+        if not self.store:
+            return []
+        shape_ids = self.store.claim_batch(size, lease)
+        self.claimed_by_others = self.store.get_claimed_by_others(lease)
+        return shape_ids
 
     def reload_classification_status(self):
         self.total_classified = sum(sample.is_classified for sample in self.points)
         self.total_unclassified = sum(not sample.is_classified for sample in self.points)
         self.is_completed = True if self.total_unclassified == 0 else False
+        # the samples were changed in bulk, rebuild the error matrix counts when needed
+        for thematic_cache in self.thematic_cache.values():
+            thematic_cache["counts"] = None
+
+    @staticmethod
+    def get_thematic_cache_key(ThematicR):
+        return (ThematicR.file_path, os.path.getmtime(ThematicR.file_path)
+                if ThematicR.file_path and os.path.isfile(ThematicR.file_path) else None,
+                ThematicR.band, ThematicR.nodata)
+
+    def get_thematic_cache(self, ThematicR):
+        key = self.get_thematic_cache_key(ThematicR)
+        if key not in self.thematic_cache:
+            thematic_values = ThematicR.get_pixel_values_from_pnts([point.QgsPnt for point in self.points],
+                                                                    crs=self.sampling_layer.crs())
+            self.set_thematic_values(ThematicR, thematic_values)
+        return self.thematic_cache[key]
+
+    def set_thematic_values(self, ThematicR, thematic_values):
+        """Set the thematic raster value of all samples read in batch outside (in the order
+        of the samples), the error matrix counts are built again when needed
+        """
+        self.thematic_cache[self.get_thematic_cache_key(ThematicR)] = \
+            {"values": {point.shape_id: int(value) if value else None
+                        for point, value in zip(self.points, thematic_values)},
+             "counts": None}
+
+    def get_thematic_values(self, ThematicR):
+        """Get the thematic raster value of all samples, got in one batch once by raster
+
+        Returns:
+            dict: {shape_id: thematic_value}, None for the samples outside the thematic
+                raster or in nodata
+        """
+        return self.get_thematic_cache(ThematicR)["values"]
+
+    def get_confusion_counts(self, ThematicR):
+        """Get the error matrix counts of the samples classified against the thematic raster,
+        the counts are built once by raster and then updated incrementally on each
+        classification change
+
+        Returns:
+            Counter: {(thematic_value, classif_id): count}, the thematic value is None for
+                the samples outside the thematic raster or in nodata
+        """
+        thematic_cache = self.get_thematic_cache(ThematicR)
+        if thematic_cache["counts"] is None:
+            thematic_cache["counts"] = Counter((thematic_cache["values"][point.shape_id], point.classif_id)
+                                               for point in self.points if point.is_classified)
+        return thematic_cache["counts"]
+
+    def update_confusion_counts(self, sample, old_classif_id, new_classif_id):
+        if old_classif_id == new_classif_id:
+            return
+        for thematic_cache in self.thematic_cache.values():
+            confusion_counts = thematic_cache["counts"]
+            if confusion_counts is None:
+                continue
+            thematic_value = thematic_cache["values"].get(sample.shape_id)
+            if old_classif_id is not None:
+                confusion_counts[(thematic_value, old_classif_id)] -= 1
+                if confusion_counts[(thematic_value, old_classif_id)] <= 0:
+                    del confusion_counts[(thematic_value, old_classif_id)]
+            if new_classif_id is not None:
+                confusion_counts[(thematic_value, new_classif_id)] += 1
+
+    @wait_process
+    def classify_from_reference_layer(self, reference_layer, values_to_buttons, band=1, attribute=None,
+                                      search_radius=0, overwrite=False):
+        """Pre-classify in bulk the samples using reference data, the pixel values of a
+        raster layer or the attribute values of a vector layer (the feature that contains
+        the sample for polygons, or the nearest feature inside the search radius for points
+        and lines). All samples are looked up in one pass and the classification status is
+        updated only once at the end
+
+        Args:
+            reference_layer (QgsMapLayer): raster or vector layer with the reference data
+            values_to_buttons (dict): {reference value: classif_id (classification button id)}
+            band (int): the raster band to read the values
+            attribute (str): the field name with the values in the vector layer
+            search_radius (float): max distance in sampling units for point and line layers
+            overwrite (bool): overwrite the samples that are already classified
+
+        Returns:
+            int: total samples classified from the reference data
+        """
+        from AcATaMa.gui.acatama_dockwidget import AcATaMaDockWidget as AcATaMa
+
+        samples = [point for point in self.points if overwrite or not point.is_classified]
+        if not samples or not self.buttons_config:
+            return 0
+
+        if reference_layer.type() == QgsMapLayer.RasterLayer:
+            # the pixel values are matched as stored, the classes of a raster must be integers
+            if any(isinstance(value, float) and not value.is_integer() for value in values_to_buttons):
+                raise Exception("The reference values of a raster layer must be integer classes")
+            ReferenceR = Raster(band=band, layer=reference_layer)
+            reference_values = ReferenceR.get_pixel_values_from_pnts([point.QgsPnt for point in samples],
+                                                                     crs=self.sampling_layer.crs())
+        else:
+            attr_idx = reference_layer.fields().lookupField(attribute)
+            # get the reference features (only with the attribute) in the CRS of the sampling layer
+            request = QgsFeatureRequest().setSubsetOfAttributes([attr_idx])
+            request.setDestinationCrs(self.sampling_layer.crs(), QgsProject.instance().transformContext())
+            # with the geometries stored the nearest neighbor uses the real distance, not the bounding box
+            index = QgsSpatialIndex(QgsSpatialIndex.FlagStoreFeatureGeometries)
+            geometries = {}
+            values = {}
+            for feature in reference_layer.getFeatures(request):
+                if not feature.hasGeometry():
+                    continue
+                index.addFeature(feature)
+                geometries[feature.id()] = feature.geometry()
+                values[feature.id()] = feature.attributes()[attr_idx]
+
+            reference_values = []
+            is_polygon = reference_layer.geometryType() == QgsWkbTypes.PolygonGeometry
+            for point in samples:
+                value = None
+                if is_polygon:
+                    for fid in index.intersects(QgsRectangle(point.QgsPnt, point.QgsPnt)):
+                        if geometries[fid].contains(point.QgsPnt):
+                            value = values[fid]
+                            break
+                else:
+                    nearest = index.nearestNeighbor(point.QgsPnt, 1)
+                    if nearest and geometries[nearest[0]].distance(point.QgsGeom) <= search_radius:
+                        value = values[nearest[0]]
+                reference_values.append(value)
+
+        # set the classification in bulk
+        total_classified = 0
+        classified_samples = []
+        for point, reference_value in zip(samples, reference_values):
+            classif_id = values_to_buttons.get(reference_value)
+            if classif_id is None or classif_id not in self.buttons_config:
+                continue
+            point.classif_id = classif_id
+            point.is_classified = True
+            total_classified += 1
+            classified_samples.append(point)
+        # write all changes in the shared store in one transaction
+        if self.store and classified_samples:
+            self.store.write_samples(classified_samples)
+
+        # update the status and labels plugin with the current sampling classification
+        self.reload_classification_status()
+        from AcATaMa.gui.classification_dialog import ClassificationDialog
+        if ClassificationDialog.is_opened and ClassificationDialog.instance.classification == self:
+            ClassificationDialog.instance.display_sample_status()
+        elif AcATaMa.dockwidget:
+            AcATaMa.dockwidget.update_the_status_of_classification()
+
+        return total_classified
 
     def get_points_from_shapefile(self):
-        points = []
-        for enum_id, qgs_feature in enumerate(self.sampling_layer.getFeatures(), start=1):
-            geom = qgs_feature.geometry()
-            # get the id from shape file using column name "id" else use auto-enumeration
+        file_path = get_file_path_of_layer(self.sampling_layer)
+        if self.sampling_layer.providerType() == "ogr" and os.path.isfile(file_path) and \
+                not self.sampling_layer.subsetString() and not self.sampling_layer.isEditable():
+            # read in bulk from the file only the coordinates and the "id" column
+            layer_name = self.sampling_layer.source().split("|layername=")[1].split("|")[0] \
+                if "|layername=" in self.sampling_layer.source() else None
+            shape_ids, xs, ys = get_points_from_ogr(file_path, layer_name, id_field="id")
+            xs, ys = xs.tolist(), ys.tolist()
+        else:
+            # request only the geometry and the "id" attribute
             attr_id = self.sampling_layer.fields().lookupField('id')
-            if attr_id != -1:
-                shape_id = qgs_feature.attributes()[attr_id]
-            else:
-                shape_id = enum_id
-            x, y = geom.asPoint()
-            points.append(ClassificationPoint(x, y, shape_id))
+            request = QgsFeatureRequest().setSubsetOfAttributes([attr_id] if attr_id != -1 else [])
+            shape_ids, xs, ys = [], [], []
+            for qgs_feature in self.sampling_layer.getFeatures(request):
+                if qgs_feature.geometry().isNull():
+                    raise Exception("The sampling layer {} has features without geometry".format(
+                        self.sampling_layer.name()))
+                x, y = qgs_feature.geometry().asPoint()
+                xs.append(x)
+                ys.append(y)
+                if attr_id != -1:
+                    shape_ids.append(qgs_feature.attributes()[attr_id])
+            if attr_id == -1:
+                shape_ids = None
+        # get the id from shape file using column name "id" else use auto-enumeration
+        if shape_ids is None:
+            shape_ids = range(1, len(xs) + 1)
+
+        points = [ClassificationPoint(x, y, shape_id) for x, y, shape_id in zip(xs, ys, shape_ids)]
         self.num_points = len(points)
         return points
 
+    def get_kml_body(self):
+        """KML styles (one shared style by class) and placemarks of all samples, the
+        points are transformed to WGS84 in one batch. The body is cached until the
+        classification status of the samples changes
+
+        Returns:
+            tuple: (kml_body, {shape_id: (lon, lat)})
+        """
+        state = repr((self.sampling_layer.name(), [(point.shape_id, point.classif_id) for point in self.points],
+                      sorted(self.buttons_config.items(), key=lambda item: str(item[0]))))
+        state = hashlib.sha1(state.encode("utf-8")).hexdigest()
+        if self._kml_cache is not None and self._kml_cache[0] == state:
+            return self._kml_cache[1], self._kml_cache[2]
+
+        points_ordered = sorted(self.points, key=lambda p: p.shape_id)
+        # transform all points to WGS84 in one batch
+        lons, lats = transform_coordinates([point.QgsPnt.x() for point in points_ordered],
+                                           [point.QgsPnt.y() for point in points_ordered],
+                                           self.sampling_layer.crs(), QgsCoordinateReferenceSystem("EPSG:4326"))
+        lon_lat = {point.shape_id: (lon, lat) for point, lon, lat in zip(points_ordered, lons.tolist(), lats.tolist())}
+
+        def kml_color(color):
+            # KML color is aabbggrr
+            color = QColor(color)
+            return "ff{:02x}{:02x}{:02x}".format(color.blue(), color.green(), color.red())
+
+        kml = []
+        for classif_id, button in list(self.buttons_config.items()) + [("none", {"color": "gray"})]:
+            kml.append('<Style id="class_{}"><IconStyle><color>{}</color><scale>0.8</scale><Icon><href>'
+                       'http://maps.google.com/mapfiles/kml/shapes/placemark_circle.png</href></Icon></IconStyle>'
+                       '</Style>'.format(classif_id, kml_color(button["color"])))
+        for point in points_ordered:
+            button = self.buttons_config.get(point.classif_id) if point.is_classified else None
+            description = "Classified as: <font color='{color}'><b> {class_name}</b></font><br/>" \
+                          "Samp. file: <em> {samp_file} </em><br/>AcATaMa Qgis-plugin".format(
+                color=button["color"] if button else "gray",
+                class_name=escape(button["name"]) if button else "not classified",
+                samp_file=escape(self.sampling_layer.name()))
+            kml.append('<Placemark id="sample_{id}"><name>Sampling Point ID {id}</name><styleUrl>#class_{style}'
+                       '</styleUrl><description><![CDATA[{desc}]]></description><Point><coordinates>{lon},{lat}'
+                       '</coordinates></Point></Placemark>'.format(
+                id=point.shape_id, style=point.classif_id if button else "none", desc=description,
+                lon=lon_lat[point.shape_id][0], lat=lon_lat[point.shape_id][1]))
+
+        self._kml_cache = (state, "\n".join(kml), lon_lat)
+        return self._kml_cache[1], self._kml_cache[2]
+
+    def get_kml(self, fly_to_sample=None, look_at_range=1000):
+        """KML document with all samples, optionally with the view (LookAt) to a sample"""
+        kml_body, lon_lat = self.get_kml_body()
+        look_at = ""
+        if fly_to_sample is not None:
+            lon, lat = lon_lat[fly_to_sample.shape_id]
+            look_at = "<LookAt><longitude>{}</longitude><latitude>{}</latitude><range>{}</range></LookAt>".format(
+                lon, lat, look_at_range)
+        return '<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2">' \
+               '<Document><name>{name}</name>{look_at}\n{body}\n</Document></kml>'.format(
+            name=escape(self.sampling_layer.name()), look_at=look_at, body=kml_body)
+
+    @wait_process
+    def write_kml_for_google_earth(self, kml_dir, fly_to_sample, look_at_range=1000):
+        """Write the self-contained KML (the same document of the KMZ export, without network
+        links) of all samples with the view (LookAt) to the sample, for fly to it in Google
+        Earth. The samples body is reused from the cache while the samples don't change
+
+        Returns:
+            str: the KML file to open
+        """
+        kml_file = os.path.join(kml_dir, "{}.kml".format(self.sampling_layer.name()))
+        with open(kml_file, "w") as outfile:
+            outfile.write(self.get_kml(fly_to_sample, look_at_range))
+        return kml_file
+
+    @wait_process
+    def save_kmz(self, file_out):
+        """Export all samples with their classification to a KMZ file (without network links)"""
+        with zipfile.ZipFile(file_out, "w", zipfile.ZIP_DEFLATED) as kmz:
+            kmz.writestr("doc.kml", self.get_kml())
+
     @wait_process
     def save_config(self, file_out):
         import yaml
@@ -143,6 +487,8 @@ class Classification(object):
         data["is_completed"] = self.is_completed
         data["view_widgets_config"] = self.view_widgets_config
         data["classification_buttons"] = self.buttons_config
+        data["store"] = {"path": self.store.db_path, "interpreter": self.store.interpreter,
+                         "wal": self.store.wal} if self.store else None
 
         # save samples status
         points_config = {}
@@ -163,11 +509,48 @@ class Classification(object):
                 "z_score": self.accuracy_assessment.z_score,
                 "csv_separator": self.accuracy_assessment.csv_separator,
                 "csv_decimal": self.accuracy_assessment.csv_decimal,
+                "bootstrap_resamples": self.accuracy_assessment.bootstrap_resamples,
+                "sampling_config": self.accuracy_assessment.sampling_config,
+                "thematic_pixels_count": self.accuracy_assessment.get_thematic_pixels_count_config(),
             }
 
         with open(file_out, 'w') as yaml_file:
             yaml.dump(data, yaml_file)
 
+    def restore_samples_status(self, yaml_config, attach_store=True):
+        """Restore the order and the classification status of the samples saved in the
+        yaml config, then the labels of the shared store if it is configured
+
+        Args:
+            yaml_config (dict): the classification config
+            attach_store (bool): attach the shared store saved in the config (interactive
+                sessions), when False the store is not opened and its claims are not touched
+        """
+        # hash the points by shape id (the first point for each id)
+        points_by_id = {}
+        for point in self.points:
+            points_by_id.setdefault(point.shape_id, point)
+        # restore the samples order, for the points saved that exist in shape file
+        points_ordered = [points_by_id[shape_id] for shape_id in yaml_config["points_order"]
+                          if shape_id in points_by_id]
+        # added new point inside shape file that not exists in yaml config
+        for new_point_id in set(points_by_id) - set(yaml_config["points_order"]):
+            points_ordered.append(points_by_id[new_point_id])
+        # reassign points loaded and ordered
+        self.points = points_ordered
+        # restore point status classification
+        for status in yaml_config["points"].values():
+            if status["shape_id"] in points_by_id:
+                point_to_restore = points_by_id[status["shape_id"]]
+                point_to_restore.classif_id = status["classif_id"]
+                if point_to_restore.classif_id is not None:
+                    point_to_restore.is_classified = True
+        # restore the shared store of the labels and sync with it
+        if attach_store and yaml_config.get("store") and os.path.isfile(yaml_config["store"]["path"]):
+            self.attach_store(yaml_config["store"]["path"], interpreter=yaml_config["store"]["interpreter"],
+                              wal=yaml_config["store"].get("wal", False))
+        self.reload_classification_status()
+
     @wait_process
     def load_config(self, yaml_config):
         from AcATaMa.gui.acatama_dockwidget import AcATaMaDockWidget as AcATaMa
@@ -208,26 +591,9 @@ class Classification(object):
             if "layer_name" not in x:
                 x["layer_name"] = None
 
-        # restore the samples order
-        points_ordered = []
-        for shape_id in yaml_config["points_order"]:
-            # point saved exist in shape file
-            if shape_id in [p.shape_id for p in self.points]:
-                points_ordered.append([p for p in self.points if p.shape_id == shape_id][0])
-        # added new point inside shape file that not exists in yaml config
-        for new_point_id in set([p.shape_id for p in self.points]) - set(yaml_config["points_order"]):
-            points_ordered.append([p for p in self.points if p.shape_id == new_point_id][0])
-        # reassign points loaded and ordered
-        self.points = points_ordered
-        # restore point status classification
-        for status in yaml_config["points"].values():
-            if status["shape_id"] in [p.shape_id for p in self.points]:
-                point_to_restore = [p for p in self.points if p.shape_id == status["shape_id"]][0]
-                point_to_restore.classif_id = status["classif_id"]
-                if point_to_restore.classif_id is not None:
-                    point_to_restore.is_classified = True
+        # restore the samples order and their classification status
+        self.restore_samples_status(yaml_config)
         # update the status and labels plugin with the current sampling classification
-        self.reload_classification_status()
         AcATaMa.dockwidget.update_the_status_of_classification()
         # define if this classification was made with thematic classes
         if self.buttons_config and yaml_config["thematic_raster"]["path"] and \
@@ -241,12 +607,7 @@ class Classification(object):
         if "accuracy_assessment_dialog" in yaml_config:
             from AcATaMa.core.accuracy_assessment import AccuracyAssessment
             accuracy_assessment = AccuracyAssessment(self)
-            area_unit, success = QgsUnitTypes.stringToAreaUnit(yaml_config["accuracy_assessment_dialog"]["area_unit"])
-            if success:
-                accuracy_assessment.area_unit = area_unit
-            accuracy_assessment.z_score = yaml_config["accuracy_assessment_dialog"]["z_score"]
-            accuracy_assessment.csv_separator = yaml_config["accuracy_assessment_dialog"]["csv_separator"]
-            accuracy_assessment.csv_decimal = yaml_config["accuracy_assessment_dialog"]["csv_decimal"]
+            accuracy_assessment.restore_config(yaml_config["accuracy_assessment_dialog"])
             self.accuracy_assessment = accuracy_assessment
 
     @wait_process
@@ -254,82 +615,143 @@ class Classification(object):
         from AcATaMa.gui.acatama_dockwidget import AcATaMaDockWidget as AcATaMa
         # update all points from file and restore its status classification
         points_from_shapefile = self.get_points_from_shapefile()
-        modified = 0
-        for point in self.points:
-            if point.shape_id in [p.shape_id for p in points_from_shapefile]:
-                point_to_restore = [p for p in points_from_shapefile if p.shape_id == point.shape_id][0]
-                point_to_restore.classif_id = point.classif_id
-                if point_to_restore.classif_id is not None:
-                    point_to_restore.is_classified = True
-                if point.QgsPnt != point_to_restore.QgsPnt:
-                    modified += 1
-        # calc added/removed changes
-        added = len(set([p.shape_id for p in points_from_shapefile]) - set([p.shape_id for p in self.points]))
-        removed = len(set([p.shape_id for p in self.points]) - set([p.shape_id for p in points_from_shapefile]))
-        # adjust the current sample id if some points are eliminated and its located before it
-        for rm_shape_id in set([p.shape_id for p in self.points]) - set([p.shape_id for p in points_from_shapefile]):
-            if [p.shape_id for p in self.points].index(rm_shape_id) <= self.current_sample_idx:
-                self.current_sample_idx -= 1
+        # hash the points from file by shape id: {shape_id: [(x, y, ClassificationPoint), ...]},
+        # a list by id to keep all points when the file has duplicate ids
+        new_points = {}
+        for p in points_from_shapefile:
+            new_points.setdefault(p.shape_id, []).append((p.QgsPnt.x(), p.QgsPnt.y(), p))
+        duplicated = sum(len(points) - 1 for points in new_points.values())
+
+        # diff the current points against the points from file in one pass,
+        # keeping the current order of the samples, the points with the same id
+        # are matched in the order of the file
+        points_reloaded = []
+        modified = removed = removed_before_current = 0
+        for idx, point in enumerate(self.points):
+            if not new_points.get(point.shape_id):
+                removed += 1
+                # adjust the current sample id if some points are eliminated and its located before it
+                if idx <= self.current_sample_idx:
+                    removed_before_current += 1
+                continue
+            x, y, point_to_restore = new_points[point.shape_id].pop(0)
+            point_to_restore.classif_id = point.classif_id
+            if point_to_restore.classif_id is not None:
+                point_to_restore.is_classified = True
+            if (point.QgsPnt.x(), point.QgsPnt.y()) != (x, y):
+                modified += 1
+            points_reloaded.append(point_to_restore)
+        # the points that remain are new in the file
+        added = sum(len(points) for points in new_points.values())
+        points_reloaded += [p for points in new_points.values() for _, _, p in points]
+        self.current_sample_idx = max(self.current_sample_idx - removed_before_current, 0)
+        if duplicated:
+            iface.messageBar().pushMessage("AcATaMa", "The sampling file has {} points with duplicate id, "
+                                                      "all points were kept but its classification is restored "
+                                                      "in the order of the file".format(duplicated),
+                                           level=Qgis.Warning)
+
         # check if sampling has not changed
         if modified == 0 and added == 0 and removed == 0:
             iface.messageBar().pushMessage("AcATaMa", "The sampling file has not detected changes",
                                            level=Qgis.Success)
             return
         # reassign points
-        self.points = points_from_shapefile
+        self.points = points_reloaded
+        self.thematic_cache = {}
         # update the status and labels plugin with the current sampling classification
         self.reload_classification_status()
         AcATaMa.dockwidget.update_the_status_of_classification()
         # notify
-        iface.messageBar().pushMessage("AcATaMa", "Sampling file reloaded successfully: {} modified,"
+        iface.messageBar().pushMessage("AcATaMa", "Sampling file reloaded successfully: {} modified, "
                                                   "{} added and {} removed".format(modified, added, removed),
                                        level=Qgis.Success)
 
     @wait_process
     def save_sampling_classification(self, file_out):
-        crs = self.sampling_layer.crs().toWkt()
-        # create layer
-        vlayer = QgsVectorLayer("Point?crs=" + crs, "temporary_points", "memory")
-        pr = vlayer.dataProvider()
-        # add fields
-        if self.with_thematic_classes:
-            pr.addAttributes([QgsField("ID", QVariant.Int),
-                              QgsField("Class Name", QVariant.String),
-                              QgsField("Classified", QVariant.Int),
-                              QgsField("Thematic Class", QVariant.Int),
-                              QgsField("Match", QVariant.String)])
-        else:
-            pr.addAttributes([QgsField("ID", QVariant.Int),
-                              QgsField("Class Name", QVariant.String),
-                              QgsField("Classif ID", QVariant.Int)])
-        vlayer.updateFields()  # tell the vector layer to fetch changes from the provider
+        points_ordered = sorted(self.points, key=lambda p: p.shape_id)
 
+        # get the thematic values for all points in one batch
         if self.with_thematic_classes:
             from AcATaMa.gui.acatama_dockwidget import AcATaMaDockWidget as AcATaMa
             ThematicR = Raster(file_selected_combo_box=AcATaMa.dockwidget.QCBox_ThematicRaster,
                                band=int(AcATaMa.dockwidget.QCBox_band_ThematicRaster.currentText()),
                                nodata=int(AcATaMa.dockwidget.nodata_ThematicRaster.value()))
+            thematic_values = ThematicR.get_pixel_values_from_pnts(
+                [point.QgsPnt for point in points_ordered if point.is_classified], crs=self.sampling_layer.crs())
+            thematic_values = iter(thematic_values)
 
-        points_ordered = sorted(self.points, key=lambda p: p.shape_id)
-        for point in points_ordered:
-            # add a feature
-            feature = QgsFeature()
-            feature.setGeometry(point.QgsGeom)
-            name = self.buttons_config[point.classif_id]["name"] if point.is_classified else NULL
-            if self.with_thematic_classes:
-                classified = int(
-                    self.buttons_config[point.classif_id]["thematic_class"]) if point.is_classified else NULL
-                thematic = int(ThematicR.get_pixel_value_from_pnt(point.QgsPnt)) \
-                    if point.is_classified and ThematicR.get_pixel_value_from_pnt(point.QgsPnt) else NULL
-                match = ('Yes' if thematic == classified else 'No') if point.is_classified else NULL
-                feature.setAttributes([point.shape_id, name, classified, thematic, match])
-            else:
-                feature.setAttributes([point.shape_id, name, point.classif_id])
-            pr.addFeatures([feature])
-
-        vlayer.commitChanges()
-        vlayer.updateExtents()
-
-        file_format = \
-            "GPKG" if file_out.endswith(".gpkg") else "ESRI Shapefile" if file_out.endswith(".shp") else None
-        QgsVectorFileWriter.writeAsVectorFormat(vlayer, file_out, "System", self.sampling_layer.crs(), file_format)
+        # the attributes by column
+        shape_ids = [point.shape_id for point in points_ordered]
+        class_names = [self.buttons_config[point.classif_id]["name"] if point.is_classified else None
+                       for point in points_ordered]
+        if self.with_thematic_classes:
+            classified = [int(self.buttons_config[point.classif_id]["thematic_class"]) if point.is_classified
+                          else None for point in points_ordered]
+            thematic = [next(thematic_values) if point.is_classified else None for point in points_ordered]
+            thematic = [int(value) if value else None for value in thematic]
+            match = [None if value is None else 'Yes' if value == thematic_value else 'No'
+                     for value, thematic_value in zip(classified, thematic)]
+            # the field names of the shapefiles have max 10 characters
+            columns = [(("ID", ogr.OFTInteger), shape_ids), (("Class Name", ogr.OFTString), class_names),
+                       (("Classified", ogr.OFTInteger), classified),
+                       (("Thematic" if file_out.endswith(".shp") else "Thematic Class", ogr.OFTInteger), thematic),
+                       (("Match", ogr.OFTString), match)]
+        else:
+            classif_ids = [point.classif_id if point.is_classified else None for point in points_ordered]
+            columns = [(("ID", ogr.OFTInteger), shape_ids), (("Class Name", ogr.OFTString), class_names),
+                       (("Classif ID", ogr.OFTInteger), classif_ids)]
+
+        # create the output file and layer, without an intermediate memory layer
+        file_format = "ESRI Shapefile" if file_out.endswith(".shp") else "GPKG"
+        driver = ogr.GetDriverByName(file_format)
+        if os.path.exists(file_out):
+            driver.DeleteDataSource(file_out)
+        data_source = driver.CreateDataSource(file_out)
+        if data_source is None:
+            raise Exception("Could not create the file {}: {}".format(file_out, gdal.GetLastErrorMsg()))
+        srs = osr.SpatialReference()
+        srs.ImportFromWkt(self.sampling_layer.crs().toWkt())
+        layer = data_source.CreateLayer(os.path.splitext(os.path.basename(file_out))[0], srs, ogr.wkbPoint)
+        if layer is None:
+            raise Exception("Could not create the layer in the file {}: {}".format(file_out, gdal.GetLastErrorMsg()))
+        for (field_name, field_type), _ in columns:
+            layer.CreateField(ogr.FieldDefn(field_name, field_type))
+        layer_defn = layer.GetLayerDefn()
+
+        xs = np.array([point.QgsPnt.x() for point in points_ordered], dtype=np.float64)
+        ys = np.array([point.QgsPnt.y() for point in points_ordered], dtype=np.float64)
+        # write all features in one transaction, in one Arrow batch when it is available (GDAL >= 3.8)
+        layer.StartTransaction()
+        try:
+            import pyarrow
+        except ImportError:
+            pyarrow = None
+        if pyarrow is not None and hasattr(layer, "WritePyArrow") and points_ordered:
+            # 2D points in WKB (little endian): byte order (1), geometry type (4), x (8), y (8)
+            wkb_points = np.empty(len(xs), dtype=[("order", "u1"), ("type", "<u4"), ("x", "<f8"), ("y", "<f8")])
+            wkb_points["order"], wkb_points["type"], wkb_points["x"], wkb_points["y"] = 1, 1, xs, ys
+            wkb_offsets = np.arange(0, 21 * (len(xs) + 1), 21, dtype=np.int32)
+            wkb_geoms = pyarrow.Array.from_buffers(pyarrow.binary(), len(xs), [
+                None, pyarrow.py_buffer(wkb_offsets), pyarrow.py_buffer(wkb_points.tobytes())])
+            table = pyarrow.table(
+                [pyarrow.array(values, type=pyarrow.int64() if field_type == ogr.OFTInteger else pyarrow.string())
+                 for (_, field_type), values in columns] + [wkb_geoms],
+                names=[layer_defn.GetFieldDefn(i).GetName() for i in range(len(columns))] + ["wkb_geometry"])
+            for batch in table.to_batches():
+                if not layer.WritePyArrow(batch, options=["GEOMETRY_NAME=wkb_geometry"]):
+                    raise Exception("Could not write the samples in the file {}: {}".format(
+                        file_out, gdal.GetLastErrorMsg()))
+        else:
+            for x, y, *values in zip(xs.tolist(), ys.tolist(), *(values for _, values in columns)):
+                feature = ogr.Feature(layer_defn)
+                geom = ogr.Geometry(ogr.wkbPoint)
+                geom.AddPoint_2D(x, y)
+                feature.SetGeometry(geom)
+                for idx, value in enumerate(values):
+                    if value is not None:
+                        feature.SetField(idx, value)
+                layer.CreateFeature(feature)
+        layer.CommitTransaction()
+        # close and save the file
+        data_source = None
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ AcATaMa
+                                 A QGIS plugin
+ AcATaMa is a Qgis plugin for Accuracy Assessment of Thematic Maps
+                              -------------------
+        copyright            : (C) 2017-2019 by Xavier Corredor Llano, SMByC
+        email                : xcorredorl@ideam.gov.co
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import getpass
+import socket
+import sqlite3
+import time
+from contextlib import contextmanager
+
+
+class ClassificationStore(object):
+    """Storage of the samples labels of a classification in a SQLite database,
+    shared by several interpreters (QGIS instances) classifying the same sampling
+    at the same time. Each label is written as a row (no full file rewrites) with a
+    change sequence of the database, assigned inside the write transaction, so the
+    last label committed wins and the other interpreters pull the changes by this
+    sequence (not by the clock of the hosts, that can be skewed).
+
+    Samples can be claimed in batches by one interpreter, the claims expire after
+    the lease time so the unfinished batches return to the pool.
+    """
+
+    def __init__(self, db_path, interpreter=None, wal=False, timeout=30):
+        """
+        Args:
+            db_path (str): the SQLite file, it is created if not exists
+            interpreter (str): name of the interpreter, default user@hostname
+            wal (bool): use the WAL journal mode, readers and the writer don't block each
+                other but it needs shared memory, so all the QGIS instances must run on the
+                same host. Default the rollback journal, that works for a database in a
+                shared filesystem (network share) used from several hosts
+            timeout (int): seconds to wait for the lock of other writers
+        """
+        self.db_path = db_path
+        self.interpreter = interpreter or "{}@{}".format(getpass.getuser(), socket.gethostname())
+        self.wal = wal
+        # change sequence of the last change pulled from the database, the first pull
+        # gets all the samples
+        self.last_sync = -1
+        self.connection = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode={}".format("WAL" if wal else "DELETE"))
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS samples (
+                shape_id PRIMARY KEY,
+                sample_order INTEGER,
+                classif_id INTEGER,
+                updated_at REAL NOT NULL DEFAULT 0,
+                interpreter TEXT,
+                claimed_by TEXT,
+                claimed_at REAL,
+                change_seq INTEGER NOT NULL DEFAULT 0
+            );
+            """)
+        # stores created before the change sequence
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(samples)")]
+        if "change_seq" not in columns:
+            self.connection.execute("ALTER TABLE samples ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS samples_change_seq ON samples (change_seq)")
+
+    def close(self):
+        self.connection.close()
+
+    def next_change_seq(self):
+        """The change sequence for the writes of the current transaction, it must be called
+        inside the transaction (with the write lock), then all commits get an increasing
+        sequence in the order they are committed
+        """
+        return self.connection.execute("SELECT COALESCE(MAX(change_seq), 0) + 1 FROM samples").fetchone()[0]
+
+    @contextmanager
+    def transaction(self):
+        """Write transaction, it takes the write lock at the beginning"""
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    def init_samples(self, points):
+        """Register the samples of the classification, the labels already classified
+        locally are only kept for the samples that nobody has classified in the store,
+        with a new change sequence for the other interpreters
+        """
+        with self.transaction():
+            change_seq = self.next_change_seq()
+            self.connection.executemany(
+                "INSERT INTO samples (shape_id, sample_order, classif_id, updated_at, change_seq) "
+                "VALUES (?, ?, ?, 0, ?) "
+                "ON CONFLICT(shape_id) DO UPDATE SET classif_id = excluded.classif_id, "
+                "change_seq = excluded.change_seq "
+                "WHERE samples.updated_at = 0 AND samples.classif_id IS NULL AND excluded.classif_id IS NOT NULL",
+                [(point.shape_id, order, point.classif_id, change_seq)
+                 for order, point in enumerate(self._valid(points))])
+
+    def write_samples(self, points):
+        """Write (row-level) the label of the samples, the last label committed wins,
+        the time is only informative
+        """
+        with self.transaction():
+            change_seq = self.next_change_seq()
+            timestamp = time.time()
+            self.connection.executemany(
+                "INSERT INTO samples (shape_id, classif_id, updated_at, interpreter, change_seq) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(shape_id) DO UPDATE SET classif_id = excluded.classif_id, "
+                "updated_at = excluded.updated_at, interpreter = excluded.interpreter, "
+                "change_seq = excluded.change_seq",
+                [(point.shape_id, point.classif_id, timestamp, self.interpreter, change_seq)
+                 for point in self._valid(points)])
+
+    def pull_changes(self):
+        """Get the labels changed in the store since the last pull
+
+        Returns:
+            list: [(shape_id, classif_id, updated_at, interpreter), ...]
+        """
+        rows = self.connection.execute(
+            "SELECT shape_id, classif_id, updated_at, interpreter, change_seq FROM samples "
+            "WHERE change_seq > ? ORDER BY change_seq", (self.last_sync,)).fetchall()
+        if rows:
+            self.last_sync = rows[-1][4]
+        return [row[:4] for row in rows]
+
+    def claim_batch(self, size, lease=3600):
+        """Claim atomically a batch of samples not classified and not claimed by
+        other interpreters (or with the claim expired)
+
+        Returns:
+            list: the shape ids claimed
+        """
+        now = time.time()
+        with self.transaction():
+            shape_ids = [row[0] for row in self.connection.execute(
+                "SELECT shape_id FROM samples WHERE classif_id IS NULL AND "
+                "(claimed_by IS NULL OR claimed_by = ? OR claimed_at < ?) ORDER BY sample_order LIMIT ?",
+                (self.interpreter, now - lease, size))]
+            self.connection.executemany("UPDATE samples SET claimed_by = ?, claimed_at = ? WHERE shape_id = ?",
+                                        [(self.interpreter, now, shape_id) for shape_id in shape_ids])
+        return shape_ids
+
+    def release_claims(self):
+        with self.transaction():
+            self.connection.execute("UPDATE samples SET claimed_by = NULL, claimed_at = NULL WHERE claimed_by = ?",
+                                    (self.interpreter,))
+
+    def get_claimed_by_others(self, lease=3600):
+        return set(row[0] for row in self.connection.execute(
+            "SELECT shape_id FROM samples WHERE claimed_by IS NOT NULL AND claimed_by != ? AND claimed_at >= ?",
+            (self.interpreter, time.time() - lease)))
+
+    def merge_from(self, other_db_path):
+        """Merge the labels of other store file (e.g. from an interpreter that worked
+        offline), for each sample it keeps the most recent label by its time (the
+        stores don't share the change sequence), the labels merged get a new change
+        sequence for the other interpreters
+        """
+        self.connection.execute("ATTACH DATABASE ? AS other", (other_db_path,))
+        try:
+            with self.transaction():
+                change_seq = self.next_change_seq()
+                self.connection.execute(
+                    "INSERT INTO samples (shape_id, sample_order, classif_id, updated_at, interpreter, change_seq) "
+                    "SELECT shape_id, sample_order, classif_id, updated_at, interpreter, ? FROM other.samples WHERE true "
+                    "ON CONFLICT(shape_id) DO UPDATE SET classif_id = excluded.classif_id, "
+                    "updated_at = excluded.updated_at, interpreter = excluded.interpreter, "
+                    "change_seq = excluded.change_seq "
+                    "WHERE excluded.updated_at > samples.updated_at", (change_seq,))
+        finally:
+            self.connection.execute("DETACH DATABASE other")
+
+    @staticmethod
+    def _valid(points):
+        return (point for point in points if point.shape_id is not None)
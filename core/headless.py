@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ AcATaMa
+                                 A QGIS plugin
+ AcATaMa is a Qgis plugin for Accuracy Assessment of Thematic Maps
+                              -------------------
+        copyright            : (C) 2017-2019 by Xavier Corredor Llano, SMByC
+        email                : xcorredorl@ideam.gov.co
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Headless accuracy assessment from the classification config files (yaml) saved by
+the plugin, without the QGIS interface, e.g. for recompute the results of several
+projects in a pipeline. It uses the same estimators of the accuracy assessment dialog.
+
+Usage, with the python of QGIS and the parent directory of the plugin in the PYTHONPATH:
+
+    python -m AcATaMa.core.headless project_1.yml project_2.yml -o results/ -f csv json -p 4
+
+or for several thematic rasters (e.g. yearly maps) against the samples of one project,
+in a combined table:
+
+    python -m AcATaMa.core.headless project.yml -t map_2018.tif map_2019.tif map_2020.tif
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+from qgis.core import QgsApplication, QgsRasterLayer, QgsVectorLayer
+
+from AcATaMa.core.accuracy_assessment import AccuracyAssessment, compute_batch
+from AcATaMa.core.classification import Classification
+from AcATaMa.core.raster import Raster
+from AcATaMa.gui import accuracy_assessment_results
+
+qgs_app = None
+
+
+def init_qgis():
+    """Start QGIS without the interface in this process, if it is not running"""
+    global qgs_app
+    if QgsApplication.instance() is not None:
+        return
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    qgs_app = QgsApplication([], False)
+    if "QGIS_PREFIX_PATH" in os.environ:
+        QgsApplication.setPrefixPath(os.environ["QGIS_PREFIX_PATH"], True)
+    QgsApplication.initQgis()
+
+
+def load_accuracy_assessment(yaml_file):
+    """Restore the classification and the accuracy assessment settings from the
+    classification config file (yaml) saved by the plugin
+
+    Args:
+        yaml_file (str): the classification config file
+
+    Returns:
+        AccuracyAssessment: the accuracy assessment ready to compute
+    """
+    with open(yaml_file, 'r') as yaml_config_file:
+        yaml_config = yaml.load(yaml_config_file, Loader=yaml.FullLoader)
+
+    sampling_file = yaml_config["sampling_layer"]
+    if not os.path.isfile(sampling_file):
+        raise Exception("The sampling file saved in the config doesn't exist: {}".format(sampling_file))
+    thematic_file = yaml_config["thematic_raster"]["path"]
+    if not thematic_file or not os.path.isfile(thematic_file):
+        raise Exception("The thematic raster saved in the config doesn't exist: {}".format(thematic_file))
+
+    sampling_layer = QgsVectorLayer(sampling_file, os.path.splitext(os.path.basename(sampling_file))[0], "ogr")
+    classification = Classification(sampling_layer)
+    classification.buttons_config = yaml_config["classification_buttons"]
+    # only the labels saved in the config, without attaching the shared store of the
+    # interactive sessions
+    classification.restore_samples_status(yaml_config, attach_store=False)
+
+    thematic_layer = QgsRasterLayer(thematic_file, os.path.splitext(os.path.basename(thematic_file))[0], "gdal")
+    ThematicR = Raster(layer=thematic_layer, band=yaml_config["thematic_raster"].get("band") or 1,
+                       nodata=int(yaml_config["thematic_raster"]["nodata"]))
+
+    accuracy_assessment = AccuracyAssessment(classification, ThematicR=ThematicR)
+    if "accuracy_assessment_dialog" in yaml_config:
+        accuracy_assessment.restore_config(yaml_config["accuracy_assessment_dialog"])
+    if accuracy_assessment.area_unit is None:
+        accuracy_assessment.area_unit = accuracy_assessment.base_area_unit
+    classification.accuracy_assessment = accuracy_assessment
+    return accuracy_assessment
+
+
+def run_accuracy_assessment(yaml_file, output_dir=None, formats=("csv",)):
+    """Compute the accuracy assessment of a classification config file (yaml) and
+    export the results as <yaml name>_results.<format>
+
+    Args:
+        yaml_file (str): the classification config file
+        output_dir (str): the directory for the results, default the directory of the yaml file
+        formats (list): the output formats: csv, json, parquet (a file by table) or xlsx
+
+    Returns:
+        list: the files saved
+    """
+    init_qgis()
+    accuracy_assessment = load_accuracy_assessment(yaml_file)
+    if accuracy_assessment.classification.total_classified == 0:
+        raise Exception("The accuracy assessment needs at least one sample classified")
+    accuracy_assessment.compute()
+
+    output_dir = output_dir or os.path.dirname(os.path.abspath(yaml_file))
+    os.makedirs(output_dir, exist_ok=True)
+    file_out_base = os.path.join(output_dir, os.path.splitext(os.path.basename(yaml_file))[0] + "_results")
+    files_out = []
+    for output_format in formats:
+        file_out = file_out_base + "." + output_format
+        if output_format == "csv":
+            accuracy_assessment_results.export_to_csv(accuracy_assessment, file_out,
+                                                      accuracy_assessment.csv_separator,
+                                                      accuracy_assessment.csv_decimal)
+        elif output_format == "json":
+            accuracy_assessment_results.export_to_json(accuracy_assessment, file_out)
+        elif output_format == "parquet":
+            files_out += accuracy_assessment_results.export_to_parquet([accuracy_assessment], file_out)
+            continue
+        elif output_format == "xlsx":
+            accuracy_assessment_results.export_to_xlsx([accuracy_assessment], file_out)
+        else:
+            raise Exception("Output format not supported: {}".format(output_format))
+        files_out.append(file_out)
+    return files_out
+
+
+def run_batch(yaml_file, thematic_files, output_dir=None, formats=("csv",), max_workers=None):
+    """Compute the accuracy assessment of several thematic rasters against the samples
+    classified of a classification config file (yaml), with the same band, nodata and
+    settings of its thematic raster, and export the combined table of results as
+    <yaml name>_batch_results.<format>
+
+    Returns:
+        list: the files saved
+    """
+    init_qgis()
+    settings = load_accuracy_assessment(yaml_file)
+    if settings.classification.total_classified == 0:
+        raise Exception("The accuracy assessment needs at least one sample classified")
+    thematic_rasters = []
+    for thematic_file in thematic_files:
+        if not os.path.isfile(thematic_file):
+            raise Exception("The thematic raster doesn't exist: {}".format(thematic_file))
+        thematic_layer = QgsRasterLayer(thematic_file, os.path.splitext(os.path.basename(thematic_file))[0], "gdal")
+        thematic_rasters.append(Raster(layer=thematic_layer, band=settings.ThematicR.band,
+                                       nodata=settings.ThematicR.nodata))
+    accuracy_assessments = compute_batch(settings.classification, thematic_rasters, settings=settings,
+                                         max_workers=max_workers)
+
+    output_dir = output_dir or os.path.dirname(os.path.abspath(yaml_file))
+    os.makedirs(output_dir, exist_ok=True)
+    file_out_base = os.path.join(output_dir, os.path.splitext(os.path.basename(yaml_file))[0] + "_batch_results")
+    files_out = []
+    for output_format in formats:
+        file_out = file_out_base + "." + output_format
+        if output_format == "csv":
+            accuracy_assessment_results.export_batch_to_csv(accuracy_assessments, file_out,
+                                                            settings.csv_separator, settings.csv_decimal)
+        elif output_format == "json":
+            accuracy_assessment_results.export_batch_to_json(accuracy_assessments, file_out)
+        elif output_format == "parquet":
+            files_out += accuracy_assessment_results.export_to_parquet(accuracy_assessments, file_out)
+            continue
+        elif output_format == "xlsx":
+            accuracy_assessment_results.export_to_xlsx(accuracy_assessments, file_out)
+        else:
+            raise Exception("Output format not supported: {}".format(output_format))
+        files_out.append(file_out)
+    return files_out
+
+
+def run_in_process(args):
+    yaml_file, output_dir, formats = args
+    try:
+        return yaml_file, run_accuracy_assessment(yaml_file, output_dir, formats), None
+    except Exception as err:
+        return yaml_file, [], str(err)
+
+
+def run(yaml_files, output_dir=None, formats=("csv",), processes=None):
+    """Compute the accuracy assessment of several classification config files in
+    parallel, one process (with its own QGIS instance) by config file
+
+    Returns:
+        list: [(yaml_file, files saved, error or None), ...]
+    """
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_qgis) as executor:
+        return list(executor.map(run_in_process, [(yaml_file, output_dir, formats) for yaml_file in yaml_files]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m AcATaMa.core.headless",
+        description="Compute the accuracy assessment of AcATaMa classification config files (yaml)")
+    parser.add_argument("yaml_files", nargs="+", help="the classification config files saved by AcATaMa")
+    parser.add_argument("-o", "--output-dir", default=None,
+                        help="directory for the results, default the directory of each yaml file")
+    parser.add_argument("-f", "--formats", nargs="+", default=["csv"], choices=["csv", "json", "parquet", "xlsx"],
+                        help="output formats (default: csv), parquet needs pyarrow")
+    parser.add_argument("-p", "--processes", type=int, default=None,
+                        help="number of config files (or thematic rasters) computed in parallel "
+                             "(default: the cpu count)")
+    parser.add_argument("-t", "--thematic-rasters", nargs="+", default=None,
+                        help="assess these thematic rasters against the samples of one config file, "
+                             "in a combined table")
+    args = parser.parse_args(argv)
+
+    if args.thematic_rasters:
+        if len(args.yaml_files) != 1:
+            parser.error("the batch of thematic rasters needs only one config file")
+        files_out = run_batch(args.yaml_files[0], args.thematic_rasters, args.output_dir, args.formats,
+                              args.processes)
+        print("{}: {}".format(args.yaml_files[0], ", ".join(files_out)))
+        return 0
+
+    failed = 0
+    for yaml_file, files_out, error in run(args.yaml_files, args.output_dir, args.formats, args.processes):
+        if error:
+            failed += 1
+            print("{}: failed, {}".format(yaml_file, error), file=sys.stderr)
+        else:
+            print("{}: {}".format(yaml_file, ", ".join(files_out)))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ AcATaMa
+                                 A QGIS plugin
+ AcATaMa is a Qgis plugin for Accuracy Assessment of Thematic Maps
+                              -------------------
+        copyright            : (C) 2017-2019 by Xavier Corredor Llano, SMByC
+        email                : xcorredorl@ideam.gov.co
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import os
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from osgeo import gdal
+from qgis.core import QgsTask, QgsMapSettings, QgsMapRendererTask, QgsRasterLayer
+
+from AcATaMa.utils.qgis_utils import get_file_path_of_layer
+
+
+def is_data_chip_layer(layer):
+    """The chips of local or shared raster files are read with the original data
+    (the style of the layer is applied over them), the other layers (web services,
+    vectors) are rendered as images
+    """
+    return isinstance(layer, QgsRasterLayer) and layer.providerType() == "gdal" and \
+        os.path.isfile(get_file_path_of_layer(layer))
+
+
+def read_data_chip(args):
+    src_path, chip_path, extent, extent_srs = args
+    if os.path.isfile(chip_path):
+        return chip_path
+    chip = gdal.Translate(chip_path, src_path, format="GTiff", projWinSRS=extent_srs,
+                          projWin=[extent.xMinimum(), extent.yMaximum(), extent.xMaximum(), extent.yMinimum()],
+                          creationOptions=["TILED=YES", "COMPRESS=DEFLATE"])
+    if chip is None:
+        return None
+    del chip
+    return chip_path
+
+
+class ImageChipsTask(QgsTask):
+    """Build an offline cache of image chips for a classification campaign,
+    for each sample and each view it saves (in background) a GeoTIFF of the
+    window displayed in the view (fit to sample radius with the scale factor),
+    then it builds a VRT by view with all chips for render it in the view
+    instead of the original layer (independent of network latency).
+
+    The chips already built are reused, so the campaign can be resumed.
+    """
+
+    def __init__(self, classification, cache_dir, radius, views, max_workers=None):
+        """
+        Args:
+            classification (Classification): the classification with the samples
+            cache_dir (str): the directory for the chips
+            radius (float): the fit to sample radius
+            views (list): [(view_id, layer, scale_factor, output_size), ...] for each active view
+            max_workers (int): number of threads for read the chips, default the cpu count
+        """
+        QgsTask.__init__(self, "AcATaMa - Building the image chips", QgsTask.CanCancel)
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers or multiprocessing.cpu_count()
+        self.sampling_crs = classification.sampling_layer.crs()
+        # {view_id: vrt_file}
+        self.vrt_files = {}
+        self.data_chips = []
+        self.chips_by_view = {}
+        for view_id, layer, scale_factor, output_size in views:
+            view_dir = os.path.join(cache_dir, "view_{}".format(view_id + 1))
+            os.makedirs(view_dir, exist_ok=True)
+            self.chips_by_view[view_id] = []
+            for sample in classification.points:
+                extent = sample.get_fit_extent(radius)
+                extent.scale(scale_factor)
+                chip_path = os.path.join(view_dir, "sample_{}.tif".format(sample.shape_id))
+                self.chips_by_view[view_id].append(chip_path)
+
+                if is_data_chip_layer(layer):
+                    self.data_chips.append((get_file_path_of_layer(layer), chip_path,
+                                            extent, self.sampling_crs.toWkt()))
+                elif not os.path.isfile(chip_path):
+                    # web services and vectors are rendered (in the task manager pool) as
+                    # georeferenced images, before run this task
+                    settings = QgsMapSettings()
+                    settings.setLayers([layer])
+                    settings.setDestinationCrs(self.sampling_crs)
+                    settings.setOutputSize(output_size)
+                    settings.setExtent(extent)
+                    render_task = QgsMapRendererTask(settings, chip_path, "TIF")
+                    render_task.setSaveWorldFile(True)
+                    self.addSubTask(render_task, [], QgsTask.ParentDependsOnSubTask)
+
+    def run(self):
+        if self.data_chips:
+            executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            futures = [executor.submit(read_data_chip, args) for args in self.data_chips]
+            for num, _ in enumerate(as_completed(futures), start=1):
+                if self.isCanceled():
+                    [future.cancel() for future in futures]
+                    executor.shutdown()
+                    return False
+                self.setProgress(num * 100 / len(self.data_chips))
+            executor.shutdown()
+
+        # build a virtual raster by view with all chips available
+        for view_id, chips in self.chips_by_view.items():
+            chips = [chip for chip in chips if os.path.isfile(chip)]
+            if not chips:
+                continue
+            vrt_file = os.path.join(self.cache_dir, "view_{}.vrt".format(view_id + 1))
+            vrt = gdal.BuildVRT(vrt_file, chips)
+            if vrt is None:
+                continue
+            del vrt
+            self.vrt_files[view_id] = vrt_file
+        return True
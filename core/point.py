@@ -33,19 +33,29 @@ class Point(object):
 
     def set_qgis_pnt(self, x, y):
         self.QgsPnt = QgsPointXY(x, y)
-        self.QgsGeom = QgsGeometry.fromPointXY(self.QgsPnt)
+        self._QgsGeom = None
+
+    @property
+    def QgsGeom(self):
+        # create the geometry only when it is needed
+        if self._QgsGeom is None:
+            self._QgsGeom = QgsGeometry.fromPointXY(self.QgsPnt)
+        return self._QgsGeom
 
 
 class RandomPoint(Point):
     """Class for generate, check and validate the random points
     """
 
-    def __init__(self, extent):
+    def __init__(self, extent, crs=None):
         """Generate the random x and y between boundaries
 
         Args:
             extent (QgsRectangle): extent boundaries for generate random points inside it
+            crs (QgsCoordinateReferenceSystem): the crs of the extent and the sampling layer,
+                the points are transformed to the crs of the rasters to check
         """
+        self.crs = crs
         rx = extent.xMinimum() + (extent.xMaximum() - extent.xMinimum()) * random.random()
         ry = extent.yMinimum() + (extent.yMaximum() - extent.yMinimum()) * random.random()
         self.set_qgis_pnt(rx, ry)
@@ -54,7 +64,7 @@ class RandomPoint(Point):
         """Check if the point is in valid data in thematic raster
         """
         try:
-            point_value_in_thematic = int(ThematicR.get_pixel_value_from_pnt(self.QgsPnt))
+            point_value_in_thematic = int(ThematicR.get_pixel_value_from_pnt(self.QgsPnt, self.crs))
         except:
             return False
         if point_value_in_thematic == ThematicR.nodata:
@@ -85,7 +95,7 @@ class RandomPoint(Point):
         """Check if point is at least in one pixel values set in the categorical raster
         """
         if pixel_values is not None:
-            point_value_in_categ_raster = int(CategoricalR.get_pixel_value_from_pnt(self.QgsPnt))
+            point_value_in_categ_raster = int(CategoricalR.get_pixel_value_from_pnt(self.QgsPnt, self.crs))
             if point_value_in_categ_raster not in pixel_values:
                 return False
         return True
@@ -93,7 +103,7 @@ class RandomPoint(Point):
     def in_categorical_raster_StraRS(self, pixel_values, number_of_samples, CategoricalR, nPointsInCategories):
         """Check if point pass the number of samples in the category or is nodata
         """
-        pixel_value_in_categ_raster = int(CategoricalR.get_pixel_value_from_pnt(self.QgsPnt))
+        pixel_value_in_categ_raster = int(CategoricalR.get_pixel_value_from_pnt(self.QgsPnt, self.crs))
         if pixel_value_in_categ_raster == CategoricalR.nodata or pixel_value_in_categ_raster not in pixel_values:
             return False
         self.index_pixel_value = pixel_values.index(pixel_value_in_categ_raster)
@@ -105,7 +115,7 @@ class RandomPoint(Point):
         """Check if the pixel have at least the minimum the neighbors with the
         same class of the pixel
         """
-        pixel_class_value = int(ThematicR.get_pixel_value_from_pnt(self.QgsPnt))
+        pixel_class_value = int(ThematicR.get_pixel_value_from_pnt(self.QgsPnt, self.crs))
 
         pixel_size_x = ThematicR.qgs_layer.rasterUnitsPerPixelX()
         pixel_size_y = ThematicR.qgs_layer.rasterUnitsPerPixelY()
@@ -144,9 +154,13 @@ class ClassificationPoint(Point):
         # status for this point
         self.is_classified = False
 
+    def get_fit_extent(self, radius):
+        # extent centered on the sample with min radius
+        return QgsRectangle(self.QgsPnt.x()-radius, self.QgsPnt.y()-radius,
+                            self.QgsPnt.x()+radius, self.QgsPnt.y()+radius)
+
     def fit_to(self, view_widget, radius):
         # fit to current sample with min radius of extent
-        fit_extent = QgsRectangle(self.QgsPnt.x()-radius, self.QgsPnt.y()-radius,
-                                  self.QgsPnt.x()+radius, self.QgsPnt.y()+radius)
+        fit_extent = self.get_fit_extent(radius)
         with block_signals_to(view_widget.render_widget.canvas):
             view_widget.render_widget.set_extents_and_scalefactor(fit_extent)
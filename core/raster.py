@@ -20,18 +20,20 @@
 """
 import os
 import tempfile
+import threading
+import numpy as np
+from collections import OrderedDict
 from math import isnan
 from osgeo import gdal
 from subprocess import call
-import xml.etree.ElementTree as ET
 
-from qgis.core import QgsRaster, QgsPointXY, Qgis, QgsVectorFileWriter, QgsCoordinateReferenceSystem, \
-    QgsCoordinateTransform, QgsProject
+from qgis.core import QgsRaster, QgsPointXY, Qgis, QgsVectorFileWriter, QgsFeatureRequest, QgsTask
 from qgis.utils import iface
 from qgis.PyQt.QtWidgets import QMessageBox
 
-from AcATaMa.utils.others_utils import get_pixel_count_by_pixel_values
-from AcATaMa.utils.qgis_utils import get_file_path_of_layer
+from AcATaMa.utils.others_utils import get_pixel_count_by_pixel_values, get_style_class_table
+from AcATaMa.utils.qgis_utils import get_file_path_of_layer, get_coordinate_transform, get_crs_key, \
+    transform_coordinates
 from AcATaMa.utils.system_utils import wait_process
 
 
@@ -54,16 +56,13 @@ def do_clipping_with_shape(target_layer, shape_layer, out_path, dst_nodata=None)
     # clipping in shape
     return_code = call('gdalwarp -multi -wo NUM_THREADS=ALL_CPUS --config GDALWARP_IGNORE_BAD_CUTLINE YES'
                        ' -cutline "{}" {} "{}" "{}"'.format(shape_file, dst_nodata, target_file, tmp_file), shell=True)
-    # create convert coordinates
-    crsSrc = QgsCoordinateReferenceSystem(shape_layer.crs())
-    crsDest = QgsCoordinateReferenceSystem(target_layer.crs())
-    xform = QgsCoordinateTransform(crsSrc, crsDest, QgsProject.instance())
-    # trim the boundaries using the maximum extent for all features
+    # trim the boundaries using the maximum extent for all features, requested in the
+    # target crs (transformed with the shared transform between both crs)
+    request = QgsFeatureRequest().setNoAttributes()
+    if shape_layer.crs() != target_layer.crs():
+        request.setCoordinateTransform(get_coordinate_transform(shape_layer.crs(), target_layer.crs()))
     box = []
-    for f in shape_layer.getFeatures():
-        g = f.geometry()
-        g.transform(xform)
-        f.setGeometry(g)
+    for f in shape_layer.getFeatures(request):
         if box:
             box.combineExtentWith(f.geometry().boundingBox())
         else:
@@ -96,22 +95,11 @@ def get_nodata_value(layer, band=1):
 
 
 def get_color_table(layer, band=1, nodata=None):
-    current_style = layer.styleManager().currentStyle()
-    layer_style = layer.styleManager().style(current_style)
-    xml_style_str = layer_style.xmlData()
-    xml_style = ET.fromstring(xml_style_str)
-
-    # for singleband_pseudocolor
-    xml_style_items = xml_style.findall(
-        'pipe/rasterrenderer[@band="{}"]/rastershader/colorrampshader/item'.format(band))
-    if not xml_style_items:
-        # for unique values
-        xml_style_items = xml_style.findall('pipe/rasterrenderer[@band="{}"]/colorPalette/paletteEntry'.format(band))
-
-    check_int_values = [int(float(xml_item.get("value"))) == float(xml_item.get("value")) for xml_item in
-                        xml_style_items]
-
-    if not xml_style_items or False in check_int_values:
+    style_items = get_style_class_table(layer, band)
+
+    check_int_values = [int(float(value)) == float(value) for value, _, _ in style_items]
+
+    if not style_items or False in check_int_values:
         msg = "The selected layer \"{}\" {}doesn't have an appropriate colors/values style for AcATaMa, " \
               "it must be unique values or singleband pseudocolor with integer values. " \
               "<a href='https://smbyc.github.io/AcATaMa/#types-of-thematic-rasters-accepted-in-acatama'>" \
@@ -120,28 +108,88 @@ def get_color_table(layer, band=1, nodata=None):
         return
 
     color_table = {"Pixel Value": [], "Red": [], "Green": [], "Blue": [], "Alpha": []}
-    for item in xml_style_items:
-        if nodata is not None and int(item.get("value")) == int(nodata):
+    for value, color, alpha in style_items:
+        if nodata is not None and int(value) == int(nodata):
             continue
 
-        color_table["Pixel Value"].append(int(item.get("value")))
+        color_table["Pixel Value"].append(int(value))
 
-        item_color = item.get("color").lstrip('#')
+        item_color = color.lstrip('#')
         item_color = tuple(int(item_color[i:i+2], 16) for i in (0, 2, 4))
 
         color_table["Red"].append(item_color[0])
         color_table["Green"].append(item_color[1])
         color_table["Blue"].append(item_color[2])
-        color_table["Alpha"].append(int(item.get("alpha")))
+        color_table["Alpha"].append(int(alpha))
 
     return color_table
 
 
+def has_overviews(file_path, bands=None):
+    """Check if all the bands (e.g. the bands rendered) of the raster file have overviews
+
+    Args:
+        file_path (str): the raster file
+        bands (list): the bands to check, default all bands of the file
+    """
+    gdal_file = gdal.Open(file_path, gdal.GA_ReadOnly)
+    if gdal_file is None:
+        return False
+    bands = bands or range(1, gdal_file.RasterCount + 1)
+    return all(gdal_file.GetRasterBand(band).GetOverviewCount() > 0 for band in bands
+               if 0 < band <= gdal_file.RasterCount)
+
+
+class BuildOverviewsTask(QgsTask):
+    """Build in background the missing overviews (external .ovr) of raster files"""
+
+    def __init__(self, file_paths, resampling="NEAREST", min_size=256):
+        QgsTask.__init__(self, "AcATaMa - Building the overviews", QgsTask.CanCancel)
+        self.file_paths = file_paths
+        self.resampling = resampling
+        self.min_size = min_size
+
+    def run(self):
+        for num, file_path in enumerate(self.file_paths):
+            if has_overviews(file_path):
+                continue
+            gdal_file = gdal.Open(file_path, gdal.GA_ReadOnly)
+            if gdal_file is None:
+                continue
+            # levels until the smallest overview has less than min_size pixels
+            levels, level = [], 2
+            while min(gdal_file.RasterXSize, gdal_file.RasterYSize) / level >= self.min_size:
+                levels.append(level)
+                level *= 2
+            if not levels:
+                continue
+
+            def progress(complete, message, data):
+                self.setProgress((num + complete) * 100 / len(self.file_paths))
+                return 0 if self.isCanceled() else 1
+
+            if gdal_file.BuildOverviews(self.resampling, levels, progress) != 0:
+                return False
+            del gdal_file
+        return True
+
+
 class Raster(object):
-    def __init__(self, file_selected_combo_box, band=1, nodata=None):
+    # the pixel indices of the batches of points looked up, by points (and its crs) and
+    # raster, for reuse them in the next lookups of the same samples (the last ones)
+    pixel_indices_cache = OrderedDict()
+    pixel_indices_cache_size = 8
+    pixel_indices_lock = threading.Lock()
+
+    def __init__(self, file_selected_combo_box=None, band=1, nodata=None, layer=None):
         from AcATaMa.utils.qgis_utils import get_current_file_path_in
-        self.file_path = get_current_file_path_in(file_selected_combo_box)
-        self.qgs_layer = file_selected_combo_box.currentLayer()
+        if file_selected_combo_box is not None:
+            self.file_path = get_current_file_path_in(file_selected_combo_box)
+            self.qgs_layer = file_selected_combo_box.currentLayer()
+        else:
+            # from a raster layer instead of the layer selected in a combobox
+            self.file_path = get_file_path_of_layer(layer) if os.path.isfile(get_file_path_of_layer(layer)) else None
+            self.qgs_layer = layer
         self.band = band
         self.nodata = nodata if nodata != -1 else None
         self.pixel_counts_by_value = None
@@ -152,12 +200,113 @@ class Raster(object):
     def get_pixel_value_from_xy(self, x, y):
         return self.qgs_layer.dataProvider().identify(QgsPointXY(x, y), QgsRaster.IdentifyFormatValue).results()[self.band]
 
-    def get_pixel_value_from_pnt(self, point):
+    def get_pixel_value_from_pnt(self, point, crs=None):
+        """Get the pixel value of the point, the crs of the point is the crs of
+        the raster if crs is None"""
+        if crs is not None and crs != self.qgs_layer.crs():
+            point = get_coordinate_transform(crs, self.qgs_layer.crs()).transform(point)
         return self.qgs_layer.dataProvider().identify(point, QgsRaster.IdentifyFormatValue).results()[self.band]
 
+    def get_pixel_indices(self, gdal_file, xs, ys, crs=None):
+        """Get the pixel indices in the raster of the coordinates, the coordinates
+        are transformed in one batch to the raster crs if they are in other crs. The
+        indices are cached by the coordinates and the raster, for the next lookups
+        of the same samples
+
+        Returns:
+            tuple: (rows, cols, inside) arrays, inside is if the point is inside the raster
+        """
+        geo_transform = gdal_file.GetGeoTransform()
+        key = (hash(xs.tobytes()), hash(ys.tobytes()), len(xs), get_crs_key(crs) if crs is not None else None,
+               self.file_path, os.path.getmtime(self.file_path), geo_transform,
+               gdal_file.RasterXSize, gdal_file.RasterYSize)
+        with Raster.pixel_indices_lock:
+            if key in Raster.pixel_indices_cache:
+                Raster.pixel_indices_cache.move_to_end(key)
+                return Raster.pixel_indices_cache[key]
+
+        if crs is not None and crs != self.qgs_layer.crs():
+            xs, ys = transform_coordinates(xs, ys, crs, self.qgs_layer.crs())
+        x_origin, pixel_width, _, y_origin, _, pixel_height = geo_transform
+        with np.errstate(invalid="ignore"):
+            cols = np.floor((xs - x_origin) / pixel_width)
+            rows = np.floor((ys - y_origin) / pixel_height)
+        # the points that can't be transformed (inf) are outside
+        inside = np.isfinite(cols) & np.isfinite(rows)
+        cols = np.where(inside, cols, -1).astype(np.int64)
+        rows = np.where(inside, rows, -1).astype(np.int64)
+        inside &= (cols >= 0) & (cols < gdal_file.RasterXSize) & (rows >= 0) & (rows < gdal_file.RasterYSize)
+
+        with Raster.pixel_indices_lock:
+            Raster.pixel_indices_cache[key] = (rows, cols, inside)
+            while len(Raster.pixel_indices_cache) > Raster.pixel_indices_cache_size:
+                Raster.pixel_indices_cache.popitem(last=False)
+        return rows, cols, inside
+
+    def get_pixel_values_from_pnts(self, points, crs=None):
+        """Get the pixel values for a list of points in one batch, the pixel
+        indices are computed vectorized (and cached) and each raster block that
+        contains at least one point is read only once
+
+        Args:
+            points (list): list of QgsPointXY
+            crs (QgsCoordinateReferenceSystem): the crs of the points (e.g. of the sampling
+                layer), if it is different to the raster crs all points are transformed in
+                one batch. Default the crs of the raster
+
+        Returns:
+            list: the pixel value for each point (same as get_pixel_value_from_pnt),
+                  None if the point is outside the raster or it is in the nodata (of
+                  the file or the nodata set)
+        """
+        if not points:
+            return []
+        # non file layers, use the identify by point
+        if self.file_path is None:
+            values = [self.get_pixel_value_from_pnt(point, crs) for point in points]
+            return [None if self.nodata is not None and value == self.nodata else value for value in values]
+
+        gdal_file = gdal.Open(self.file_path, gdal.GA_ReadOnly)
+        band = gdal_file.GetRasterBand(self.band)
+        band_nodata = band.GetNoDataValue()
+
+        xs = np.fromiter((point.x() for point in points), dtype=np.float64, count=len(points))
+        ys = np.fromiter((point.y() for point in points), dtype=np.float64, count=len(points))
+        rows, cols, inside = self.get_pixel_indices(gdal_file, xs, ys, crs)
+
+        # group the points by the raster block where they are
+        block_xsize, block_ysize = band.GetBlockSize()
+        blocks_per_row = (gdal_file.RasterXSize + block_xsize - 1) // block_xsize
+        points_idx = np.flatnonzero(inside)
+        block_ids = (rows[points_idx] // block_ysize) * blocks_per_row + cols[points_idx] // block_xsize
+        order = np.argsort(block_ids, kind="stable")
+        points_idx, block_ids = points_idx[order], block_ids[order]
+        groups_start = np.flatnonzero(np.diff(block_ids, prepend=-1))
+
+        values = np.full(len(points), np.nan)
+        for points_in_block in np.split(points_idx, groups_start[1:]):
+            if not len(points_in_block):
+                continue
+            block_row = rows[points_in_block[0]] // block_ysize
+            block_col = cols[points_in_block[0]] // block_xsize
+            xoff, yoff = int(block_col * block_xsize), int(block_row * block_ysize)
+            xsize = min(block_xsize, gdal_file.RasterXSize - xoff)
+            ysize = min(block_ysize, gdal_file.RasterYSize - yoff)
+            block_narray = band.ReadAsArray(xoff, yoff, xsize, ysize)
+            values[points_in_block] = block_narray[rows[points_in_block] - yoff, cols[points_in_block] - xoff]
+
+        # the nodata of the file and the nodata set, the same of the pixels count
+        for nodata in (band_nodata, self.nodata):
+            if nodata is not None:
+                values[values == nodata] = np.nan
+        del gdal_file
+
+        return [None if isnan(value) else value for value in values.tolist()]
+
     def get_total_pixels_by_value(self, pixel_value):
         if self.pixel_counts_by_value is None:
-            self.pixel_counts_by_value = get_pixel_count_by_pixel_values(self.qgs_layer, self.band)
+            self.pixel_counts_by_value = get_pixel_count_by_pixel_values(self.qgs_layer, self.band,
+                                                                         nodata=self.nodata)
 
         if pixel_value in self.pixel_counts_by_value:
             return self.pixel_counts_by_value[pixel_value]
@@ -300,7 +300,7 @@ class Sampling(object):
         points_generated = []
         while nIterations < maxIterations and nPoints < total_of_samples:
 
-            random_sampling_point = RandomPoint(self.ThematicR.extent())
+            random_sampling_point = RandomPoint(self.ThematicR.extent(), thematic_CRS)
 
             # checks to the sampling point, else discard and continue
             if not self.check_sampling_point(random_sampling_point):
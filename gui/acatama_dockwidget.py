@@ -451,7 +451,7 @@ class AcATaMaDockWidget(QDockWidget, FORM_CLASS):
                 self.QPBar_ClassificationStatus.setMaximum(classification.num_points)
                 self.QPBar_ClassificationStatus.setValue(classification.total_classified)
             else:
-                count_samples = len(list(sampling_layer.getFeatures()))
+                count_samples = sampling_layer.featureCount()
                 self.QPBar_ClassificationStatus.setMaximum(count_samples)
                 self.QPBar_ClassificationStatus.setValue(0)
             self.QPBar_ClassificationStatus.setTextVisible(True)
@@ -614,9 +614,13 @@ class AcATaMaDockWidget(QDockWidget, FORM_CLASS):
 
         file_out, _ = QFileDialog.getSaveFileName(self, self.tr("Save sampling file with the classification"),
                                                   suggested_filename,
-                                                  self.tr("GeoPackage files (*.gpkg);;Shape files (*.shp);;All files (*.*)"))
+                                                  self.tr("GeoPackage files (*.gpkg);;Shape files (*.shp);;"
+                                                          "Google Earth files (*.kmz);;All files (*.*)"))
         if file_out != '':
-            classification.save_sampling_classification(file_out)
+            if file_out.lower().endswith(".kmz"):
+                classification.save_kmz(file_out)
+            else:
+                classification.save_sampling_classification(file_out)
             iface.messageBar().pushMessage("AcATaMa", "File saved successfully", level=Qgis.Success)
 
     @pyqtSlot()
@@ -19,8 +19,12 @@
  ***************************************************************************/
 """
 import csv
+import hashlib
+import json
 import os
-import copy
+import numpy as np
+from collections import OrderedDict
+from osgeo import ogr
 
 from qgis.core import QgsUnitTypes
 
@@ -32,12 +36,136 @@ def rf(fv, r=5):
     """
     Round float
     """
-    return round(fv, r)
+    return round(float(fv), r)
+
+
+def rf_or_dash(fv, r=5):
+    """Round float for values greater than zero, else dash"""
+    return rf(fv, r) if fv > 0 else "-"
+
+
+def rf_or_nan_dash(fv, r=5):
+    """Round float for the defined values, else dash"""
+    return "-" if np.isnan(fv) else rf(fv, r)
+
+
+def get_labels(accu_asse):
+    return ["{} ({})".format(i, accu_asse.labels[str(i)] if str(i) in accu_asse.labels else "-")
+            for i in accu_asse.values]
+
+
+# sections of the html report that can be collapsed (not rendered) from its title
+HTML_SECTIONS = ["error_matrix", "area_proportion", "quadratic_error", "accuracy_matrices", "area_adjusted",
+                 "bootstrap"]
+# the big matrices are collapsed by default for maps with more classes than this
+HTML_COLLAPSE_SIZE = 30
+
+
+def get_html_collapsed_by_default(accu_asse):
+    """The sections collapsed when the results are opened, the matrices of estimated
+    area proportion (n x n) for maps with many classes"""
+    if len(accu_asse.values) > HTML_COLLAPSE_SIZE:
+        return {"area_proportion", "quadratic_error", "accuracy_matrices"}
+    return set()
+
+
+def get_html_key(accu_asse, collapsed=()):
+    """Key of the content of the html report, it changes only if the results or the
+    sections collapsed change, for skip re-rendering the same report"""
+    results = accu_asse.results
+    return hash((
+        tuple(accu_asse.values), results.error_matrix.tobytes(), results.class_area.tobytes(),
+        accu_asse.z_score, accu_asse.pixel_area_unit, accu_asse.ThematicR.file_path, accu_asse.sampling_config,
+        tuple(sorted(accu_asse.labels.items())), accu_asse.classification.total_classified,
+        tuple(s.shape_id for s in accu_asse.samples_outside_the_thematic or ()),
+        tuple(s.shape_id for s in accu_asse.samples_outside_the_strata or ()),
+        tuple(accu_asse.strata_without_samples or ()), get_bootstrap_key(accu_asse), frozenset(collapsed)))
+
+
+def get_bootstrap_key(accu_asse):
+    """Key of the bootstrap in the html report, by its parameters and results, or if it
+    is being computed in background"""
+    bootstrap = accu_asse.bootstrap
+    if bootstrap is None:
+        return "computing" if accu_asse.bootstrap_params is not None else None
+    return (bootstrap.resamples, bootstrap.seed, bootstrap.confidence,
+            hashlib.sha1(b"".join(np.ascontiguousarray(values).tobytes() for values in (
+                bootstrap.overall_accuracy, bootstrap.user_accuracy, bootstrap.producer_accuracy,
+                bootstrap.area))).hexdigest())
 
 
 @error_handler
-def get_html(accu_asse):
-    html = '''
+def get_html(accu_asse, collapsed=()):
+    """Build the html report of the results, the sections in collapsed are not
+    rendered, only its title with a link (#section) to show it
+
+    Args:
+        accu_asse (AccuracyAssessment): the accuracy assessment computed
+        collapsed (set): the sections (of HTML_SECTIONS) collapsed
+
+    Returns:
+        str: the html report
+    """
+    results = accu_asse.results
+    labels = get_labels(accu_asse)
+    table_size = len(accu_asse.values)
+    # the report is built appending the parts to this list and joined at the end
+    html = []
+
+    def section_title(section, title, tag="h3"):
+        html.append("<p style='font-size:2px'><br/></p>")
+        html.append("<{tag}>{title} <a href='#{section}' style='font-size:small'>{action}</a></{tag}>".format(
+            tag=tag, title=title, section=section, action="show" if section in collapsed else "hide"))
+        return section not in collapsed
+
+    def matrix_header(extra_empty=0, extra_headers=()):
+        html.append('''
+            <table>
+            <tbody>
+            <tr>
+            <td class="empty"></td>
+            <td class="empty"></td>
+             <th colspan="{table_size}">Classified values</th>
+            '''.format(table_size=table_size))
+        html.append('<td class="empty"></td>' * extra_empty)
+        html.append('''
+            </tr>
+            <tr>
+            <td class="empty"></td>
+            <td class="empty"></td>
+            ''')
+        html.extend(["<th >" + str(i) + "</th>" for i in labels + list(extra_headers)])
+        html.append("</tr>")
+
+    def matrix_rows(matrix, row_extra=None):
+        for idx_row, value in enumerate(accu_asse.values):
+            html.append("<tr>")
+            if idx_row == 0:
+                html.append('''
+                    <th  class="th-rows" rowspan="{table_size}">Thematic raster<br />classes</th>
+                    '''.format(table_size=table_size))
+            html.append("<th>{value}</th>".format(value=value))
+            html.extend(['<td class="field-values">{}</td>'.format(t) for t in matrix[idx_row]])
+            if row_extra:
+                html.extend(["<td>{}</td>".format(t) for t in row_extra(idx_row, value)])
+            html.append("</tr>")
+
+    def matrix_total_row(title, totals):
+        html.append('''
+            <tr>
+            <td class="empty"></td>
+              <th>{}</th>
+            '''.format(title))
+        html.extend(["<td>{}</td>".format(t) for t in totals])
+        html.append("</tr>")
+
+    def table_end():
+        html.append('''
+            </tbody>
+            </table>
+            ''')
+
+    html.append('''
         <head>
         <style type="text/css">
         table {
@@ -68,401 +196,185 @@ def get_html(accu_asse):
         </style>
         </head>
         <body>
-        '''
-    html += "<h2>Classification accuracy assessment results</h2>"
-    html += "<p><strong>Thematic raster:</strong> {}</p>".format(os.path.basename(accu_asse.ThematicR.file_path))
-    html += "<p><strong>Sampling file:</strong> {}</p>".format(
-        os.path.basename(get_file_path_of_layer(accu_asse.classification.sampling_layer)))
-    html += "<p><strong>Classification status:</strong> {}/{} samples classified</p>".format(
-        accu_asse.classification.total_classified, accu_asse.classification.num_points)
+        ''')
+    html.append("<h2>Classification accuracy assessment results</h2>")
+    html.append("<p><strong>Thematic raster:</strong> {}</p>".format(os.path.basename(accu_asse.ThematicR.file_path)))
+    html.append("<p><strong>Sampling file:</strong> {}</p>".format(
+        os.path.basename(get_file_path_of_layer(accu_asse.classification.sampling_layer))))
+    html.append("<p><strong>Classification status:</strong> {}/{} samples classified</p>".format(
+        accu_asse.classification.total_classified, accu_asse.classification.num_points))
+    if accu_asse.StrataR is not None:
+        html.append("<p><strong>Strata:</strong> {} (from the sampling config {})</p>".format(
+            os.path.basename(accu_asse.StrataR.file_path), os.path.basename(accu_asse.sampling_config)))
 
     # warning block if the thematic has a geographic units
     if accu_asse.base_area_unit == QgsUnitTypes.AreaSquareDegrees:
-        html += "<p style='color:black;background-color:#ffc53a;white-space:pre;padding:4px'><strong>Warning!</strong><br/>" \
-                "The thematic raster has a geographic coordinate system, therefore all area values are not accurate.<br/>" \
-                "For fix that use the UTM coordinate system.</p>"
+        html.append("<p style='color:black;background-color:#ffc53a;white-space:pre;padding:4px'><strong>Warning!</strong><br/>"
+                    "The thematic raster has a geographic coordinate system, therefore all area values are not accurate.<br/>"
+                    "For fix that use the UTM coordinate system.</p>")
 
     # warning block for samples outside the thematic raster area or inside the no data values
     if accu_asse.samples_outside_the_thematic:
-        html += "<p style='color:black;background-color:#ffc53a;white-space:pre;padding:4px'><strong>Warning!</strong><br/>" \
-                "There are {} samples classified that are outside the thematic raster area or inside the no data values:<br/>".format(
-            len(accu_asse.samples_outside_the_thematic))
-        for idx, sample in enumerate(accu_asse.samples_outside_the_thematic):
-            html += "    {}) Sample ID: {}, Coordinate: {},{}<br/>".format(idx+1, sample.shape_id, int(sample.QgsPnt.x()), int(sample.QgsPnt.y()))
-        html += "These samples will be ignored for accuracy assessment results.</p>"
+        html.append("<p style='color:black;background-color:#ffc53a;white-space:pre;padding:4px'><strong>Warning!</strong><br/>"
+                    "There are {} samples classified that are outside the thematic raster area or inside the no data values:<br/>".format(
+            len(accu_asse.samples_outside_the_thematic)))
+        html.extend(["    {}) Sample ID: {}, Coordinate: {},{}<br/>".format(
+            idx+1, sample.shape_id, int(sample.QgsPnt.x()), int(sample.QgsPnt.y()))
+            for idx, sample in enumerate(accu_asse.samples_outside_the_thematic)])
+        html.append("These samples will be ignored for accuracy assessment results.</p>")
+
+    # warning block for samples outside the strata raster area and strata without samples
+    if accu_asse.samples_outside_the_strata:
+        html.append("<p style='color:black;background-color:#ffc53a;white-space:pre;padding:4px'><strong>Warning!</strong><br/>"
+                    "There are {} samples classified that are outside the strata raster area or inside the no data values:<br/>".format(
+            len(accu_asse.samples_outside_the_strata)))
+        html.extend(["    {}) Sample ID: {}, Coordinate: {},{}<br/>".format(
+            idx+1, sample.shape_id, int(sample.QgsPnt.x()), int(sample.QgsPnt.y()))
+            for idx, sample in enumerate(accu_asse.samples_outside_the_strata)])
+        html.append("These samples will be ignored for accuracy assessment results.</p>")
+    if accu_asse.strata_without_samples:
+        html.append("<p style='color:black;background-color:#ffc53a;white-space:pre;padding:4px'><strong>Warning!</strong><br/>"
+                    "The strata {} don't have samples classified, the area of these strata is not estimated.</p>".format(
+            ", ".join(map(str, accu_asse.strata_without_samples))))
 
     ###########################################################################
-    html += "<p style='font-size:2px'><br/></p>"
-    html += "<h3>1) Error matrix (confusion matrix):</h3>"
-    html += '''
-        <table>
-        <tbody>
-        <tr>
-        <td class="empty"></td>
-        <td class="empty"></td>
-         <th colspan="{table_size}">Classified values</th>
-            <td class="empty"></td>
-            <td class="empty"></td>
-            <td class="empty"></td>
-            <td class="empty"></td>
-        </tr>
-        <tr>
-        <td class="empty"></td>
-        <td class="empty"></td>
-        '''.format(table_size=len(accu_asse.values))
-    labels = ["{} ({})".format(i, accu_asse.labels[str(i)] if str(i) in accu_asse.labels else "-")
-              for i in accu_asse.values]
-    html += "".join([
-        "<th >"+str(i)+"</th>" for i in labels])
-    html += '''
-        <th>Total</th>
-        <th>User accuracy</th>
-        <th>Total class area ({area_unit})</th>
-        <th>Wi</th>
-        </tr>
-        '''.format(area_unit=accu_asse.pixel_area_unit)
-    for idx_row, value in enumerate(accu_asse.values):
-        html += "<tr>"
-        if idx_row == 0:
-            html += '''
-                <th  class="th-rows" rowspan="{table_size}">Thematic raster<br />classes</th>
-                '''.format(table_size=len(accu_asse.values))
-
-        html += "<th>{value}</th>".format(value=value)
-        html += "".join(['''
-            <td class="field-values">{table_field}</td>
-            '''.format(table_field=t) for t in accu_asse.error_matrix[idx_row]])
-        html += '''
-            <td>{total_row}</td>
-            <td>{u_accuracy}</td>
-            <td>{total_class_area}</td>
-            <td>{wi}</td>
-            </tr>
-            '''.format(total_row=sum(accu_asse.error_matrix[idx_row]),
-                       u_accuracy=rf(accu_asse.error_matrix[idx_row][idx_row]/sum(accu_asse.error_matrix[idx_row]))
-                           if sum(accu_asse.error_matrix[idx_row]) > 0 else "-",
-                       total_class_area=rf(accu_asse.thematic_pixels_count[value] * accu_asse.pixel_area_value),
-                       wi=rf(accu_asse.thematic_pixels_count[value] /
-                           sum([accu_asse.thematic_pixels_count[v] for v in accu_asse.values])))
-    html += '''    
-        <tr>
-        <td class="empty"></td>
-          <th>total</th>
-        '''
-    html += "".join(['''
-                <td>{total_col}</td>
-                '''.format(total_col=sum(t)) for t in zip(*accu_asse.error_matrix)])
-    html += '''
-        <td>{total_total}</td>
-        '''.format(total_total=sum([sum(r) for r in accu_asse.error_matrix]))
-    html += '''
-        <td></td>
-        '''
-    html += '''
-        <td>{total_classes_area}</td>
-        '''.format(total_classes_area=rf(sum([accu_asse.thematic_pixels_count[v] for v in accu_asse.values]) *
-                                         accu_asse.pixel_area_value))
-    html += '''
-        <td></td>
-        </tr>
-        <tr>
-        <td class="empty"></td>
-          <th>Producer accuracy</th>
-        '''
-    for idx_col, col in enumerate(zip(*accu_asse.error_matrix)):
-        html += '''
-            <td>{p_accuracy}</td>
-            '''.format(p_accuracy=rf(col[idx_col] / sum(col)) if sum(col) > 0 else "-")
-    html += '''
-        <td></td>
-        <td>{u_p_accuracy}</td>
-        '''.format(u_p_accuracy=rf(sum([col[idx_col] for idx_col, col in enumerate(zip(*accu_asse.error_matrix))]) /
-                                      sum([sum(r) for r in accu_asse.error_matrix])) if sum([sum(r) for r in accu_asse.error_matrix]) != 0 else "-")
-    html += '''
-        <td></td>
-        <td></td>
-        </tr>
-        </tbody>
-        </table>
-        '''
+    if section_title("error_matrix", "1) Error matrix (confusion matrix):"):
+        matrix_header(extra_empty=4, extra_headers=[
+            "Total", "User accuracy", "Total class area ({area_unit})".format(area_unit=accu_asse.pixel_area_unit), "Wi"])
+        matrix_rows(results.error_matrix.tolist(), row_extra=lambda idx_row, value: [
+            int(results.row_total[idx_row]), rf_or_nan_dash(results.user_accuracy[idx_row]),
+            rf(results.class_area[idx_row]), rf(results.wi[idx_row])])
+        matrix_total_row("total", [int(t) for t in results.col_total] +
+                         [int(results.total), "", rf(results.total_class_area), ""])
+        matrix_total_row("Producer accuracy", [rf_or_nan_dash(t) for t in results.producer_accuracy] +
+                         ["", rf_or_nan_dash(results.overall_accuracy_samples), "", ""])
+        table_end()
 
     ###########################################################################
-    html += "<p style='font-size:2px'><br/></p>"
-    html += "<h3>2) Error matrix of estimated area proportion:</h3>"
-    html += '''
-        <table>
-        <tbody>
-        <tr>
-        <td class="empty"></td>
-        <td class="empty"></td>
-         <th colspan="{table_size}">Classified values</th>
-            <td class="empty"></td>
-        </tr>
-        <tr>
-        <td class="empty"></td>
-        <td class="empty"></td>
-        '''.format(table_size=len(accu_asse.values))
-    labels = ["{} ({})".format(i, accu_asse.labels[str(i)] if str(i) in accu_asse.labels else "-")
-              for i in accu_asse.values]
-    html += "".join([
-        "<th >"+str(i)+"</th>" for i in labels])
-    html += '''
-        <th>Wi</th>
-        </tr>
-        '''
-    error_matrix_area_prop = copy.deepcopy(accu_asse.error_matrix)
-    for idx_row, row in enumerate(accu_asse.error_matrix):
-        wi = accu_asse.thematic_pixels_count[accu_asse.values[idx_row]] / \
-             sum([accu_asse.thematic_pixels_count[v] for v in accu_asse.values])
-        for idx_col, value in enumerate(row):
-            error_matrix_area_prop[idx_row][idx_col] = (value / sum(row)) * wi if sum(row) > 0 else 0
-
-    for idx_row, value in enumerate(accu_asse.values):
-        html += "<tr>"
-        if idx_row == 0:
-            html += '''
-                <th  class="th-rows" rowspan="{table_size}">Thematic raster<br />classes</th>
-                '''.format(table_size=len(accu_asse.values))
-
-        html += "<th>{value}</th>".format(value=value)
-        html += "".join(['''
-            <td class="field-values">{table_field}</td>
-            '''.format(table_field=(rf(t)) if t > 0 else "-") for t in error_matrix_area_prop[idx_row]])
-        html += '''
-            <td>{wi}</td>
-            </tr>
-            '''.format(wi=rf(sum(error_matrix_area_prop[idx_row])) if sum(error_matrix_area_prop[idx_row]) > 0 else "-")
-    html += '''    
-        <tr>
-        <td class="empty"></td>
-          <th>total</th>
-        '''
-    html += "".join(['''
-                <td>{total_col}</td>
-                '''.format(total_col=rf(sum(t))) for t in zip(*error_matrix_area_prop)])
-    html += '''
-        <td></td>
-        </tr>
-        </tbody>
-        </table>
-        '''
+    if section_title("area_proportion", "2) Error matrix of estimated area proportion:"):
+        matrix_header(extra_empty=1, extra_headers=["Wi"])
+        matrix_rows([[rf_or_dash(t) for t in row] for row in results.area_proportion],
+                    row_extra=lambda idx_row, value: [rf_or_dash(results.area_proportion[idx_row].sum())])
+        matrix_total_row("total", [rf(t) for t in results.area_proportion.sum(axis=0)] + [""])
+        table_end()
 
     ###########################################################################
-    html += "<p style='font-size:2px'><br/></p>"
-    html += "<h3>3) Quadratic error matrix of estimated area proportion:</h3>"
-    html += '''
-        <table>
-        <tbody>
-        <tr>
-        <td class="empty"></td>
-        <td class="empty"></td>
-         <th colspan="{table_size}">Classified values</th>
-        </tr>
-        <tr>
-        <td class="empty"></td>
-        <td class="empty"></td>
-        '''.format(table_size=len(accu_asse.values))
-    labels = ["{} ({})".format(i, accu_asse.labels[str(i)] if str(i) in accu_asse.labels else "-")
-              for i in accu_asse.values]
-    html += "".join([
-        "<th >"+str(i)+"</th>" for i in labels])
-    html += "</tr>"
-    
-    quadratic_error_matrix = copy.deepcopy(accu_asse.error_matrix)
-    for idx_row, row in enumerate(accu_asse.error_matrix):
-        wi = accu_asse.thematic_pixels_count[accu_asse.values[idx_row]] / \
-             sum([accu_asse.thematic_pixels_count[v] for v in accu_asse.values])
-        for idx_col, value in enumerate(row):
-            quadratic_error_matrix[idx_row][idx_col] = \
-                (wi**2*((value/sum(row))*(1-(value/sum(row)))/(sum(row)-1))) if sum(row) > 1 else 0
-
-    for idx_row, value in enumerate(accu_asse.values):
-        html += "<tr>"
-        if idx_row == 0:
-            html += '''
-                <th  class="th-rows" rowspan="{table_size}">Thematic raster<br />classes</th>
-                '''.format(table_size=len(accu_asse.values))
-
-        html += "<th>{value}</th>".format(value=value)
-        html += "".join(['''
-            <td class="field-values">{table_field}</td>
-            '''.format(table_field=(rf(t)) if t > 0 else "-") for t in quadratic_error_matrix[idx_row]])
-        html += "</tr>"
-    html += '''    
-        <tr>
-        <td class="empty"></td>
-          <th>total</th>
-        '''
-    html += "".join(['''
-                    <td>{total_col}</td>
-                    '''.format(total_col=rf(sum(t)**0.5)) for t in zip(*quadratic_error_matrix)])
-    html += '''
-        </tr>
-        </tbody>
-        </table>
-        '''
+    if section_title("quadratic_error", "3) Quadratic error matrix of estimated area proportion:"):
+        matrix_header()
+        matrix_rows([[rf_or_dash(t) for t in row] for row in results.quadratic_error])
+        matrix_total_row("total", [rf(t) for t in results.area_proportion_error])
+        table_end()
 
     ###########################################################################
-    html += "<p style='font-size:2px'><br/></p>"
-    html += "<h3>4) Accuracy matrices:</h3>"
-    ###################################
-    html += "<h4>User's accuracy matrix of estimated area proportion:</h4>"
-    html += '''
-        <table>
-        <tbody>
-        <tr>
-        <td class="empty"></td>
-        <td class="empty"></td>
-         <th colspan="{table_size}">Classified values</th>
-        </tr>
-        <tr>
-        <td class="empty"></td>
-        <td class="empty"></td>
-        '''.format(table_size=len(accu_asse.values))
-    labels = ["{} ({})".format(i, accu_asse.labels[str(i)] if str(i) in accu_asse.labels else "-")
-              for i in accu_asse.values]
-    html += "".join([
-        "<th >"+str(i)+"</th>" for i in labels])
-    html += "</tr>"
-    
-    user_accuracy_matrix = copy.deepcopy(accu_asse.error_matrix)
-    for idx_row, row in enumerate(accu_asse.error_matrix):
-        for idx_col, value in enumerate(row):
-            user_accuracy_matrix[idx_row][idx_col] = \
-                value/sum(row) if sum(row) > 0 else 0
-
-    for idx_row, value in enumerate(accu_asse.values):
-        html += "<tr>"
-        if idx_row == 0:
-            html += '''
-                <th  class="th-rows" rowspan="{table_size}">Thematic raster<br />classes</th>
-                '''.format(table_size=len(accu_asse.values))
-
-        html += "<th>{value}</th>".format(value=value)
-        html += "".join(['''
-            <td class="field-values">{table_field}</td>
-            '''.format(table_field=(rf(t)) if t > 0 else "-") for t in user_accuracy_matrix[idx_row]])
-        html += "</tr>"
-    html += '''
-        </tbody>
-        </table>
-        '''
+    if section_title("accuracy_matrices", "4) Accuracy matrices:"):
+        ###################################
+        html.append("<h4>User's accuracy matrix of estimated area proportion:</h4>")
+        matrix_header()
+        matrix_rows([[rf_or_dash(t) for t in row] for row in results.user_accuracy_matrix])
+        table_end()
+        ###################################
+        html.append("<h4>Producer's accuracy matrix of estimated area proportion:</h4>")
+        matrix_header()
+        matrix_rows([[rf_or_dash(t) for t in row] for row in results.producer_accuracy_matrix])
+        table_end()
     ###################################
-    html += "<h4>Producer's accuracy matrix of estimated area proportion:</h4>"
-    html += '''
-        <table>
-        <tbody>
-        <tr>
-        <td class="empty"></td>
-        <td class="empty"></td>
-         <th colspan="{table_size}">Classified values</th>
-        </tr>
-        <tr>
-        <td class="empty"></td>
-        <td class="empty"></td>
-        '''.format(table_size=len(accu_asse.values))
-    labels = ["{} ({})".format(i, accu_asse.labels[str(i)] if str(i) in accu_asse.labels else "-")
-              for i in accu_asse.values]
-    html += "".join([
-        "<th >"+str(i)+"</th>" for i in labels])
-    html += "</tr>"
-    
-    producer_accuracy_matrix = copy.deepcopy(error_matrix_area_prop)
-    for idx_col, col in enumerate(zip(*error_matrix_area_prop)):
-        for idx_row, value in enumerate(col):
-            producer_accuracy_matrix[idx_row][idx_col] = value/sum(col) if sum(col) > 0 else 0
-
-    for idx_row, value in enumerate(accu_asse.values):
-        html += "<tr>"
-        if idx_row == 0:
-            html += '''
-                <th  class="th-rows" rowspan="{table_size}">Thematic raster<br />classes</th>
-                '''.format(table_size=len(accu_asse.values))
-
-        html += "<th>{value}</th>".format(value=value)
-        html += "".join(['''
-            <td class="field-values">{table_field}</td>
-            '''.format(table_field=(rf(t)) if t > 0 else "-") for t in producer_accuracy_matrix[idx_row]])
-        html += "</tr>"
-        
-    html += '''
-        </tbody>
-        </table>
-        '''
-    ###################################
-    html += "<h4>Overall Accuracy: </h4>"
-    overall_accuracy = sum([row[idx_row] for idx_row, row in enumerate(error_matrix_area_prop)])
-    html += '''
+    html.append("<h4>Overall Accuracy: </h4>")
+    html.append('''
             <table>
             <tbody>
             <tr>
             <td>{}</td>
-            </tr>'''.format(rf(overall_accuracy))
-    html += '''
-            </tbody>
-            </table>
-            '''
+            </tr>'''.format(rf(results.overall_accuracy)))
+    table_end()
+
+    ###################################
+    if section_title("area_adjusted", "5) Class area adjusted table:"):
+        html.append('''
+            <table>
+            <tbody>
+            <tr>
+            <td class="empty"></td>
+            ''')
+        headers = ["Area ({area_unit})".format(area_unit=accu_asse.pixel_area_unit), "Error", "Lower limit", "Upper limit"]
+        html.extend(["<th >" + str(h) + "</th>" for h in headers])
+        html.append("</tr>")
+
+        for idx_row, label in enumerate(labels):
+            html.append("<tr>")
+            html.append("<th >{}</th>".format(label))
+            html.extend(["<td>{}</td>".format(rf(t)) for t in (
+                results.area[idx_row], results.error[idx_row], results.lower_limit[idx_row], results.upper_limit[idx_row])])
+            html.append("</tr>")
+
+        html.append('''
+            <tr>
+              <th>total</th>
+            ''')
+        html.append('''<td>{total_area}</td>'''.format(total_area=rf(results.total_area)))
+        html.append('''
+            <td class="empty"></td>
+            <td class="empty"></td>
+            <td class="empty"></td>
+            </tr>''')
+        table_end()
 
     ###################################
-    html += "<p style='font-size:2px'><br/></p>"
-    html += "<h3>5) Class area adjusted table:</h3>"
-    html += '''
-        <table>
-        <tbody>
-        <tr>
-        <td class="empty"></td>
-        '''.format(table_size=len(accu_asse.values))
-    headers = ["Area ({area_unit})".format(area_unit=accu_asse.pixel_area_unit), "Error", "Lower limit", "Upper limit"]
-    html += "".join([
-        "<th >" + str(h) + "</th>" for h in headers])
-    html += "</tr>"
-
-    total_area = 0
-
-    for idx_row, value in enumerate(accu_asse.values):
-        html += "<tr>"
-
-        html += "<th >{} ({})</th>".format(value, accu_asse.labels[str(value)] if str(value) in accu_asse.labels else "-")
-        # area
-        area = sum(list(zip(*error_matrix_area_prop))[idx_row]) * \
-               sum([accu_asse.thematic_pixels_count[v] for v in accu_asse.values]) * accu_asse.pixel_area_value
-        html += '''<td>{area}</th>'''.format(area=rf(area))
-        total_area += area
-        # error
-        error = (sum(list(zip(*quadratic_error_matrix))[idx_row])**0.5) * \
-                sum([accu_asse.thematic_pixels_count[v] for v in accu_asse.values]) * accu_asse.pixel_area_value
-        html += '''<td>{error}</th>'''.format(error=rf(error))
-        # lower limit
-        html += '''<td>{lower_limit}</th>'''.format(lower_limit=rf(area - accu_asse.z_score * error))
-        # upper limit
-        html += '''<td>{upper_limit}</th>'''.format(upper_limit=rf(area + accu_asse.z_score * error))
-        html += "</tr>"
-
-    html += '''    
-        <tr>
-          <th>total</th>
-        '''
-    html += '''<td>{total_area}</th>'''.format(total_area=rf(total_area))
-    html += '''
-        <td class="empty"></td>
-        <td class="empty"></td>
-        <td class="empty"></td>
-        </tr>'''
-
-    html += '''
-        </tbody>
-        </table>
-        '''
-
-    html += '''
+    if accu_asse.bootstrap is None and accu_asse.bootstrap_params is not None:
+        html.append("<p style='font-size:2px'><br/></p>")
+        html.append("<h3>6) Bootstrap confidence intervals ({} resamples, {}%):</h3>".format(
+            accu_asse.bootstrap_params["resamples"], rf(accu_asse.bootstrap_params["confidence"] * 100, 2)))
+        html.append("<p><i>Computing in background, meanwhile see the analytic intervals of the areas "
+                    "in the table 5...</i></p>")
+    if accu_asse.bootstrap:
+        bootstrap = accu_asse.bootstrap
+        if section_title("bootstrap", "6) Bootstrap confidence intervals ({} resamples, {}%):".format(
+                bootstrap.resamples, rf(bootstrap.confidence * 100, 2))):
+            html.append('''
+                <table>
+                <tbody>
+                <tr>
+                <td class="empty"></td>
+                ''')
+            headers = ["User accuracy", "Producer accuracy", "Area ({area_unit})".format(area_unit=accu_asse.pixel_area_unit)]
+            html.extend(["<th colspan='2'>" + str(h) + "</th>" for h in headers])
+            html.append("</tr>")
+            html.append("<tr><td class='empty'></td>" + "<th>lower</th><th>upper</th>" * len(headers) + "</tr>")
+            for idx_row, label in enumerate(labels):
+                html.append("<tr>")
+                html.append("<th >{}</th>".format(label))
+                html.extend(["<td>{}</td>".format(rf_or_nan_dash(t)) for t in (
+                    bootstrap.user_accuracy[0][idx_row], bootstrap.user_accuracy[1][idx_row],
+                    bootstrap.producer_accuracy[0][idx_row], bootstrap.producer_accuracy[1][idx_row],
+                    bootstrap.area[0][idx_row], bootstrap.area[1][idx_row])])
+                html.append("</tr>")
+            html.append('''
+                <tr>
+                  <th>Overall Accuracy</th>
+                ''')
+            html.extend(["<td>{}</td>".format(rf_or_nan_dash(t)) for t in bootstrap.overall_accuracy])
+            html.append('''
+                <td class="empty"></td>
+                <td class="empty"></td>
+                <td class="empty"></td>
+                <td class="empty"></td>
+                </tr>''')
+            table_end()
+
+    html.append('''
         </body>
-        '''
+        ''')
 
-    return html
+    return "".join(html)
 
 
-@error_handler
 def export_to_csv(accu_asse, file_out, csv_separator, csv_decimal_separator):
+    results = accu_asse.results
+    labels = get_labels(accu_asse)
+
+    def matrix_rows(matrix):
+        return [["Thematic raster classes" if idx_row == 0 else "", value] + list(matrix[idx_row])
+                for idx_row, value in enumerate(accu_asse.values)]
+
     csv_rows = []
     csv_rows.append(["Classification accuracy assessment results"])
     csv_rows.append([])
@@ -477,92 +389,39 @@ def export_to_csv(accu_asse, file_out, csv_separator, csv_decimal_separator):
                                                        accu_asse.classification.num_points)])
 
     ###########################################################################
+    if accu_asse.StrataR is not None:
+        csv_rows.append([])
+        csv_rows.append(["Strata:"])
+        csv_rows.append([os.path.basename(accu_asse.StrataR.file_path)])
     csv_rows.append([])
     csv_rows.append(["1) Error matrix (confusion matrix):"])
     csv_rows.append(["", "", "Classified values"])
-    labels = ["{} ({})".format(i, accu_asse.labels[str(i)] if str(i) in accu_asse.labels else "-")
-              for i in accu_asse.values]
     csv_rows.append(["", ""] + labels + ["Total", "User accuracy",
                                          "Total class area ({area_unit})".format(area_unit=accu_asse.pixel_area_unit), "Wi"])
-
-    for idx_row, value in enumerate(accu_asse.values):
-        r = []
-        if idx_row == 0:
-            r.append("Thematic raster classes")
-        else:
-            r.append("")
-        r.append(value)
-        r += accu_asse.error_matrix[idx_row]
-        r.append(sum(accu_asse.error_matrix[idx_row]))
-        r.append(rf(accu_asse.error_matrix[idx_row][idx_row]/sum(accu_asse.error_matrix[idx_row]))
-                 if sum(accu_asse.error_matrix[idx_row]) > 0 else "-")
-        r.append(rf(accu_asse.thematic_pixels_count[value] * accu_asse.pixel_area_value))
-        r.append(rf(accu_asse.thematic_pixels_count[value] /
-                 sum([accu_asse.thematic_pixels_count[v] for v in accu_asse.values])))
-        csv_rows.append(r)
-
-    csv_rows.append(["", "total"] + [sum(t) for t in zip(*accu_asse.error_matrix)] + [sum([sum(r) for r in accu_asse.error_matrix])] +
-                    [""] + [sum([accu_asse.thematic_pixels_count[v] for v in accu_asse.values]) * accu_asse.pixel_area_value])
-    csv_rows.append(["", "Producer accuracy"] +
-                    [rf(col[idx_col] / sum(col)) if sum(col) > 0 else "-" for idx_col, col in enumerate(zip(*accu_asse.error_matrix))] +
-                    [""] + [rf(sum([col[idx_col] for idx_col, col in enumerate(zip(*accu_asse.error_matrix))]) /
-                            sum([sum(r) for r in accu_asse.error_matrix])) if sum([sum(r) for r in accu_asse.error_matrix]) != 0 else "-"])
+    for idx_row, row in enumerate(matrix_rows(results.error_matrix.tolist())):
+        csv_rows.append(row + [int(results.row_total[idx_row]), rf_or_nan_dash(results.user_accuracy[idx_row]),
+                               rf(results.class_area[idx_row]), rf(results.wi[idx_row])])
+    csv_rows.append(["", "total"] + [int(t) for t in results.col_total] + [int(results.total)] +
+                    [""] + [float(results.total_class_area)])
+    csv_rows.append(["", "Producer accuracy"] + [rf_or_nan_dash(t) for t in results.producer_accuracy] +
+                    [""] + [rf_or_nan_dash(results.overall_accuracy_samples)])
 
     ###########################################################################
     csv_rows.append([])
     csv_rows.append(["2) Error matrix of estimated area proportion:"])
     csv_rows.append(["", "", "Classified values"])
-    labels = ["{} ({})".format(i, accu_asse.labels[str(i)] if str(i) in accu_asse.labels else "-")
-              for i in accu_asse.values]
     csv_rows.append(["", ""] + labels + ["Wi"])
-
-    error_matrix_area_prop = copy.deepcopy(accu_asse.error_matrix)
-    for idx_row, row in enumerate(accu_asse.error_matrix):
-        wi = accu_asse.thematic_pixels_count[accu_asse.values[idx_row]] / \
-             sum([accu_asse.thematic_pixels_count[v] for v in accu_asse.values])
-        for idx_col, value in enumerate(row):
-            error_matrix_area_prop[idx_row][idx_col] = (value / sum(row)) * wi if sum(row) > 0 else 0
-
-    for idx_row, value in enumerate(accu_asse.values):
-        r = []
-        if idx_row == 0:
-            r.append("Thematic raster classes")
-        else:
-            r.append("")
-        r.append(value)
-        r += [rf(t) if t > 0 else "-" for t in error_matrix_area_prop[idx_row]]
-        r.append(rf(sum(error_matrix_area_prop[idx_row])) if sum(error_matrix_area_prop[idx_row]) > 0 else "-")
-        csv_rows.append(r)
-
-    csv_rows.append(["", "total"] + [rf(sum(t)) for t in zip(*error_matrix_area_prop)])
+    for idx_row, row in enumerate(matrix_rows([[rf_or_dash(t) for t in row] for row in results.area_proportion])):
+        csv_rows.append(row + [rf_or_dash(results.area_proportion[idx_row].sum())])
+    csv_rows.append(["", "total"] + [rf(t) for t in results.area_proportion.sum(axis=0)])
 
     ###########################################################################
     csv_rows.append([])
     csv_rows.append(["3) Quadratic error matrix of estimated area proportion:"])
     csv_rows.append(["", "", "Classified values"])
-    labels = ["{} ({})".format(i, accu_asse.labels[str(i)] if str(i) in accu_asse.labels else "-")
-              for i in accu_asse.values]
     csv_rows.append(["", ""] + labels)
-
-    quadratic_error_matrix = copy.deepcopy(accu_asse.error_matrix)
-    for idx_row, row in enumerate(accu_asse.error_matrix):
-        wi = accu_asse.thematic_pixels_count[accu_asse.values[idx_row]] / \
-             sum([accu_asse.thematic_pixels_count[v] for v in accu_asse.values])
-        for idx_col, value in enumerate(row):
-            quadratic_error_matrix[idx_row][idx_col] = \
-                (wi ** 2 * ((value / sum(row)) * (1 - (value / sum(row))) / (sum(row) - 1))) if sum(row) > 1 else 0
-
-    for idx_row, value in enumerate(accu_asse.values):
-        r = []
-        if idx_row == 0:
-            r.append("Thematic raster classes")
-        else:
-            r.append("")
-        r.append(value)
-        r += [rf(t) if t > 0 else "-" for t in quadratic_error_matrix[idx_row]]
-        csv_rows.append(r)
-
-    csv_rows.append(["", "total"] + [rf(sum(t)**0.5) for t in zip(*quadratic_error_matrix)])
+    csv_rows += matrix_rows([[rf_or_dash(t) for t in row] for row in results.quadratic_error])
+    csv_rows.append(["", "total"] + [rf(t) for t in results.area_proportion_error])
 
     ###########################################################################
     csv_rows.append([])
@@ -570,80 +429,43 @@ def export_to_csv(accu_asse, file_out, csv_separator, csv_decimal_separator):
     csv_rows.append([])
     csv_rows.append(["User's accuracy matrix of estimated area proportion:"])
     csv_rows.append(["", "", "Classified values"])
-    labels = ["{} ({})".format(i, accu_asse.labels[str(i)] if str(i) in accu_asse.labels else "-")
-              for i in accu_asse.values]
     csv_rows.append(["", ""] + labels)
-
-    user_accuracy_matrix = copy.deepcopy(accu_asse.error_matrix)
-    for idx_row, row in enumerate(accu_asse.error_matrix):
-        for idx_col, value in enumerate(row):
-            user_accuracy_matrix[idx_row][idx_col] = \
-                value / sum(row) if sum(row) > 0 else 0
-
-    for idx_row, value in enumerate(accu_asse.values):
-        r = []
-        if idx_row == 0:
-            r.append("Thematic raster classes")
-        else:
-            r.append("")
-        r.append(value)
-        r += [rf(t) if t > 0 else "-" for t in user_accuracy_matrix[idx_row]]
-        csv_rows.append(r)
+    csv_rows += matrix_rows([[rf_or_dash(t) for t in row] for row in results.user_accuracy_matrix])
 
     csv_rows.append([])
     csv_rows.append(["Producer's accuracy matrix of estimated area proportion:"])
     csv_rows.append(["", "", "Classified values"])
-    labels = ["{} ({})".format(i, accu_asse.labels[str(i)] if str(i) in accu_asse.labels else "-")
-              for i in accu_asse.values]
     csv_rows.append(["", ""] + labels)
-
-    producer_accuracy_matrix = copy.deepcopy(error_matrix_area_prop)
-    for idx_col, col in enumerate(zip(*error_matrix_area_prop)):
-        for idx_row, value in enumerate(col):
-            producer_accuracy_matrix[idx_row][idx_col] = value / sum(col) if sum(col) > 0 else 0
-
-    for idx_row, value in enumerate(accu_asse.values):
-        r = []
-        if idx_row == 0:
-            r.append("Thematic raster classes")
-        else:
-            r.append("")
-        r.append(value)
-        r += [rf(t) if t > 0 else "-" for t in producer_accuracy_matrix[idx_row]]
-        csv_rows.append(r)
+    csv_rows += matrix_rows([[rf_or_dash(t) for t in row] for row in results.producer_accuracy_matrix])
 
     csv_rows.append([])
     csv_rows.append(["Overall Accuracy:"])
-    overall_accuracy = sum([row[idx_row] for idx_row, row in enumerate(error_matrix_area_prop)])
-    csv_rows.append([rf(overall_accuracy)])
+    csv_rows.append([rf(results.overall_accuracy)])
 
     ###########################################################################
     csv_rows.append([])
     csv_rows.append(["5) Class area adjusted table:"])
     csv_rows.append(["", "Area ({area_unit})".format(area_unit=accu_asse.pixel_area_unit), "Error", "Lower limit", "Upper limit"])
+    for idx_row, label in enumerate(labels):
+        csv_rows.append([label] + [rf(t) for t in (results.area[idx_row], results.error[idx_row],
+                                                   results.lower_limit[idx_row], results.upper_limit[idx_row])])
+    csv_rows.append(["total"] + [rf(results.total_area)])
 
-    total_area = 0
-
-    for idx_row, value in enumerate(accu_asse.values):
-        r = []
-        r.append("{} ({})".format(value, accu_asse.labels[str(value)] if str(value) in accu_asse.labels else "-"))
-
-        # area
-        area = sum(list(zip(*error_matrix_area_prop))[idx_row]) * \
-               sum([accu_asse.thematic_pixels_count[v] for v in accu_asse.values]) * accu_asse.pixel_area_value
-        r.append(rf(area))
-        total_area += area
-        # error
-        error = (sum(list(zip(*quadratic_error_matrix))[idx_row]) ** 0.5) * \
-                sum([accu_asse.thematic_pixels_count[v] for v in accu_asse.values]) * accu_asse.pixel_area_value
-        r.append(rf(error))
-        # lower limit
-        r.append(rf(area - accu_asse.z_score * error))
-        # upper limit
-        r.append(rf(area + accu_asse.z_score * error))
-        csv_rows.append(r)
-
-    csv_rows.append(["total"] + [rf(total_area)])
+    ###########################################################################
+    if accu_asse.bootstrap:
+        bootstrap = accu_asse.bootstrap
+        csv_rows.append([])
+        csv_rows.append(["6) Bootstrap confidence intervals ({} resamples, {}%):".format(
+            bootstrap.resamples, rf(bootstrap.confidence * 100, 2))])
+        csv_rows.append(["", "User accuracy", "", "Producer accuracy", "",
+                         "Area ({area_unit})".format(area_unit=accu_asse.pixel_area_unit), ""])
+        csv_rows.append([""] + ["lower", "upper"] * 3)
+        for idx_row, label in enumerate(labels):
+            csv_rows.append([label] + [rf_or_nan_dash(t) for t in (
+                bootstrap.user_accuracy[0][idx_row], bootstrap.user_accuracy[1][idx_row],
+                bootstrap.producer_accuracy[0][idx_row], bootstrap.producer_accuracy[1][idx_row],
+                bootstrap.area[0][idx_row], bootstrap.area[1][idx_row])])
+        csv_rows.append(["Overall Accuracy"] + [rf_or_nan_dash(t) for t in bootstrap.overall_accuracy])
 
     # write CSV file
     with open(file_out, 'w') as csvfile:
@@ -655,3 +477,264 @@ def export_to_csv(accu_asse, file_out, csv_separator, csv_decimal_separator):
 
         csv_w.writerows(csv_rows)
 
+
+def to_list(array):
+    """Numpy array (or scalar) to list with None for the undefined (NaN) values"""
+    values = np.asarray(array, dtype=np.float64)
+    if values.ndim == 0:
+        return None if np.isnan(values) else float(values)
+    return [to_list(v) for v in values]
+
+
+def get_results_dict(accu_asse):
+    """All results of the accuracy assessment as a dictionary of lists, the rows of the
+    matrices are the thematic raster classes and the columns the classified values
+    """
+    results = accu_asse.results
+    data = {
+        "thematic_raster": accu_asse.ThematicR.file_path,
+        "sampling_file": get_file_path_of_layer(accu_asse.classification.sampling_layer),
+        "strata": accu_asse.StrataR.file_path if accu_asse.StrataR is not None else None,
+        "samples_classified": accu_asse.classification.total_classified,
+        "samples_total": accu_asse.classification.num_points,
+        "samples_outside_the_thematic": [sample.shape_id for sample in accu_asse.samples_outside_the_thematic],
+        "area_unit": accu_asse.pixel_area_unit,
+        "z_score": accu_asse.z_score,
+        "values": list(accu_asse.values),
+        "labels": get_labels(accu_asse),
+        "error_matrix": results.error_matrix.tolist(),
+        "user_accuracy": to_list(results.user_accuracy),
+        "producer_accuracy": to_list(results.producer_accuracy),
+        "overall_accuracy_samples": to_list(results.overall_accuracy_samples),
+        "class_area": to_list(results.class_area),
+        "wi": to_list(results.wi),
+        "area_proportion": to_list(results.area_proportion),
+        "quadratic_error": to_list(results.quadratic_error),
+        "area_proportion_error": to_list(results.area_proportion_error),
+        "user_accuracy_matrix": to_list(results.user_accuracy_matrix),
+        "producer_accuracy_matrix": to_list(results.producer_accuracy_matrix),
+        "overall_accuracy": to_list(results.overall_accuracy),
+        "area": to_list(results.area),
+        "error": to_list(results.error),
+        "lower_limit": to_list(results.lower_limit),
+        "upper_limit": to_list(results.upper_limit),
+        "total_area": to_list(results.total_area),
+    }
+    if accu_asse.bootstrap:
+        bootstrap = accu_asse.bootstrap
+        data["bootstrap"] = {
+            "resamples": bootstrap.resamples,
+            "confidence": bootstrap.confidence,
+            "overall_accuracy": to_list(bootstrap.overall_accuracy),
+            "user_accuracy": to_list(bootstrap.user_accuracy),
+            "producer_accuracy": to_list(bootstrap.producer_accuracy),
+            "area": to_list(bootstrap.area),
+        }
+    data["samples"] = get_samples_table(accu_asse)
+    return data
+
+
+def get_samples_table(accu_asse):
+    """The match table of the samples classified: the thematic raster value against the
+    classified value of each sample, as a dictionary of columns
+    """
+    thematic_values = accu_asse.classification.get_thematic_values(accu_asse.ThematicR)
+    strata_values = accu_asse.get_strata_values() if accu_asse.StrataR is not None else {}
+    buttons_config = accu_asse.classification.buttons_config
+    table = OrderedDict((column, []) for column in (
+        "shape_id", "x", "y", "thematic_value", "classif_id", "classified_value", "match", "stratum"))
+    for sample in sorted((p for p in accu_asse.classification.points if p.is_classified), key=lambda p: p.shape_id):
+        thematic_value = thematic_values.get(sample.shape_id)
+        classified_value = int(buttons_config[sample.classif_id]["thematic_class"])
+        table["shape_id"].append(sample.shape_id)
+        table["x"].append(sample.QgsPnt.x())
+        table["y"].append(sample.QgsPnt.y())
+        table["thematic_value"].append(thematic_value)
+        table["classif_id"].append(sample.classif_id)
+        table["classified_value"].append(classified_value)
+        table["match"].append(thematic_value == classified_value if thematic_value is not None else None)
+        table["stratum"].append(strata_values.get(sample.shape_id))
+    return table
+
+
+def get_results_tables(accuracy_assessments):
+    """The results of one or several accuracy assessments as flat tables (dictionary of
+    columns) for load them directly in dataframes, the tables of all assessments are
+    concatenated with the thematic raster in the first column:
+
+        summary: the overall metrics by thematic raster
+        metrics: the accuracies and adjusted areas with their intervals by class
+        error_matrix: the samples, area proportion and quadratic error by matrix cell
+        samples: the match table of the samples classified
+    """
+    tables = OrderedDict([
+        ("summary", OrderedDict((column, []) for column in (
+            "thematic_raster", "sampling_file", "strata", "samples_classified", "samples_total",
+            "overall_accuracy", "overall_accuracy_lower", "overall_accuracy_upper", "overall_accuracy_samples",
+            "total_area", "area_unit", "z_score", "bootstrap_resamples", "bootstrap_confidence"))),
+        ("metrics", OrderedDict((column, []) for column in (
+            "thematic_raster", "value", "label", "samples", "class_area", "wi",
+            "user_accuracy_samples", "producer_accuracy_samples", "user_accuracy", "user_accuracy_lower",
+            "user_accuracy_upper", "producer_accuracy", "producer_accuracy_lower", "producer_accuracy_upper",
+            "area", "error", "lower_limit", "upper_limit", "area_lower", "area_upper"))),
+        ("error_matrix", OrderedDict((column, []) for column in (
+            "thematic_raster", "thematic_value", "classified_value", "samples", "area_proportion",
+            "quadratic_error"))),
+        ("samples", OrderedDict([("thematic_raster", [])])),
+    ])
+
+    for accu_asse in accuracy_assessments:
+        results = accu_asse.results
+        bootstrap = accu_asse.bootstrap
+        thematic_raster = os.path.basename(accu_asse.ThematicR.file_path)
+
+        def interval(attr, idx=None):
+            if not bootstrap:
+                return None, None
+            lower, upper = getattr(bootstrap, attr)
+            return (to_list(lower), to_list(upper)) if idx is None else (to_list(lower[idx]), to_list(upper[idx]))
+
+        summary = tables["summary"]
+        summary["thematic_raster"].append(thematic_raster)
+        summary["sampling_file"].append(os.path.basename(get_file_path_of_layer(accu_asse.classification.sampling_layer)))
+        summary["strata"].append(os.path.basename(accu_asse.StrataR.file_path) if accu_asse.StrataR is not None else None)
+        summary["samples_classified"].append(accu_asse.classification.total_classified)
+        summary["samples_total"].append(accu_asse.classification.num_points)
+        summary["overall_accuracy"].append(to_list(results.overall_accuracy))
+        lower, upper = interval("overall_accuracy")
+        summary["overall_accuracy_lower"].append(lower)
+        summary["overall_accuracy_upper"].append(upper)
+        summary["overall_accuracy_samples"].append(to_list(results.overall_accuracy_samples))
+        summary["total_area"].append(to_list(results.total_area))
+        summary["area_unit"].append(accu_asse.pixel_area_unit)
+        summary["z_score"].append(accu_asse.z_score)
+        summary["bootstrap_resamples"].append(bootstrap.resamples if bootstrap else None)
+        summary["bootstrap_confidence"].append(bootstrap.confidence if bootstrap else None)
+
+        metrics = tables["metrics"]
+        for idx, (value, label) in enumerate(zip(accu_asse.values, get_labels(accu_asse))):
+            metrics["thematic_raster"].append(thematic_raster)
+            metrics["value"].append(value)
+            metrics["label"].append(label)
+            metrics["samples"].append(int(results.row_total[idx]))
+            metrics["class_area"].append(to_list(results.class_area[idx]))
+            metrics["wi"].append(to_list(results.wi[idx]))
+            metrics["user_accuracy_samples"].append(to_list(results.user_accuracy[idx]))
+            metrics["producer_accuracy_samples"].append(to_list(results.producer_accuracy[idx]))
+            metrics["user_accuracy"].append(to_list(results.user_accuracy_matrix[idx][idx]))
+            metrics["producer_accuracy"].append(to_list(results.producer_accuracy_matrix[idx][idx]))
+            for attr in ("user_accuracy", "producer_accuracy", "area"):
+                lower, upper = interval(attr, idx)
+                metrics[attr + "_lower"].append(lower)
+                metrics[attr + "_upper"].append(upper)
+            metrics["area"].append(to_list(results.area[idx]))
+            metrics["error"].append(to_list(results.error[idx]))
+            metrics["lower_limit"].append(to_list(results.lower_limit[idx]))
+            metrics["upper_limit"].append(to_list(results.upper_limit[idx]))
+
+        error_matrix = tables["error_matrix"]
+        for idx_row, thematic_value in enumerate(accu_asse.values):
+            for idx_col, classified_value in enumerate(accu_asse.values):
+                error_matrix["thematic_raster"].append(thematic_raster)
+                error_matrix["thematic_value"].append(thematic_value)
+                error_matrix["classified_value"].append(classified_value)
+                error_matrix["samples"].append(int(results.error_matrix[idx_row][idx_col]))
+                error_matrix["area_proportion"].append(to_list(results.area_proportion[idx_row][idx_col]))
+                error_matrix["quadratic_error"].append(to_list(results.quadratic_error[idx_row][idx_col]))
+
+        samples_table = get_samples_table(accu_asse)
+        tables["samples"]["thematic_raster"] += [thematic_raster] * len(samples_table["shape_id"])
+        for column, values in samples_table.items():
+            tables["samples"].setdefault(column, []).extend(values)
+
+    return tables
+
+
+def export_to_json(accu_asse, file_out):
+    with open(file_out, 'w') as json_file:
+        json.dump(get_results_dict(accu_asse), json_file, indent=2)
+
+
+def get_batch_rows(accuracy_assessments):
+    """Combined table of the accuracy assessment of several thematic rasters against
+    the same samples, one row by thematic raster and class
+    """
+    rows = [["Thematic raster", "Overall accuracy", "Class", "Samples", "User accuracy", "Producer accuracy",
+             "Area", "Area unit", "Error", "Lower limit", "Upper limit"]]
+    for accu_asse in accuracy_assessments:
+        results = accu_asse.results
+        labels = get_labels(accu_asse)
+        for idx, label in enumerate(labels):
+            rows.append([os.path.basename(accu_asse.ThematicR.file_path), rf(results.overall_accuracy), label,
+                         int(results.row_total[idx]), rf(results.user_accuracy_matrix[idx][idx]),
+                         rf(results.producer_accuracy_matrix[idx][idx]), rf(results.area[idx]),
+                         accu_asse.pixel_area_unit, rf(results.error[idx]), rf(results.lower_limit[idx]),
+                         rf(results.upper_limit[idx])])
+    return rows
+
+
+def export_batch_to_csv(accuracy_assessments, file_out, csv_separator, csv_decimal_separator):
+    csv_rows = get_batch_rows(accuracy_assessments)
+    with open(file_out, 'w') as csvfile:
+        csv_w = csv.writer(csvfile, delimiter=str(csv_separator))
+        # replace with the user define decimal separator
+        if csv_decimal_separator != ".":
+            for idx, row in enumerate(csv_rows):
+                csv_rows[idx] = [str(item).replace('.', csv_decimal_separator) if isinstance(item, float) else item for item in row]
+        csv_w.writerows(csv_rows)
+
+
+def export_batch_to_json(accuracy_assessments, file_out):
+    with open(file_out, 'w') as json_file:
+        json.dump([get_results_dict(accu_asse) for accu_asse in accuracy_assessments], json_file, indent=2)
+
+
+def export_to_parquet(accuracy_assessments, file_out):
+    """Save the results tables as Parquet files (one file by table: <name>_<table>.parquet),
+    it needs pyarrow
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise Exception("The export to Parquet needs the python package 'pyarrow', please install it")
+
+    file_out_base = os.path.splitext(file_out)[0]
+    files_out = []
+    for name, table in get_results_tables(accuracy_assessments).items():
+        files_out.append("{}_{}.parquet".format(file_out_base, name))
+        pyarrow.parquet.write_table(pyarrow.Table.from_pydict(table), files_out[-1])
+    return files_out
+
+
+def export_to_xlsx(accuracy_assessments, file_out):
+    """Save the results tables as sheets of a XLSX file, written with the OGR driver"""
+    def field_type(values):
+        values = [value for value in values if value is not None]
+        if values and all(isinstance(value, (bool, int)) for value in values):
+            return ogr.OFTInteger64
+        if values and all(isinstance(value, (bool, int, float)) for value in values):
+            return ogr.OFTReal
+        return ogr.OFTString
+
+    driver = ogr.GetDriverByName("XLSX")
+    if driver is None:
+        raise Exception("The export to XLSX needs GDAL with the XLSX driver")
+    if os.path.isfile(file_out):
+        driver.DeleteDataSource(file_out)
+    data_source = driver.CreateDataSource(file_out)
+    if data_source is None:
+        raise Exception("Could not create the file: {}".format(file_out))
+    for name, table in get_results_tables(accuracy_assessments).items():
+        layer = data_source.CreateLayer(name, geom_type=ogr.wkbNone)
+        for column, values in table.items():
+            layer.CreateField(ogr.FieldDefn(column, field_type(values)))
+        layer_defn = layer.GetLayerDefn()
+        for row in zip(*table.values()):
+            feature = ogr.Feature(layer_defn)
+            for idx, value in enumerate(row):
+                if value is not None:
+                    feature.SetField(idx, int(value) if isinstance(value, bool) else value)
+            layer.CreateFeature(feature)
+    del data_source
+    return [file_out]
@@ -19,21 +19,22 @@
  ***************************************************************************/
 """
 import os
-import tempfile
 
 from qgis.PyQt import uic
-from qgis.PyQt.QtCore import Qt, pyqtSlot
+from qgis.PyQt.QtCore import Qt, pyqtSlot, QTimer
 from qgis.PyQt.QtWidgets import QTableWidgetItem, QSplitter, QColorDialog, QDialog, QDialogButtonBox, QPushButton, \
-    QMessageBox
+    QMessageBox, QMenu, QFileDialog, QInputDialog
 from qgis.PyQt.QtGui import QColor, QIcon
-from qgis.core import QgsCoordinateReferenceSystem, QgsCoordinateTransform, Qgis, QgsProject, QgsUnitTypes
+from qgis.core import Qgis, QgsUnitTypes, QgsApplication, QgsMapLayer, QgsMapLayerProxyModel, QgsWkbTypes
 
 from AcATaMa.core.classification import Classification
 from AcATaMa.utils.qgis_utils import valid_file_selected_in, get_current_file_path_in, \
-    load_and_select_filepath_in
-from AcATaMa.core.raster import get_color_table
+    load_and_select_filepath_in, get_file_path_of_layer
+from AcATaMa.core.raster import get_color_table, has_overviews, BuildOverviewsTask
 from AcATaMa.utils.system_utils import open_file, block_signals_to, error_handler
-from AcATaMa.gui.classification_view_widget import ClassificationViewWidget
+from AcATaMa.gui.classification_view_widget import ClassificationViewWidget, ViewSyncCoordinator, \
+    SharedRenderCache
+from AcATaMa.gui.render_diagnostics import RenderTimings, RenderDiagnosticsDialog
 
 # plugin path
 plugin_folder = os.path.dirname(os.path.dirname(__file__))
@@ -46,6 +47,14 @@ class ClassificationDialog(QDialog, FORM_CLASS):
     view_widgets = []
     current_sample = None
     instance = None
+    # number of next samples to pre-render in background in each view
+    prefetch_samples = 3
+    # coordinator of the extent synchronization between views
+    view_sync = None
+    # render latency records of the views
+    render_timings = None
+    # interval (ms) to pull the labels of the other interpreters in the shared store
+    store_sync_interval = 15000
 
     def __init__(self, sampling_layer, columns, rows):
         QDialog.__init__(self)
@@ -83,6 +92,22 @@ class ClassificationDialog(QDialog, FORM_CLASS):
 
         # open in Google Earth
         self.QPBtn_OpenInGE.clicked.connect(self.open_current_point_in_google_engine)
+        # offline cache of image chips for the views
+        self.image_chips_task = None
+        self.QPBtn_BuildChips.clicked.connect(self.build_image_chips)
+        # render latency diagnostics
+        ClassificationDialog.render_timings = RenderTimings()
+        self.QPBtn_RenderDiagnostics.clicked.connect(
+            lambda: RenderDiagnosticsDialog(ClassificationDialog.render_timings, parent=self).exec_())
+        # pre-classification of the samples from a reference layer
+        self.QPBtn_PreClassify.clicked.connect(self.pre_classify_from_reference_layer)
+        # shared store of the labels with other interpreters, the labels of the others
+        # are pulled periodically and on demand
+        self.create_shared_store_menu()
+        self.store_sync_timer = QTimer(self)
+        self.store_sync_timer.setInterval(self.store_sync_interval)
+        self.store_sync_timer.timeout.connect(self.sync_with_store)
+        self.store_sync_timer.start()
 
         # set properties and default value for the fit to sample spinBox based on sampling file
         layer_dist_unit = self.sampling_layer.crs().mapUnits()
@@ -129,6 +154,7 @@ class ClassificationDialog(QDialog, FORM_CLASS):
         self.QPBtn_SetClassification.clicked.connect(self.open_set_classification_dialog)
         self.QPBtn_unclassifySampleButton.clicked.connect(self.unclassify_sample)
 
+        ClassificationDialog.view_sync = ViewSyncCoordinator()
         # create dynamic size of the view render widgets windows
         # inside the grid with columns x rows divide by splitters
         h_splitters = []
@@ -190,6 +216,9 @@ class ClassificationDialog(QDialog, FORM_CLASS):
                     view_widget.scaleFactor.setValue(view_config["scale_factor"])
                     # active render layer in canvas
                     view_widget.set_render_layer(view_widget.QCBox_RenderFile.currentLayer())
+        # offer to build the missing overviews of the layers in the views
+        self.build_overviews_task = None
+        self.offer_to_build_overviews()
 
     def show(self):
         from AcATaMa.gui.acatama_dockwidget import AcATaMaDockWidget as AcATaMa
@@ -214,6 +243,7 @@ class ClassificationDialog(QDialog, FORM_CLASS):
             self.current_sample_idx = len(self.classification.points) - 1
         ClassificationDialog.current_sample = self.current_sample
         self.classification.current_sample_idx = self.current_sample_idx
+        ClassificationDialog.render_timings.start_sample(self.current_sample.shape_id)
         # update progress bar
         self.QPBar_SamplesNavigation.setValue(self.current_sample_idx + 1)
         # show the sample ID
@@ -238,43 +268,207 @@ class ClassificationDialog(QDialog, FORM_CLASS):
     @pyqtSlot()
     @error_handler
     def open_current_point_in_google_engine(self):
-        # create temp file
+        """Fly to the current sample in Google Earth, with a self-contained KML of all
+        samples and the view to the current sample
+        """
         from AcATaMa.gui.acatama_dockwidget import AcATaMaDockWidget as AcATaMa
-        kml_file = tempfile.mktemp(
-            prefix="point_id_{}_{}_".format(self.current_sample.shape_id, self.sampling_layer.name()),
-            suffix=".kml", dir=AcATaMa.dockwidget.tmp_dir)
-        # convert coordinates
-        crsSrc = QgsCoordinateReferenceSystem(self.sampling_layer.crs())
-        crsDest = QgsCoordinateReferenceSystem(4326)  # WGS84
-        xform = QgsCoordinateTransform(crsSrc, crsDest, QgsProject.instance())
-        # forward transformation: src -> dest
-        point = xform.transform(self.current_sample.QgsPnt)
-
-        # make file and save
-        description = "Classified as: <font color='{color}'><b> {class_name}</b></font><br/>" \
-                      "Samp. file: <em> {samp_file} </em><br/>AcATaMa Qgis-plugin".format(
-            color=self.classification.buttons_config[self.current_sample.classif_id][
-                "color"] if self.current_sample.classif_id else "gray",
-            class_name=self.classification.buttons_config[self.current_sample.classif_id][
-                "name"] if self.current_sample.classif_id else "not classified",
-            samp_file=self.sampling_layer.name())
-        kml_raw = """<?xml version="1.0" encoding="UTF-8"?>
-            <kml xmlns="http://www.opengis.net/kml/2.2">
-              <Placemark>
-                <name>{name}</name>
-                <description>{desc}</description>
-                <Point>
-                  <coordinates>{lon},{lat}</coordinates>
-                </Point>
-              </Placemark>
-            </kml>""".format(name="Sampling Point ID {}".format(self.current_sample.shape_id),
-                             desc=description, lon=point.x(), lat=point.y())
-        outfile = open(kml_file, "w")
-        outfile.writelines(kml_raw)
-        outfile.close()
+        kml_file = self.classification.write_kml_for_google_earth(AcATaMa.dockwidget.tmp_dir, self.current_sample)
 
         open_file(kml_file)
 
+    def offer_to_build_overviews(self):
+        layers = set(view_widget.render_widget.layer for view_widget in ClassificationDialog.view_widgets
+                     if view_widget.render_widget.coarse_pass and
+                     os.path.isfile(get_file_path_of_layer(view_widget.render_widget.layer)))
+        # the files with any of the bands rendered without overviews
+        file_paths = set(get_file_path_of_layer(layer) for layer in layers
+                         if not has_overviews(get_file_path_of_layer(layer), layer.renderer().usesBands()))
+        if not file_paths:
+            return
+        message = self.MsgBar.createMessage(
+            "{} layer(s) in the views don't have overviews, the render could be slow".format(len(file_paths)))
+        button = QPushButton(message)
+        button.setText("Build overviews")
+        button.clicked.connect(lambda: self.build_overviews(file_paths, layers))
+        message.layout().addWidget(button)
+        self.MsgBar.pushWidget(message, Qgis.Warning)
+
+    def build_overviews(self, file_paths, layers):
+        if self.build_overviews_task is not None:
+            return
+
+        def overviews_completed():
+            self.build_overviews_task = None
+            # reload the layers for use the overviews and disable the coarse pass
+            for layer in layers:
+                layer.dataProvider().reloadData()
+                layer.triggerRepaint()
+            for view_widget in ClassificationDialog.view_widgets:
+                if view_widget.render_widget.layer in layers:
+                    view_widget.render_widget.update_coarse_pass()
+            if ClassificationDialog.is_opened:
+                self.MsgBar.pushMessage("The overviews were built", level=Qgis.Success)
+
+        self.MsgBar.clearWidgets()
+        self.build_overviews_task = BuildOverviewsTask(file_paths)
+        self.build_overviews_task.taskCompleted.connect(overviews_completed)
+        self.build_overviews_task.taskTerminated.connect(lambda: setattr(self, "build_overviews_task", None))
+        QgsApplication.taskManager().addTask(self.build_overviews_task)
+        self.MsgBar.pushMessage("Building the overviews in background", level=Qgis.Info)
+
+    @pyqtSlot()
+    @error_handler
+    def build_image_chips(self):
+        from AcATaMa.core.image_chips import ImageChipsTask
+        if self.image_chips_task is not None:
+            self.MsgBar.pushMessage("The image chips are being built in background", level=Qgis.Info)
+            return
+        views = [(view_widget.id, view_widget.render_widget.layer, view_widget.current_scale_factor,
+                  view_widget.render_widget.canvas.size())
+                 for view_widget in ClassificationDialog.view_widgets
+                 if view_widget.is_active and view_widget.render_widget.layer is not None]
+        if not views:
+            self.MsgBar.pushMessage("There are no active views to build the image chips", level=Qgis.Warning)
+            return
+        sampling_file = get_file_path_of_layer(self.sampling_layer)
+        cache_dir = os.path.join(os.path.dirname(sampling_file),
+                                 os.path.splitext(os.path.basename(sampling_file))[0] + "_chips")
+
+        self.image_chips_task = ImageChipsTask(self.classification, cache_dir,
+                                               self.radiusFitToSample.value(), views)
+        self.image_chips_task.taskCompleted.connect(self.image_chips_completed)
+        self.image_chips_task.taskTerminated.connect(lambda: setattr(self, "image_chips_task", None))
+        QgsApplication.taskManager().addTask(self.image_chips_task)
+        self.MsgBar.pushMessage("Building the image chips in background in: {}".format(cache_dir), level=Qgis.Info)
+
+    def image_chips_completed(self):
+        """Render the chips of each view instead of the original layer"""
+        from AcATaMa.core.image_chips import is_data_chip_layer
+        vrt_files, self.image_chips_task = self.image_chips_task.vrt_files, None
+        if not ClassificationDialog.is_opened:
+            return
+        for view_widget in ClassificationDialog.view_widgets:
+            if view_widget.id not in vrt_files or view_widget.render_widget.layer is None:
+                continue
+            original_layer = view_widget.render_widget.layer
+            chips_layer = load_and_select_filepath_in(view_widget.QCBox_RenderFile, vrt_files[view_widget.id],
+                                                      layer_name="{} [chips]".format(original_layer.name()))
+            # the chips with the original data use the same style of the layer
+            if chips_layer and is_data_chip_layer(original_layer):
+                chips_layer.setRenderer(original_layer.renderer().clone())
+                chips_layer.triggerRepaint()
+        self.MsgBar.pushMessage("The image chips were built, the views are rendering the chips",
+                                level=Qgis.Success)
+
+    @pyqtSlot()
+    @error_handler
+    def pre_classify_from_reference_layer(self):
+        if not self.classification.buttons_config:
+            self.MsgBar.pushMessage("Set first the classification buttons to pre-classify the samples",
+                                    level=Qgis.Warning)
+            return
+        reference_layer_dialog = ClassificationReferenceLayer(self.classification.buttons_config,
+                                                              self.sampling_layer)
+        if not reference_layer_dialog.exec_():
+            return
+        total_classified = self.classification.classify_from_reference_layer(
+            reference_layer_dialog.QCBox_ReferenceLayer.currentLayer(),
+            reference_layer_dialog.get_values_to_buttons(),
+            band=reference_layer_dialog.band.value(),
+            attribute=reference_layer_dialog.QCBox_Attribute.currentField() or None,
+            search_radius=reference_layer_dialog.searchRadius.value(),
+            overwrite=reference_layer_dialog.overwriteClassified.isChecked())
+        self.MsgBar.pushMessage("{} samples were classified from the reference layer".format(total_classified),
+                                level=Qgis.Success if total_classified else Qgis.Warning)
+
+    def create_shared_store_menu(self):
+        menu = QMenu(self)
+        self.action_attach_store = menu.addAction("Attach a shared store...", self.attach_shared_store)
+        self.action_store_wal = menu.addAction("Use WAL journal (all interpreters in the same host)")
+        self.action_store_wal.setCheckable(True)
+        menu.addSeparator()
+        self.action_sync_store = menu.addAction("Refresh the labels from the store", self.sync_with_store)
+        self.action_claim_samples = menu.addAction("Claim a batch of samples...", self.claim_samples)
+        self.action_merge_store = menu.addAction("Merge the labels of other store...", self.merge_store)
+        self.action_detach_store = menu.addAction("Detach the shared store", self.detach_shared_store)
+        menu.aboutToShow.connect(self.update_shared_store_menu)
+        self.QPBtn_SharedStore.setMenu(menu)
+
+    def update_shared_store_menu(self):
+        store = self.classification.store
+        if store:
+            self.action_store_wal.setChecked(store.wal)
+        self.action_store_wal.setEnabled(store is None)
+        for action in (self.action_sync_store, self.action_claim_samples, self.action_merge_store,
+                       self.action_detach_store):
+            action.setEnabled(store is not None)
+
+    @pyqtSlot()
+    @error_handler
+    def sync_with_store(self):
+        """Pull the labels made by other interpreters in the shared store"""
+        if self.classification.store is None:
+            return
+        if self.classification.sync_with_store():
+            self.display_sample_status()
+
+    @pyqtSlot()
+    @error_handler
+    def attach_shared_store(self):
+        sampling_file = get_file_path_of_layer(self.sampling_layer)
+        db_path, _ = QFileDialog.getSaveFileName(self, self.tr("Select or create the shared store of the labels"),
+                                                 os.path.splitext(sampling_file)[0] + "_store.sqlite",
+                                                 self.tr("SQLite files (*.sqlite *.db);;All files (*.*)"),
+                                                 options=QFileDialog.DontConfirmOverwrite)
+        if not db_path:
+            return
+        interpreter, ok = QInputDialog.getText(self, "Shared store", "Interpreter name (empty for user@hostname):")
+        if not ok:
+            return
+        self.classification.attach_store(db_path, interpreter=interpreter.strip() or None,
+                                         wal=self.action_store_wal.isChecked())
+        # reload the current sample with the labels of the store
+        self.set_current_sample()
+        self.MsgBar.pushMessage("Shared store attached as '{}': {}".format(
+            self.classification.store.interpreter, db_path), level=Qgis.Success)
+
+    @pyqtSlot()
+    @error_handler
+    def claim_samples(self):
+        size, ok = QInputDialog.getInt(self, "Shared store", "Number of samples to claim:", 50, 1,
+                                       len(self.classification.points))
+        if not ok:
+            return
+        shape_ids = set(self.classification.claim_samples(size))
+        if not shape_ids:
+            self.MsgBar.pushMessage("There are no samples to claim, all are classified or claimed by "
+                                    "other interpreters", level=Qgis.Warning)
+            return
+        # go to the first sample claimed
+        self.current_sample_idx = next(idx for idx, point in enumerate(self.classification.points)
+                                       if point.shape_id in shape_ids)
+        self.set_current_sample()
+        self.MsgBar.pushMessage("{} samples claimed by '{}'".format(
+            len(shape_ids), self.classification.store.interpreter), level=Qgis.Success)
+
+    @pyqtSlot()
+    @error_handler
+    def merge_store(self):
+        db_path, _ = QFileDialog.getOpenFileName(self, self.tr("Select the store to merge its labels"), "",
+                                                 self.tr("SQLite files (*.sqlite *.db);;All files (*.*)"))
+        if not db_path:
+            return
+        changed = self.classification.merge_store(db_path)
+        self.set_current_sample()
+        self.MsgBar.pushMessage("{} samples changed by the labels merged".format(changed), level=Qgis.Success)
+
+    @pyqtSlot()
+    @error_handler
+    def detach_shared_store(self):
+        self.classification.detach_store()
+        self.MsgBar.pushMessage("The shared store was detached and the samples claimed were released",
+                                level=Qgis.Success)
+
     @pyqtSlot(int)
     def classify_sample(self, classif_id):
         if classif_id:
@@ -323,11 +517,25 @@ class ClassificationDialog(QDialog, FORM_CLASS):
             if view_widget.is_active:
                 # fit to current point
                 self.current_sample.fit_to(view_widget, self.radiusFitToSample.value())
+                ClassificationDialog.render_timings.extent_set(view_widget.id)
                 # create the marker
                 view_widget.render_widget.marker.show(self.current_sample)
-                if highlight and view_widget.render_widget.canvas.renderFlag():
+                if highlight and (view_widget.render_widget.canvas.renderFlag() or
+                                  view_widget.render_widget.cached_image.image is not None):
                     # highlight to marker
                     view_widget.render_widget.marker.highlight()
+        self.prefetch_next_samples()
+
+    def prefetch_next_samples(self):
+        """Pre-render in background the extents of the next samples in all active views"""
+        next_samples = self.classification.points[self.current_sample_idx + 1:
+                                                  self.current_sample_idx + 1 + self.prefetch_samples]
+        if not next_samples:
+            return
+        extents = [sample.get_fit_extent(self.radiusFitToSample.value()) for sample in next_samples]
+        for view_widget in ClassificationDialog.view_widgets:
+            if view_widget.is_active:
+                view_widget.render_widget.prefetch_extents(extents)
 
     @pyqtSlot()
     def next_sample(self):
@@ -339,11 +547,13 @@ class ClassificationDialog(QDialog, FORM_CLASS):
     @pyqtSlot()
     def next_sample_not_classified(self):
         tmp_sample_idx = self.current_sample_idx + 1
+        # skip the samples claimed by other interpreters in the shared store
+        claimed_by_others = self.classification.claimed_by_others
         while tmp_sample_idx < len(self.classification.points) and \
-                self.classification.points[tmp_sample_idx].is_classified:
+                (self.classification.points[tmp_sample_idx].is_classified or
+                 self.classification.points[tmp_sample_idx].shape_id in claimed_by_others):
             tmp_sample_idx += 1
-        if tmp_sample_idx < len(self.classification.points) and \
-                not self.classification.points[tmp_sample_idx].is_classified:
+        if tmp_sample_idx < len(self.classification.points):
             self.current_sample_idx = tmp_sample_idx
             self.set_current_sample()
 
@@ -449,6 +659,11 @@ class ClassificationDialog(QDialog, FORM_CLASS):
                  "scale_factor": view_widget.current_scale_factor}
 
         self.classification.view_widgets_config = view_widgets_config
+        # cancel the background renders and release the images cached
+        SharedRenderCache.clear()
+        ClassificationDialog.view_sync.log_stats()
+        # the samples claimed in the shared store keep claimed until their lease expires
+        self.store_sync_timer.stop()
         self.classification.dialog_size = (self.size().width(), self.size().height())
 
         ClassificationDialog.is_opened = False
@@ -674,3 +889,103 @@ class ThematicRasterClasses(QDialog, FORM_CLASS):
         self.color = self.tableOfClasses.item(row, 1).background().color()
 
         self.accept()
+
+
+FORM_CLASS, _ = uic.loadUiType(os.path.join(
+    plugin_folder, 'ui', 'classification_reference_layer.ui'))
+
+
+class ClassificationReferenceLayer(QDialog, FORM_CLASS):
+    def __init__(self, buttons_config, sampling_layer):
+        QDialog.__init__(self)
+        self.setupUi(self)
+        self.buttons_config = buttons_config
+        # set properties to QgsMapLayerComboBox
+        self.QCBox_ReferenceLayer.setCurrentIndex(-1)
+        self.QCBox_ReferenceLayer.setFilters(QgsMapLayerProxyModel.RasterLayer | QgsMapLayerProxyModel.HasGeometry)
+        self.QCBox_ReferenceLayer.setExceptedLayerList([sampling_layer])
+        self.QCBox_ReferenceLayer.layerChanged.connect(self.reference_layer_changed)
+        # the search radius in the units of the sampling layer
+        self.searchRadius.setSuffix(" {}".format(QgsUnitTypes.toAbbreviatedString(sampling_layer.crs().mapUnits())))
+        self.reference_layer_changed(self.QCBox_ReferenceLayer.currentLayer())
+        self.create_table()
+        #
+        self.buttonBox.button(QDialogButtonBox.Ok).clicked.connect(self.check_before_accept)
+        self.buttonBox.button(QDialogButtonBox.Cancel).clicked.connect(self.reject)
+
+    def create_table(self):
+        header = ["Classification Name", "Reference Value"]
+        self.buttons_ids = sorted(self.buttons_config.keys())
+        # init table
+        self.tableValuesToButtons.setRowCount(len(self.buttons_ids))
+        self.tableValuesToButtons.setColumnCount(2)
+        # hidden row labels
+        self.tableValuesToButtons.verticalHeader().setVisible(False)
+        # add Header
+        self.tableValuesToButtons.setHorizontalHeaderLabels(header)
+        # insert items, the reference value by default is the thematic class of the button
+        for m, classif_id in enumerate(self.buttons_ids):
+            item_table = QTableWidgetItem(self.buttons_config[classif_id]["name"])
+            item_table.setForeground(QColor(self.buttons_config[classif_id]["color"]))
+            item_table.setFlags(Qt.ItemIsSelectable | Qt.ItemIsEnabled)
+            item_table.setTextAlignment(Qt.AlignCenter | Qt.AlignVCenter)
+            item_table.setToolTip("Classification button ID: {}".format(classif_id))
+            self.tableValuesToButtons.setItem(m, 0, item_table)
+            item_table = QTableWidgetItem(self.buttons_config[classif_id]["thematic_class"] or "")
+            item_table.setTextAlignment(Qt.AlignCenter | Qt.AlignVCenter)
+            item_table.setToolTip("The value in the reference layer for this classification, "
+                                  "empty for not use it")
+            self.tableValuesToButtons.setItem(m, 1, item_table)
+        # adjust size of Table
+        self.tableValuesToButtons.resizeColumnsToContents()
+        self.tableValuesToButtons.resizeRowsToContents()
+
+    @pyqtSlot(QgsMapLayer)
+    def reference_layer_changed(self, layer):
+        is_raster = layer is not None and layer.type() == QgsMapLayer.RasterLayer
+        is_vector = layer is not None and not is_raster
+        # band for raster layers
+        self.band.setEnabled(is_raster)
+        self.band.setMaximum(layer.bandCount() if is_raster else 1)
+        # attribute for vector layers
+        self.QCBox_Attribute.setLayer(layer if is_vector else None)
+        self.QCBox_Attribute.setEnabled(is_vector)
+        # search radius for point and line layers
+        self.searchRadius.setEnabled(is_vector and layer.geometryType() != QgsWkbTypes.PolygonGeometry)
+
+    def get_values_to_buttons(self):
+        """The classification button for each reference value set in the table
+
+        Returns:
+            dict: {reference value: classif_id}, the values that are numbers are set as
+                number (for the pixel values and numeric attributes) and as text
+        """
+        values_to_buttons = {}
+        for row, classif_id in enumerate(self.buttons_ids):
+            value = self.tableValuesToButtons.item(row, 1).text().strip()
+            if value == "":
+                continue
+            values_to_buttons[value] = classif_id
+            try:
+                values_to_buttons[float(value)] = classif_id
+            except ValueError:
+                pass
+        return values_to_buttons
+
+    @pyqtSlot()
+    def check_before_accept(self):
+        reference_layer = self.QCBox_ReferenceLayer.currentLayer()
+        msg = None
+        if reference_layer is None:
+            msg = "Select a valid reference layer, a raster or a vector layer."
+        elif reference_layer.type() != QgsMapLayer.RasterLayer and not self.QCBox_Attribute.currentField():
+            msg = "Select the attribute of the reference layer with the values to classify the samples."
+        elif not self.get_values_to_buttons():
+            msg = "Set the reference value at least for one classification button."
+        elif reference_layer.type() == QgsMapLayer.RasterLayer and \
+                any(isinstance(value, float) and not value.is_integer() for value in self.get_values_to_buttons()):
+            msg = "The reference values of a raster layer must be integer classes (pixel values)."
+        if msg:
+            QMessageBox.warning(self, 'Problems with the reference layer', msg, QMessageBox.Ok)
+            return
+        self.accept()
@@ -19,26 +19,72 @@
  ***************************************************************************/
 """
 import os
+from collections import OrderedDict
 
 from qgis.PyQt import uic
-from qgis.PyQt.QtGui import QColor
+from qgis.PyQt.QtGui import QColor, QPalette
 from qgis.PyQt.QtWidgets import QWidget, QGridLayout, QFileDialog
-from qgis.PyQt.QtCore import QSettings, pyqtSlot, QTimer, Qt
-from qgis.core import QgsGeometry, QgsMapLayerProxyModel, QgsWkbTypes, QgsPoint
-from qgis.gui import QgsMapCanvas, QgsMapToolPan, QgsRubberBand, QgsVertexMarker
+from qgis.PyQt.QtCore import QSettings, pyqtSlot, QTimer, Qt, QObject, QSize
+from qgis.core import QgsGeometry, QgsMapLayerProxyModel, QgsWkbTypes, QgsPoint, QgsMapRendererParallelJob, \
+    QgsMapSettings, QgsRectangle, QgsMessageLog, Qgis, QgsMapLayerStyle, QgsRasterLayer
+from qgis.gui import QgsMapCanvas, QgsMapToolPan, QgsRubberBand, QgsVertexMarker, QgsMapCanvasItem
 from qgis.utils import iface
 
-from AcATaMa.utils.qgis_utils import load_and_select_filepath_in, StyleEditorDialog
+from AcATaMa.core.raster import has_overviews
+from AcATaMa.utils.qgis_utils import load_and_select_filepath_in, StyleEditorDialog, get_file_path_of_layer
 from AcATaMa.utils.system_utils import block_signals_to
 
 
+class ViewSyncCoordinator(QObject):
+    """Coalesce the extent changes of the views (pan, wheel and key events) and
+    update the other views only with the final extent, when no more changes
+    arrive within a frame
+    """
+    interval = 16  # ms
+
+    def __init__(self):
+        QObject.__init__(self)
+        self.source_view = None
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(self.interval)
+        self.timer.timeout.connect(self.sync)
+        # counters for check the renders made
+        self.requests = 0
+        self.syncs = 0
+        self.renders = 0
+
+    def request_sync(self, source_view):
+        # restart the timer, the previous requests are superseded
+        self.source_view = source_view
+        self.requests += 1
+        self.timer.start()
+
+    def sync(self):
+        source_view, self.source_view = self.source_view, None
+        if source_view is None or not source_view.is_active:
+            return
+        self.syncs += 1
+        source_view.canvas_changed()
+
+    def count_render(self):
+        self.renders += 1
+
+    def log_stats(self):
+        QgsMessageLog.logMessage(
+            "View sync: {} extent changes coalesced in {} updates, {} renders started".format(
+                self.requests, self.syncs, self.renders), "AcATaMa", Qgis.Info)
+        self.requests = self.syncs = self.renders = 0
+
+
 class PanAndZoomPointTool(QgsMapToolPan):
     def __init__(self, render_widget):
         QgsMapToolPan.__init__(self, render_widget.canvas)
         self.render_widget = render_widget
 
     def update_canvas(self):
-        self.render_widget.parent_view.canvas_changed()
+        from AcATaMa.gui.classification_dialog import ClassificationDialog
+        ClassificationDialog.view_sync.request_sync(self.render_widget.parent_view)
 
     def canvasReleaseEvent(self, event):
         QgsMapToolPan.canvasReleaseEvent(self, event)
@@ -46,11 +92,11 @@ class PanAndZoomPointTool(QgsMapToolPan):
 
     def wheelEvent(self, event):
         QgsMapToolPan.wheelEvent(self, event)
-        QTimer.singleShot(10, self.update_canvas)
+        self.update_canvas()
 
     def keyReleaseEvent(self, event):
         if event.key() in [Qt.Key_Up, Qt.Key_Down, Qt.Key_Right, Qt.Key_Left, Qt.Key_PageUp, Qt.Key_PageDown]:
-            QTimer.singleShot(10, self.update_canvas)
+            self.update_canvas()
 
 
 class Marker(object):
@@ -95,27 +141,222 @@ class Marker(object):
         self.canvas.refresh()
 
 
+class CachedImageItem(QgsMapCanvasItem):
+    """Show a pre-rendered image over the map of the canvas, instead of the live render
+    (the image of the shared render cache) or until the live render finishes (the coarse
+    pass), it is removed when the canvas is refreshed
+    """
+    def __init__(self, canvas):
+        QgsMapCanvasItem.__init__(self, canvas)
+        self.image = None
+        # over the map image of the canvas (-10) and under the marker
+        self.setZValue(-5)
+        canvas.mapCanvasRefreshed.connect(self.clear)
+
+    def show_image(self, image, extent):
+        self.image = image
+        self.setRect(extent)
+        self.show()
+        self.update()
+
+    def clear(self):
+        if self.image is not None:
+            self.image = None
+            self.hide()
+
+    def paint(self, painter, option=None, widget=None):
+        if self.image is not None:
+            painter.drawImage(self.boundingRect(), self.image)
+
+
+# the map render jobs running, also the canceled ones, are kept referenced until they emit
+# finished, a job deleted before it finishes can crash QGIS
+render_jobs = set()
+
+
+def start_render_job(settings, on_finished):
+    """Start a parallel map render job in background, on_finished(job) is called when
+    it finishes (or it is canceled), then the job is released with deleteLater
+
+    Returns:
+        QgsMapRendererParallelJob: the job started
+    """
+    job = QgsMapRendererParallelJob(settings)
+    render_jobs.add(job)
+
+    def finished():
+        render_jobs.discard(job)
+        try:
+            on_finished(job)
+        finally:
+            job.deleteLater()
+
+    job.finished.connect(finished)
+    job.start()
+    return job
+
+
+class SharedRenderCache(object):
+    """Plugin-level cache of the rendered images shared by all views, keyed by the
+    layers (id and style hash), CRS, extent and output size of the render. The images
+    are rendered in background with parallel map render jobs (the next samples) and
+    kept in a bounded LRU, a view with the same parameters shows the image instead of
+    doing its own live render of the layer.
+    """
+    cache_size = 64
+    max_jobs = 4
+    images = OrderedDict()
+    jobs = {}
+    pending = OrderedDict()
+    style_hashes = {}
+    layers_connected = set()
+
+    @classmethod
+    def style_hash(cls, layer):
+        if layer.id() not in cls.style_hashes:
+            style = QgsMapLayerStyle()
+            style.readFromLayer(layer)
+            cls.style_hashes[layer.id()] = hash(style.xmlData())
+            # invalidate the hash when the style changes, and release the layer when it is deleted
+            if layer.id() not in cls.layers_connected:
+                invalidate = lambda layer_id=layer.id(): cls.style_hashes.pop(layer_id, None)
+                layer.styleChanged.connect(invalidate)
+                layer.rendererChanged.connect(invalidate)
+                layer.willBeDeleted.connect(lambda layer_id=layer.id(): cls.release_layer(layer_id))
+                cls.layers_connected.add(layer.id())
+        return cls.style_hashes[layer.id()]
+
+    @classmethod
+    def release_layer(cls, layer_id):
+        """Drop the style hash and the images of the layer deleted"""
+        cls.style_hashes.pop(layer_id, None)
+        cls.layers_connected.discard(layer_id)
+        for key in [key for key in cls.images if any(item[0] == layer_id for item in key[0])]:
+            del cls.images[key]
+        for key in [key for key in cls.pending if any(item[0] == layer_id for item in key[0])]:
+            del cls.pending[key]
+
+    @classmethod
+    def key(cls, settings):
+        extent = settings.extent()
+        return (tuple((layer.id(), cls.style_hash(layer)) for layer in settings.layers()),
+                settings.destinationCrs().authid(), settings.outputSize().width(), settings.outputSize().height(),
+                round(extent.xMinimum(), 6), round(extent.yMinimum(), 6),
+                round(extent.xMaximum(), 6), round(extent.yMaximum(), 6))
+
+    @classmethod
+    def get(cls, settings):
+        """Return the (image, visible extent) rendered for these map settings, if any"""
+        key = cls.key(settings)
+        if key in cls.images:
+            cls.images.move_to_end(key)
+            return cls.images[key]
+
+    @classmethod
+    def render(cls, settings):
+        """Queue the render in background for these map settings"""
+        key = cls.key(settings)
+        if key in cls.images or key in cls.jobs or key in cls.pending:
+            return
+        cls.pending[key] = settings
+        while len(cls.pending) > cls.cache_size:
+            cls.pending.popitem(last=False)
+        cls.start_jobs()
+
+    @classmethod
+    def start_jobs(cls):
+        while cls.pending and len(cls.jobs) < cls.max_jobs:
+            key, settings = cls.pending.popitem(last=False)
+            cls.jobs[key] = start_render_job(settings, lambda job, key=key: cls.job_finished(key, job))
+
+    @classmethod
+    def job_finished(cls, key, job):
+        # ignore the jobs canceled
+        if cls.jobs.get(key) is not job:
+            return
+        del cls.jobs[key]
+        if not job.errors():
+            cls.images[key] = (job.renderedImage(), job.mapSettings().visibleExtent())
+            while len(cls.images) > cls.cache_size:
+                cls.images.popitem(last=False)
+        cls.start_jobs()
+
+    @classmethod
+    def clear(cls):
+        cls.pending.clear()
+        for job in cls.jobs.values():
+            job.cancelWithoutBlocking()
+        cls.jobs.clear()
+        cls.images.clear()
+
+
 class RenderWidget(QWidget):
+    # factor of reduction of the output size for the coarse render pass
+    coarse_factor = 4
+
     def __init__(self, parent=None):
         QWidget.__init__(self, parent)
         self.setupUi()
         self.layer = None
-        self.marker = Marker(self.canvas)
+        # quick render at low resolution before the full render, for rasters without overviews
+        self.coarse_pass = False
+        self.coarse_job = None
 
     def setupUi(self):
-        gridLayout = QGridLayout(self)
-        gridLayout.setContentsMargins(0, 0, 0, 0)
+        self.gridLayout = QGridLayout(self)
+        self.gridLayout.setContentsMargins(0, 0, 0, 0)
+        self.setMinimumSize(15, 15)
+        # background for the view without canvas
+        palette = self.palette()
+        palette.setColor(QPalette.Window, QColor(245, 245, 245))
+        self.setPalette(palette)
+        self.setAutoFillBackground(True)
+        # the canvas is created when the view gets a layer and it is released when the view is disabled
+        self.canvas = None
+        self.marker = None
+        self.cached_image = None
+
+    def create_canvas(self):
+        if self.canvas is not None:
+            return
         self.canvas = QgsMapCanvas()
         self.canvas.setCanvasColor(QColor(255, 255, 255))
         self.canvas.setStyleSheet("border: 0px;")
         settings = QSettings()
         self.canvas.enableAntiAliasing(settings.value("/qgis/enable_anti_aliasing", False, type=bool))
-        self.setMinimumSize(15, 15)
         # mouse action pan and zoom
         self.pan_zoom_tool = PanAndZoomPointTool(self)
         self.canvas.setMapTool(self.pan_zoom_tool)
+        # count the renders and record the render latency of this view
+        from AcATaMa.gui.classification_dialog import ClassificationDialog
+        self.canvas.renderStarting.connect(ClassificationDialog.view_sync.count_render)
+        self.canvas.renderStarting.connect(
+            lambda: ClassificationDialog.render_timings.render_started(self.parent_view.id))
+        self.canvas.mapCanvasRefreshed.connect(
+            lambda: ClassificationDialog.render_timings.render_finished(self.parent_view.id))
+        self.marker = Marker(self.canvas)
+        self.cached_image = CachedImageItem(self.canvas)
+        # the extent changed by the view itself (pan and zoom) is rendered live
+        self.canvas.extentsChanged.connect(self.resume_live_render)
+
+        self.gridLayout.addWidget(self.canvas)
 
-        gridLayout.addWidget(self.canvas)
+    def release_canvas(self):
+        """Release the canvas with its render cache and items"""
+        if self.canvas is None:
+            return
+        self.disconnect_layer()
+        if self.coarse_job:
+            self.coarse_job.cancelWithoutBlocking()
+            self.coarse_job = None
+        self.canvas.stopRendering()
+        self.canvas.clearCache()
+        self.gridLayout.removeWidget(self.canvas)
+        self.canvas.deleteLater()
+        self.canvas = None
+        self.pan_zoom_tool = None
+        self.marker = None
+        self.cached_image = None
 
     def render_layer(self, layer):
         with block_signals_to(self):
@@ -127,7 +368,8 @@ class RenderWidget(QWidget):
             # set init extent from other view if any is activated else set layer extent
             from AcATaMa.gui.classification_dialog import ClassificationDialog
             others_view = [(view_widget.render_widget.canvas.extent(), view_widget.current_scale_factor) for view_widget
-                           in ClassificationDialog.view_widgets if not view_widget.render_widget.canvas.extent().isEmpty()]
+                           in ClassificationDialog.view_widgets if view_widget.render_widget.canvas is not None and
+                           not view_widget.render_widget.canvas.extent().isEmpty()]
             if others_view:
                 extent, scale = others_view[0]
                 extent.scale(1 / scale)
@@ -136,18 +378,100 @@ class RenderWidget(QWidget):
                 ClassificationDialog.current_sample.fit_to(
                     self.parent_view, ClassificationDialog.instance.radiusFitToSample.value())
 
+            self.disconnect_layer()
+            self.canvas.setRenderFlag(True)
             self.canvas.refresh()
             self.layer = layer
+            # the image cached of the layer is not valid after a repaint (style changes)
+            self.layer.repaintRequested.connect(self.resume_live_render)
+            self.update_coarse_pass()
             # show marker
             if ClassificationDialog.current_sample:
                 self.marker.show(ClassificationDialog.current_sample)
 
+    def disconnect_layer(self):
+        if self.layer is None:
+            return
+        try:
+            self.layer.repaintRequested.disconnect(self.resume_live_render)
+        except (TypeError, RuntimeError):
+            pass
+
+    def resume_live_render(self):
+        """Render live the canvas again after it was showing an image of the shared cache"""
+        if self.canvas is not None and not self.canvas.renderFlag():
+            self.canvas.setRenderFlag(True)
+
+    def get_map_settings(self, extent):
+        """Map settings of this view for the extent with the scale factor"""
+        scaled_extent = QgsRectangle(extent)
+        scaled_extent.scale(self.parent_view.scaleFactor.value())
+        settings = QgsMapSettings(self.canvas.mapSettings())
+        settings.setExtent(scaled_extent)
+        return settings
+
     def set_extents_and_scalefactor(self, extent):
+        if self.canvas is None:
+            return
+        # serve the canvas with the pre-rendered image (if any) instead of the live render
+        cached = SharedRenderCache.get(self.get_map_settings(extent)) if self.layer else None
         with block_signals_to(self.canvas):
+            # hold the live render, while the cached image is shown or until the coarse pass finishes
+            if cached or self.coarse_pass:
+                self.canvas.setRenderFlag(False)
             self.canvas.setExtent(extent)
             self.canvas.zoomByFactor(self.parent_view.scaleFactor.value())
             if self.marker.marker:
                 self.marker.marker.updatePosition()
+        if cached:
+            self.cached_image.show_image(*cached)
+        else:
+            self.cached_image.clear()
+            if self.coarse_pass:
+                self.render_coarse_pass(extent)
+            else:
+                self.resume_live_render()
+
+    def update_coarse_pass(self):
+        """The coarse pass only for the rasters without overviews in any of the bands rendered"""
+        if not isinstance(self.layer, QgsRasterLayer):
+            self.coarse_pass = False
+            return
+        file_path = get_file_path_of_layer(self.layer)
+        if os.path.isfile(file_path):
+            self.coarse_pass = not has_overviews(file_path, self.layer.renderer().usesBands())
+        else:
+            self.coarse_pass = not self.layer.dataProvider().hasPyramids()
+
+    def render_coarse_pass(self, extent):
+        """Render in background the layer (without the sampling) with decimated reads, it is
+        shown over the canvas until the full render finishes. The full render starts after
+        the coarse pass finishes, not reading the same raster at the same time
+        """
+        if self.coarse_job:
+            self.coarse_job.cancelWithoutBlocking()
+        settings = self.get_map_settings(extent)
+        settings.setLayers([self.layer])
+        settings.setOutputSize(QSize(max(1, settings.outputSize().width() // self.coarse_factor),
+                                     max(1, settings.outputSize().height() // self.coarse_factor)))
+        self.coarse_job = start_render_job(settings, self.coarse_pass_finished)
+
+    def coarse_pass_finished(self, job):
+        # ignore the coarse renders superseded
+        if job is not self.coarse_job:
+            return
+        self.coarse_job = None
+        if self.canvas is None:
+            return
+        if not job.errors():
+            self.cached_image.show_image(job.renderedImage(), job.mapSettings().visibleExtent())
+        self.resume_live_render()
+
+    def prefetch_extents(self, extents):
+        if not self.layer or not self.canvas.isVisible():
+            return
+        for extent in extents:
+            SharedRenderCache.render(self.get_map_settings(extent))
 
     def layer_style_editor(self):
         style_editor_dlg = StyleEditorDialog(self.layer, self.canvas, self.parent_view)
@@ -201,16 +525,13 @@ class ClassificationViewWidget(QWidget, FORM_CLASS):
             self.scaleFactorLabel.setEnabled(True)
             self.scaleFactor.setEnabled(True)
             self.layerStyleEditor.setEnabled(True)
-            self.render_widget.canvas.setCanvasColor(QColor(255, 255, 255))
+            self.render_widget.create_canvas()
             # set status for view widget
             self.is_active = True
 
     def disable(self):
         with block_signals_to(self.render_widget):
-            self.render_widget.canvas.setLayers([])
-            self.render_widget.marker.remove()
-            self.render_widget.canvas.clearCache()
-            self.render_widget.canvas.refresh()
+            self.render_widget.release_canvas()
             self.render_widget.layer = None
             # deactivate some parts of this view
             self.QLabel_ViewID.setDisabled(True)
@@ -219,7 +540,6 @@ class ClassificationViewWidget(QWidget, FORM_CLASS):
             self.scaleFactorLabel.setDisabled(True)
             self.scaleFactor.setDisabled(True)
             self.layerStyleEditor.setDisabled(True)
-            self.render_widget.canvas.setCanvasColor(QColor(245, 245, 245))
             # set status for view widget
             self.is_active = False
 
@@ -247,13 +567,18 @@ class ClassificationViewWidget(QWidget, FORM_CLASS):
             view_extent = self.render_widget.canvas.extent()
             view_extent.scale(1/self.current_scale_factor)
 
-            # set extent and scale factor for all view activated except this view
+            # set extent and scale factor for all view activated except this view,
+            # cancel first the render in progress for the previous extent
             for view_widget in ClassificationDialog.view_widgets:
                 if view_widget.is_active and view_widget != self:
+                    view_widget.render_widget.canvas.stopRendering()
                     view_widget.render_widget.set_extents_and_scalefactor(view_extent)
 
     @pyqtSlot()
     def scalefactor_changed(self):
+        if self.render_widget.canvas is None:
+            self.current_scale_factor = self.scaleFactor.value()
+            return
         # adjust view with the original extent (scale factor=1)
         # and with the new scale factor
         view_extent = self.render_widget.canvas.extent()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ AcATaMa
+                                 A QGIS plugin
+ AcATaMa is a Qgis plugin for Accuracy Assessment of Thematic Maps
+                              -------------------
+        copyright            : (C) 2017-2019 by Xavier Corredor Llano, SMByC
+        email                : xcorredorl@ideam.gov.co
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import csv
+import os
+import time
+
+import numpy as np
+from qgis.PyQt import uic
+from qgis.PyQt.QtCore import pyqtSlot
+from qgis.PyQt.QtWidgets import QDialog, QTableWidgetItem, QFileDialog
+from qgis.core import Qgis
+from qgis.utils import iface
+
+
+class RenderTimings(object):
+    """Record the render latency per view per sample, the times (ms) are counted
+    since the sample was set in the classification dialog
+    """
+    metrics = ["extent_set", "render_start", "render_finish"]
+
+    def __init__(self):
+        # [{"sample_id", "view", "extent_set", "render_start", "render_finish"}, ...]
+        self.records = []
+        self.current = {}
+        self.sample_id = None
+        self.start_time = None
+
+    def start_sample(self, sample_id):
+        self.flush()
+        self.sample_id = sample_id
+        self.start_time = time.perf_counter()
+
+    def flush(self):
+        """Save the records of the current sample, included the incomplete renders"""
+        self.records += self.current.values()
+        self.current = {}
+
+    def elapsed(self):
+        return (time.perf_counter() - self.start_time) * 1000
+
+    def extent_set(self, view_id):
+        if self.start_time is None:
+            return
+        self.current[view_id] = {"sample_id": self.sample_id, "view": view_id + 1, "extent_set": self.elapsed(),
+                                 "render_start": None, "render_finish": None}
+
+    def render_started(self, view_id):
+        # only the first render after the extent was set for the sample
+        if view_id in self.current and self.current[view_id]["render_start"] is None:
+            self.current[view_id]["render_start"] = self.elapsed()
+
+    def render_finished(self, view_id):
+        if view_id in self.current and self.current[view_id]["render_start"] is not None \
+                and self.current[view_id]["render_finish"] is None:
+            self.current[view_id]["render_finish"] = self.elapsed()
+
+    def stats(self):
+        """Percentiles 50 and 95 of each metric by view and for all views
+
+        Returns:
+            list: [(view, samples, {metric: (p50, p95)}), ...]
+        """
+        records = self.records + list(self.current.values())
+        views = sorted(set(record["view"] for record in records))
+        stats = []
+        for view in views + ["All"]:
+            view_records = [record for record in records if view == "All" or record["view"] == view]
+            metrics = {}
+            for metric in self.metrics:
+                values = [record[metric] for record in view_records if record[metric] is not None]
+                metrics[metric] = tuple(np.percentile(values, [50, 95])) if values else (None, None)
+            stats.append((view, len(view_records), metrics))
+        return stats
+
+    def export_to_csv(self, file_out):
+        with open(file_out, 'w') as csvfile:
+            csv_w = csv.writer(csvfile)
+            csv_w.writerow(["sample_id", "view"] + [metric + "_ms" for metric in self.metrics])
+            for record in self.records + list(self.current.values()):
+                csv_w.writerow([record["sample_id"], record["view"]] +
+                               ["" if record[metric] is None else round(record[metric], 2) for metric in self.metrics])
+
+    def clear(self):
+        self.records = []
+        self.current = {}
+
+
+# plugin path
+plugin_folder = os.path.dirname(os.path.dirname(__file__))
+FORM_CLASS, _ = uic.loadUiType(os.path.join(
+    plugin_folder, 'ui', 'render_diagnostics_dialog.ui'))
+
+
+class RenderDiagnosticsDialog(QDialog, FORM_CLASS):
+    def __init__(self, render_timings, parent=None):
+        QDialog.__init__(self, parent)
+        self.setupUi(self)
+        self.render_timings = render_timings
+        self.QPBtn_ExportCSV.clicked.connect(self.export_to_csv)
+        self.QPBtn_Refresh.clicked.connect(self.update_table)
+        self.QPBtn_Clear.clicked.connect(lambda: (self.render_timings.clear(), self.update_table()))
+        self.update_table()
+
+    def update_table(self):
+        header = ["View", "Samples"] + ["{} {}".format(metric.replace("_", " "), p)
+                                        for metric in RenderTimings.metrics for p in ("p50", "p95")]
+        stats = self.render_timings.stats()
+        self.tableStats.clear()
+        self.tableStats.setColumnCount(len(header))
+        self.tableStats.setHorizontalHeaderLabels(header)
+        self.tableStats.setRowCount(len(stats))
+        for row, (view, samples, metrics) in enumerate(stats):
+            items = [str(view), str(samples)] + ["-" if value is None else "{:.0f}".format(value)
+                                                 for metric in RenderTimings.metrics for value in metrics[metric]]
+            for column, item in enumerate(items):
+                self.tableStats.setItem(row, column, QTableWidgetItem(item))
+        self.tableStats.resizeColumnsToContents()
+
+    @pyqtSlot()
+    def export_to_csv(self):
+        file_out, _ = QFileDialog.getSaveFileName(self, self.tr("Export the render latency records to csv"),
+                                                  "", self.tr("CSV files (*.csv);;All files (*.*)"))
+        if file_out != '':
+            self.render_timings.export_to_csv(file_out)
+            iface.messageBar().pushMessage("AcATaMa", "File saved successfully \"{}\"".format(
+                os.path.basename(file_out)), level=Qgis.Success)
@@ -18,13 +18,18 @@
  *                                                                         *
  ***************************************************************************/
 """
+import os
+import tempfile
+import threading
+from collections import OrderedDict
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 import multiprocessing
 import xml.etree.ElementTree as ET
-from osgeo import gdal, gdalnumeric
+from osgeo import gdal, ogr
 
 from AcATaMa.utils.qgis_utils import get_file_path_of_layer
-from AcATaMa.utils.system_utils import wait_process
+from AcATaMa.utils.system_utils import wait_process, in_main_thread
 
 
 def mask(input_list, boolean_mask):
@@ -43,7 +48,57 @@ def mask(input_list, boolean_mask):
 # --------------------------------------------------------------------------
 
 
-def get_pixel_values(layer, band):
+# the classes (value, color, alpha) of the raster layer styles parsed, by (layer id, band),
+# bounded LRU, the classes of a layer are cleared when its style or renderer changes and
+# when the layer is deleted
+style_class_tables = OrderedDict()
+style_class_tables_size = 64
+style_class_tables_lock = threading.Lock()
+style_watched_layers = set()
+
+
+def clear_style_class_tables(layer_id, unwatch=False):
+    with style_class_tables_lock:
+        for key in [key for key in style_class_tables if key[0] == layer_id]:
+            del style_class_tables[key]
+        if unwatch:
+            style_watched_layers.discard(layer_id)
+
+
+def watch_layer_style(layer):
+    """Connect the signals of the layer that clear its classes cached, only in the main
+    thread (the layer lives there, the connections from a worker thread may never fire)
+
+    Returns:
+        bool: if the layer is watched
+    """
+    if layer.id() in style_watched_layers:
+        return True
+    if not in_main_thread():
+        return False
+    layer_id = layer.id()
+    layer.styleChanged.connect(lambda: clear_style_class_tables(layer_id))
+    layer.rendererChanged.connect(lambda: clear_style_class_tables(layer_id))
+    layer.willBeDeleted.connect(lambda: clear_style_class_tables(layer_id, unwatch=True))
+    style_watched_layers.add(layer_id)
+    return True
+
+
+def get_style_class_table(layer, band):
+    """Get the classes of the style of the raster layer in the band, for singleband
+    pseudocolor or unique values (paletted) renderers. The style is serialized and
+    parsed only the first time, then it is cached until the style of the layer changes
+    (only the layers watched from the main thread are cached)
+
+    Returns:
+        tuple: ((value, color, alpha), ...) as strings of the style items
+    """
+    key = (layer.id(), band)
+    with style_class_tables_lock:
+        if key in style_class_tables:
+            style_class_tables.move_to_end(key)
+            return style_class_tables[key]
+
     current_style = layer.styleManager().currentStyle()
     layer_style = layer.styleManager().style(current_style)
     xml_style_str = layer_style.xmlData()
@@ -55,10 +110,82 @@ def get_pixel_values(layer, band):
         # for unique values
         items = xml_style.findall('pipe/rasterrenderer[@band="{}"]/colorPalette/paletteEntry'.format(band))
 
-    pixel_values = []
-    for item in items:
-        pixel_values.append(int(item.get("value")))
-    return pixel_values
+    class_table = tuple((item.get("value"), item.get("color"), item.get("alpha")) for item in items)
+    if watch_layer_style(layer):
+        with style_class_tables_lock:
+            style_class_tables[key] = class_table
+            while len(style_class_tables) > style_class_tables_size:
+                style_class_tables.popitem(last=False)
+    return class_table
+
+
+def get_pixel_values(layer, band):
+    return [int(value) for value, _, _ in get_style_class_table(layer, band)]
+
+# --------------------------------------------------------------------------
+
+
+def get_points_from_ogr(file_path, layer_name=None, id_field="id"):
+    """Read in bulk only the coordinates and the id field of a point vector file,
+    all other fields are ignored. It uses the Arrow stream interface of OGR when
+    it is available (GDAL >= 3.6) else a light iteration over the OGR features
+
+    Args:
+        file_path (str): the vector file path
+        layer_name (str): the layer name inside the file, None for the first layer
+        id_field (str): the field name of the id (case insensitive)
+
+    Returns:
+        tuple: (shape_ids, xs, ys) the shape_ids is None if the layer doesn't have the id field,
+               it raises an exception if any feature doesn't have geometry
+    """
+    ogr_file = ogr.Open(file_path, 0)
+    ogr_layer = ogr_file.GetLayerByName(layer_name) if layer_name else ogr_file.GetLayer(0)
+    layer_defn = ogr_layer.GetLayerDefn()
+    field_names = [layer_defn.GetFieldDefn(i).GetName() for i in range(layer_defn.GetFieldCount())]
+    id_field = next((name for name in field_names if name == id_field), None) or \
+               next((name for name in field_names if name.lower() == id_field.lower()), None)
+    ogr_layer.SetIgnoredFields([name for name in field_names if name != id_field] + ["OGR_STYLE"])
+
+    shape_ids, xs, ys = [], [], []
+    if hasattr(ogr_layer, "GetArrowStreamAsNumPy"):
+        geom_column = ogr_layer.GetGeometryColumn() or "wkb_geometry"
+        stream = ogr_layer.GetArrowStreamAsNumPy(options=["INCLUDE_FID=NO", "GEOMETRY_ENCODING=WKB"])
+        for batch in stream:
+            wkb_geoms = batch[geom_column]
+            if all(wkb is not None and len(wkb) == 21 for wkb in wkb_geoms):
+                # 2D points in WKB: byte order (1), geometry type (4), x (8), y (8)
+                wkb_points = np.frombuffer(b"".join(wkb_geoms), dtype=[("order", "u1"), ("type", "<u4"),
+                                                                        ("x", "<f8"), ("y", "<f8")])
+                if (wkb_points["order"] == 1).all():
+                    xs.append(wkb_points["x"])
+                    ys.append(wkb_points["y"])
+                    if id_field:
+                        shape_ids += batch[id_field].tolist()
+                    continue
+            # others (big endian, 3D points or null geometries)
+            points = [ogr.CreateGeometryFromWkb(bytes(wkb)) if wkb is not None else None for wkb in wkb_geoms]
+            if not all(points):
+                raise Exception("The sampling file {} has features without geometry".format(file_path))
+            xs.append(np.array([p.GetX() for p in points], dtype=np.float64))
+            ys.append(np.array([p.GetY() for p in points], dtype=np.float64))
+            if id_field:
+                shape_ids += batch[id_field].tolist()
+        xs = np.concatenate(xs) if xs else np.array([])
+        ys = np.concatenate(ys) if ys else np.array([])
+    else:
+        for ogr_feature in ogr_layer:
+            geom = ogr_feature.GetGeometryRef()
+            if geom is None:
+                raise Exception("The sampling file {} has features without geometry".format(file_path))
+            xs.append(geom.GetX())
+            ys.append(geom.GetY())
+            if id_field:
+                shape_ids.append(ogr_feature.GetField(id_field))
+        xs, ys = np.array(xs, dtype=np.float64), np.array(ys, dtype=np.float64)
+
+    del ogr_file
+    return (shape_ids if id_field else None), xs, ys
 
 # --------------------------------------------------------------------------
 
@@ -110,14 +237,144 @@ def get_pixel_count_by_pixel_values_parallel(layer, band, pixel_values=None):
 # --------------------------------------------------------------------------
 
 
+def pixel_crosstab_in_chunk(args):
+    img_path, band, nodata, strata_path, strata_band, strata_nodata, strata_alpha_band, xoff, yoff, xsize, ysize = args
+    gdal_file = gdal.Open(img_path, gdal.GA_ReadOnly)
+    chunk_narray = gdal_file.GetRasterBand(band).ReadAsArray(xoff, yoff, xsize, ysize).astype(np.int64).ravel()
+    strata_file = gdal.Open(strata_path, gdal.GA_ReadOnly)
+    strata_narray = strata_file.GetRasterBand(strata_band).ReadAsArray(xoff, yoff, xsize, ysize).astype(np.int64).ravel()
+
+    valid = np.ones(chunk_narray.shape, dtype=bool)
+    if strata_alpha_band is not None:
+        # outside of the strata raster
+        valid &= strata_file.GetRasterBand(strata_alpha_band).ReadAsArray(xoff, yoff, xsize, ysize).ravel() > 0
+    # the nodata set by the user and the nodata of the file, the same of the samples lookup
+    for narray, nodata_values in ((chunk_narray, (nodata, gdal_file.GetRasterBand(band).GetNoDataValue())),
+                                  (strata_narray, (strata_nodata,
+                                                   strata_file.GetRasterBand(strata_band).GetNoDataValue()))):
+        for nodata_value in nodata_values:
+            if nodata_value is not None:
+                valid &= narray != nodata_value
+    # encode each pair of (integer) values in one int64: high 32 bits the value, low 32 bits the stratum
+    pairs = (chunk_narray[valid] << 32) + (strata_narray[valid] & 0xFFFFFFFF)
+    pairs, counts = np.unique(pairs, return_counts=True)
+    values = pairs >> 32
+    strata = ((pairs & 0xFFFFFFFF) ^ 0x80000000) - 0x80000000
+    return dict(zip(zip(values.tolist(), strata.tolist()), counts.tolist()))
+
+
+crosstab_cache = {}
+
+
 @wait_process
-def get_pixel_count_by_pixel_values(layer, band, pixel_values=None):
+def get_pixel_count_crosstab_parallel(img_path, band, nodata, strata_path, strata_band, strata_nodata):
+    """Get the total pixel count for each pair of pixel values of two categorical rasters
+    (e.g. thematic classes and strata) reading both rasters in one pass by blocks in
+    parallel threads (the GDAL reads and numpy release the GIL). If the strata raster
+    has not the same grid of the image, it is warped (nearest neighbour) to the image
+    grid. The pixels in the nodata (set or of the file) of any raster are not counted.
+    The results are cached by the files and their modification time
+
+    Returns:
+        dict: {(pixel_value, stratum_value): count} only for the pixels valid in both rasters
+    """
+    key = (img_path, os.path.getmtime(img_path), band, nodata,
+           strata_path, os.path.getmtime(strata_path), strata_band, strata_nodata)
+    if key in crosstab_cache:
+        return crosstab_cache[key]
+
+    gdal_file = gdal.Open(img_path, gdal.GA_ReadOnly)
+    strata_file = gdal.Open(strata_path, gdal.GA_ReadOnly)
+    tmp_vrt_file = None
+    strata_alpha_band = None
+    if (gdal_file.RasterXSize, gdal_file.RasterYSize, gdal_file.GetGeoTransform()) != \
+            (strata_file.RasterXSize, strata_file.RasterYSize, strata_file.GetGeoTransform()):
+        x_origin, pixel_width, _, y_origin, _, pixel_height = gdal_file.GetGeoTransform()
+        tmp_vrt_fd, tmp_vrt_file = tempfile.mkstemp(prefix='strata_', suffix='.vrt')
+        os.close(tmp_vrt_fd)
+        gdal.Warp(tmp_vrt_file, strata_file, format="VRT", resampleAlg="near", dstSRS=gdal_file.GetProjection(),
+                  outputBounds=[x_origin, y_origin + pixel_height * gdal_file.RasterYSize,
+                                x_origin + pixel_width * gdal_file.RasterXSize, y_origin],
+                  width=gdal_file.RasterXSize, height=gdal_file.RasterYSize, dstAlpha=True)
+        strata_alpha_band = strata_file.RasterCount + 1
+        strata_path = tmp_vrt_file
+
+    # split the image in chunks, the 0,0 is left-upper corner
+    chunk_size = 1000
+    input_data = []
+    for y in chunks(range(gdal_file.RasterYSize), chunk_size):
+        for x in chunks(range(gdal_file.RasterXSize), chunk_size):
+            input_data.append((img_path, band, nodata, strata_path, strata_band, strata_nodata, strata_alpha_band,
+                               x[0], y[0], len(x), len(y)))
+    del gdal_file, strata_file
+
+    # compute and merge all parallel chunks in one result
+    crosstab = {}
+    try:
+        with ThreadPoolExecutor(max_workers=multiprocessing.cpu_count()) as executor:
+            for chunk_crosstab in executor.map(pixel_crosstab_in_chunk, input_data):
+                for pair, count in chunk_crosstab.items():
+                    crosstab[pair] = crosstab.get(pair, 0) + count
+    finally:
+        if tmp_vrt_file and os.path.isfile(tmp_vrt_file):
+            os.remove(tmp_vrt_file)
+
+    crosstab_cache[key] = crosstab
+    return crosstab
+
+# --------------------------------------------------------------------------
+
+
+@wait_process
+def get_pixel_count_by_pixel_values(layer, band, pixel_values=None, nodata=None):
+    """Get the total pixels of each pixel value in the band of the raster layer
+
+    Args:
+        layer (QgsRasterLayer): the raster layer
+        band (int): the band
+        pixel_values (list): the pixel values to count, default the classes of the style
+            of the layer, or all values in the data if the layer hasn't a style with classes
+        nodata (int): the nodata value, it is not counted
+
+    Returns:
+        dict: {pixel_value: count}
+    """
     if pixel_values is None:
-        pixel_values = get_pixel_values(layer, band)
+        pixel_values = get_pixel_values(layer, band) or None
+
+    return get_pixel_count_in_file(get_file_path_of_layer(layer), band, pixel_values, nodata)
 
-    raster_numpy = gdalnumeric.LoadFile(get_file_path_of_layer(layer))
-    pixel_counts = []
-    for pixel_value in pixel_values:
-        pixel_counts.append((raster_numpy == int(pixel_value)).sum())
 
-    return dict(zip(pixel_values, pixel_counts))
+def get_pixel_count_in_file(file_path, band, pixel_values=None, nodata=None, chunk_size=1000):
+    """Count the pixels by value in the band of the raster file, reading it by chunks
+    of rows (only a chunk in memory at a time)
+
+    Args:
+        file_path (str): the raster file
+        band (int): the band
+        pixel_values (list): the pixel values to count, None for all values in the data
+            (without the nodata of the file)
+        nodata (int): the nodata value, it is not counted
+        chunk_size (int): number of rows by chunk
+
+    Returns:
+        dict: {pixel_value: count}
+    """
+    gdal_file = gdal.Open(file_path, gdal.GA_ReadOnly)
+    gdal_band = gdal_file.GetRasterBand(band)
+    nodata_values = [value for value in (nodata, None if pixel_values else gdal_band.GetNoDataValue())
+                     if value is not None]
+    pixel_counts = {}
+    for y in chunks(range(gdal_file.RasterYSize), chunk_size):
+        chunk_narray = gdal_band.ReadAsArray(0, y[0], gdal_file.RasterXSize, len(y))
+        values, counts = np.unique(chunk_narray, return_counts=True)
+        for value, count in zip(values.tolist(), counts.tolist()):
+            pixel_counts[value] = pixel_counts.get(value, 0) + count
+    del gdal_file
+
+    for nodata_value in nodata_values:
+        pixel_counts.pop(nodata_value, None)
+    if pixel_values is None:
+        # the classes are the integer values in the data
+        return {int(value): count for value, count in sorted(pixel_counts.items()) if int(value) == value}
+    return {pixel_value: pixel_counts.get(int(pixel_value), 0) for pixel_value in pixel_values}
@@ -19,14 +19,20 @@
  ***************************************************************************/
 """
 import os
+import threading
+from collections import OrderedDict
+import numpy as np
 
 from qgis.PyQt.QtWidgets import QDialog, QDialogButtonBox
 from qgis.PyQt import uic
 from qgis.PyQt.QtCore import Qt
 from qgis.gui import QgsRendererPropertiesDialog, QgsRendererRasterPropertiesWidget
-from qgis.core import QgsProject, QgsRasterLayer, QgsVectorLayer, Qgis, QgsStyle, QgsMapLayer
+from qgis.core import QgsProject, QgsRasterLayer, QgsVectorLayer, Qgis, QgsStyle, QgsMapLayer, \
+    QgsCoordinateTransform, QgsCsException
 from qgis.utils import iface
 
+from AcATaMa.utils.system_utils import in_main_thread
+
 
 def get_file_path_of_layer(layer):
     if layer and layer.isValid():
@@ -107,6 +113,88 @@ def unload_layer(layer_path):
             QgsProject.instance().removeMapLayer(layer_loaded.id())
 
 
+# the coordinate transforms built by (source crs, destination crs), shared by all
+# the transformations of points and geometries between the same crs, bounded LRU
+coordinate_transforms = OrderedDict()
+coordinate_transforms_size = 32
+coordinate_transforms_lock = threading.Lock()
+
+
+def get_crs_key(crs):
+    return crs.authid() or crs.toWkt()
+
+
+def clear_coordinate_transforms():
+    with coordinate_transforms_lock:
+        coordinate_transforms.clear()
+
+
+def get_coordinate_transform(src_crs, dst_crs):
+    """Get the coordinate transform (with the transform context of the project) from the
+    source to the destination crs, it is built once and cached until the transform
+    context of the project changes. The signal of the project is connected in the main
+    thread, before that the transforms are not cached
+
+    Args:
+        src_crs (QgsCoordinateReferenceSystem): the source crs
+        dst_crs (QgsCoordinateReferenceSystem): the destination crs
+
+    Returns:
+        QgsCoordinateTransform: the coordinate transform
+    """
+    if not getattr(get_coordinate_transform, "context_connected", False):
+        if not in_main_thread():
+            return QgsCoordinateTransform(src_crs, dst_crs, QgsProject.instance())
+        QgsProject.instance().transformContextChanged.connect(clear_coordinate_transforms)
+        get_coordinate_transform.context_connected = True
+
+    key = (get_crs_key(src_crs), get_crs_key(dst_crs))
+    with coordinate_transforms_lock:
+        if key in coordinate_transforms:
+            coordinate_transforms.move_to_end(key)
+            return coordinate_transforms[key]
+    transform = QgsCoordinateTransform(src_crs, dst_crs, QgsProject.instance())
+    with coordinate_transforms_lock:
+        coordinate_transforms[key] = transform
+        while len(coordinate_transforms) > coordinate_transforms_size:
+            coordinate_transforms.popitem(last=False)
+    return transform
+
+
+def transform_coordinates(xs, ys, src_crs, dst_crs):
+    """Transform arrays of coordinates from the source to the destination crs with the
+    cached coordinate transform (with the transform context of the project), the same
+    transform used to transform the points one by one
+
+    Args:
+        xs (array): the x coordinates (longitude for geographic crs)
+        ys (array): the y coordinates (latitude for geographic crs)
+        src_crs (QgsCoordinateReferenceSystem): the source crs
+        dst_crs (QgsCoordinateReferenceSystem): the destination crs
+
+    Returns:
+        tuple: (xs, ys) numpy arrays of the coordinates transformed, inf for the
+               coordinates that can't be transformed
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    if not len(xs) or src_crs == dst_crs:
+        return xs, ys
+
+    # a copy (implicitly shared) for the thread that transforms
+    transform = QgsCoordinateTransform(get_coordinate_transform(src_crs, dst_crs))
+    xs_transformed = np.full(len(xs), np.inf)
+    ys_transformed = np.full(len(ys), np.inf)
+    for idx, (x, y) in enumerate(zip(xs.tolist(), ys.tolist())):
+        try:
+            point = transform.transform(x, y)
+        except QgsCsException:
+            continue
+        xs_transformed[idx] = point.x()
+        ys_transformed[idx] = point.y()
+    return xs_transformed, ys_transformed
+
+
 # plugin path
 plugin_folder = os.path.dirname(os.path.dirname(__file__))
 FORM_CLASS, _ = uic.loadUiType(os.path.join(
@@ -22,19 +22,27 @@ import functools
 import traceback
 import os, sys, subprocess
 
-from qgis.PyQt.QtCore import Qt
+from qgis.PyQt.QtCore import Qt, QThread
 from qgis.PyQt.QtWidgets import QApplication, QMessageBox, QPushButton
 from qgis.PyQt.QtGui import QCursor
 from qgis.core import Qgis
 from qgis.utils import iface
 
 
+def in_main_thread():
+    app = QApplication.instance()
+    return app is not None and QThread.currentThread() == app.thread()
+
+
 def error_handler(func):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
         try:
             return func(*args, **kwargs)
         except Exception as err:
+            # running without the QGIS interface (headless) or in a worker thread, let the caller handle it
+            if iface is None or not in_main_thread():
+                raise
             # restore mouse
             QApplication.restoreOverrideCursor()
             QApplication.processEvents()
@@ -80,6 +88,9 @@ def wait_process(func):
     @error_handler
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
+        # the cursor is only changed from the main thread
+        if not in_main_thread():
+            return func(*args, **kwargs)
         # mouse wait
         QApplication.setOverrideCursor(QCursor(Qt.WaitCursor))
         # do